@@ -0,0 +1,89 @@
+import hashlib
+import json
+import os
+import threading
+import time
+
+from iointel import Agent
+
+
+class AgentRegistry:
+    """Pre-built iointel agents loaded from a JSON config of names, models and prompts.
+
+    Handlers borrow agents with get() instead of constructing one per request.
+    The config file is re-checked at most every `reload_interval` seconds and the
+    agents are rebuilt when it changes, so prompts can be edited without a restart.
+    """
+
+    def __init__(self, path, api_key, base_url, reload_interval=5.0):
+        self.path = path
+        self.api_key = api_key
+        self.base_url = base_url
+        self.reload_interval = reload_interval
+        self.reloads = 0
+        self._agents = {}
+        self._configs = {}
+        self._versions = {}
+        self._mtime = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+        self.reload()
+
+    def reload(self):
+        with open(self.path, encoding="utf-8") as f:
+            config = json.load(f)
+        mtime = os.path.getmtime(self.path)
+
+        agents, configs, versions = {}, {}, {}
+        for key, agent_config in config["agents"].items():
+            instructions = agent_config["instructions"]
+            if isinstance(instructions, list):
+                instructions = "\n".join(instructions)
+            agents[key] = Agent(
+                name=agent_config["name"],
+                instructions=instructions,
+                model=agent_config["model"],
+                api_key=self.api_key,
+                base_url=self.base_url,
+            )
+            configs[key] = agent_config
+            # Part of the response cache key, so editing a prompt invalidates old responses
+            versions[key] = hashlib.sha256(
+                json.dumps(agent_config, sort_keys=True).encode("utf-8")
+            ).hexdigest()[:12]
+
+        # Swap everything at once so handlers never see a half-loaded registry
+        with self._lock:
+            self._agents, self._configs, self._versions = agents, configs, versions
+            self._mtime = mtime
+            self._checked_at = time.monotonic()
+            self.reloads += 1
+        print(f"Loaded {len(agents)} agents from {self.path}")
+
+    def get(self, key):
+        self._maybe_reload()
+        return self._agents[key]
+
+    def model(self, key):
+        self._maybe_reload()
+        return self._configs[key]["model"]
+
+    def version(self, key):
+        self._maybe_reload()
+        return self._versions[key]
+
+    def stats(self):
+        return {"agents": sorted(self._agents), "reloads": self.reloads, "path": self.path}
+
+    def _maybe_reload(self):
+        now = time.monotonic()
+        if now - self._checked_at < self.reload_interval:
+            return
+        self._checked_at = now
+        try:
+            if os.path.getmtime(self.path) == self._mtime:
+                return
+            self.reload()
+        except Exception as e:
+            # Keep serving the last good config if the file is mid-edit or invalid
+            print(f"Failed to reload agents from {self.path}: {str(e)}")
@@ -0,0 +1,66 @@
+"""Micro-benchmark for llm_output over a corpus of malformed model outputs.
+
+Run from the backend directory:
+
+    python benchmarks/bench_llm_output.py [iterations]
+
+For each sample it prints how many objects were recovered (vs. expected) and
+the mean parse time, next to the regex + json.loads cascade main.py used
+before llm_output existed.
+"""
+import json
+import os
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from llm_output import parse_flashcards, parse_mcqs  # noqa: E402
+
+CORPUS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "llm_output_corpus.json")
+
+
+def legacy_parse(output, kind):
+    # The previous approach: find the array with a greedy regex, patch the string, json.loads it
+    json_match = re.search(r'```(?:json)?\s*([\s\S]*?)\s*```', output)
+    json_str = json_match.group(1) if json_match else None
+    if json_str is None:
+        json_match = re.search(r'\[\s*\{.*\}\s*\]', output, re.DOTALL)
+        json_str = json_match.group(0) if json_match else output
+    json_str = json_str.replace('\n', ' ')
+    if kind == "flashcards":
+        json_str = json_str.replace('\\', '')
+    else:
+        json_str = json_str.replace('"isCorrect false', '"isCorrect": false').replace('"isCorrect true', '"isCorrect": true')
+        json_str = json_str.replace(',,', ',').replace(',]', ']').replace(',}', '}')
+    try:
+        parsed = json.loads(json_str)
+    except ValueError:
+        return []
+    return parsed if isinstance(parsed, list) else []
+
+
+def mean_seconds(fn, iterations):
+    started = time.perf_counter()
+    for _ in range(iterations):
+        result = fn()
+    return (time.perf_counter() - started) / iterations, result
+
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    with open(CORPUS_PATH, encoding="utf-8") as f:
+        corpus = json.load(f)
+
+    print(f"{'sample':38} {'expected':>8} {'found':>6} {'legacy':>7} {'parse us':>9} {'legacy us':>10}")
+    for sample in corpus:
+        parse = parse_flashcards if sample["kind"] == "flashcards" else parse_mcqs
+        seconds, items = mean_seconds(lambda: parse(sample["output"]), iterations)
+        legacy_seconds, legacy_items = mean_seconds(lambda: legacy_parse(sample["output"], sample["kind"]), iterations)
+        print(f"{sample['name']:38} {sample['expected']:>8} {len(items):>6} {len(legacy_items):>7} "
+              f"{seconds * 1e6:>9.1f} {legacy_seconds * 1e6:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""Load test for event loop lag while PDFs are being processed.
+
+Run from the backend directory:
+
+    python benchmarks/bench_loop_lag.py path/to/document.pdf [concurrent jobs]
+
+Each job does the blocking work a PDF request used to do inline: parse the PDF
+with PdfReader, extract the text of every page, draw and PNG-encode a page
+preview with Pillow and base64-encode it the way an OCR request does. The jobs
+run twice, first inline on the event loop (before) and then through
+TaskExecutors (after), while a LoopLagMonitor samples how late the loop gets
+to a timer - the delay any other request (a chat token, say) would see.
+PyPDF2 is pure Python, so pooled jobs still compete for the GIL; the lag that
+remains is bounded by the interpreter's switch interval instead of a whole job.
+"""
+import asyncio
+import base64
+import io
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from PyPDF2 import PdfReader  # noqa: E402
+
+from executors import LoopLagMonitor, TaskExecutors  # noqa: E402
+from page_renderer import PageRenderer  # noqa: E402
+
+
+def pdf_job(content, renderer):
+    reader = PdfReader(io.BytesIO(content))
+    texts = [page.extract_text() for page in reader.pages]
+    image = renderer.render_text_preview(texts[0], 1, "png", None)
+    return len(base64.b64encode(image)) + sum(len(text) for text in texts)
+
+
+async def run_load(content, jobs, executors):
+    renderer = PageRenderer()
+    monitor = LoopLagMonitor(interval=0.01)
+    monitor.start()
+    await asyncio.sleep(0.1)
+
+    async def job():
+        if executors is None:
+            return pdf_job(content, renderer)
+        return await executors.run("pdf", pdf_job, content, renderer)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(job() for _ in range(jobs)))
+    elapsed = time.perf_counter() - started
+
+    # Let the monitor record the timer that was held up by the last job
+    await asyncio.sleep(monitor.interval * 2)
+    await monitor.stop()
+    renderer.close()
+    stats = monitor.stats()
+    stats["elapsedS"] = round(elapsed, 2)
+    return stats
+
+
+def main():
+    if len(sys.argv) < 2:
+        print(__doc__)
+        sys.exit(1)
+    with open(sys.argv[1], "rb") as f:
+        content = f.read()
+    jobs = int(sys.argv[2]) if len(sys.argv) > 2 else 8
+
+    executors = TaskExecutors({"pdf": int(os.getenv("EXECUTOR_PDF_WORKERS", "4"))})
+    before = asyncio.run(run_load(content, jobs, None))
+    after = asyncio.run(run_load(content, jobs, executors))
+    executors.shutdown()
+
+    print(f"{jobs} concurrent jobs on {os.path.basename(sys.argv[1])} ({len(content)} bytes)")
+    print(f"{'':8} {'lag p50 ms':>11} {'lag p99 ms':>11} {'lag max ms':>11} {'elapsed s':>10}")
+    for name, stats in (("inline", before), ("pooled", after)):
+        print(f"{name:8} {stats['lagP50Ms']:>11} {stats['lagP99Ms']:>11} {stats['lagMaxMs']:>11} {stats['elapsedS']:>10}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+import math
+import re
+from collections import Counter
+
+from question_count import STOPWORDS
+from text_chunking import estimate_tokens, split_into_chunks
+
+_TERM = re.compile(r"[^\W_][\w'-]*", re.UNICODE)
+
+
+def query_terms(text):
+    return [term for term in (word.lower() for word in _TERM.findall(text)) if len(term) > 2 and term not in STOPWORDS]
+
+
+def format_message(msg, max_tokens=None):
+    role = "User" if msg.role == "user" else "Assistant"
+    content = clip_text(msg.content, max_tokens) if max_tokens else msg.content
+    return f"{role}: {content}"
+
+
+def format_messages(messages):
+    return "\n".join(format_message(msg) for msg in messages)
+
+
+def clip_text(text, max_tokens):
+    max_chars = max_tokens * 4
+    if len(text) <= max_chars:
+        return text
+    return text[:max_chars].rsplit(" ", 1)[0] + " [...]"
+
+
+class ChatContextBuilder:
+    """Keeps the chat prompt inside a fixed token budget however long the session gets.
+
+    The most recent messages are sent verbatim. Older ones are folded into a
+    rolling summary in whole blocks of fold_block messages. Summaries are cached
+    by the folded prefix of the history, so a turn starts from the newest cached
+    one and folds everything after it in a single summarize call: at most one
+    summarization call per turn, and none until another block is complete. A
+    context document larger than its budget is reduced to the passages that best
+    match the question.
+    """
+
+    def __init__(self, history_tokens=1500, recent_messages=6, fold_block=6, context_tokens=2000,
+                 passage_tokens=200):
+        self.history_tokens = history_tokens
+        self.recent_messages = recent_messages
+        self.fold_block = fold_block
+        self.context_tokens = context_tokens
+        self.passage_tokens = passage_tokens
+
+    async def build(self, message, history, context, summarize, find_summary, run_blocking=None):
+        """Return (history_summary, recent_history_text, context_text, stats).
+
+        summarize is an async callable (previous_summary, messages_text, folded_text) -> summary
+        that folds messages_text into previous_summary and caches the result as the summary of
+        folded_text, the whole folded prefix. find_summary is an async callable taking candidate
+        folded prefixes, longest first, that returns (index, summary) for the first one with a
+        cached summary, or None. run_blocking, if given, is an async callable (fn, *args) used
+        to score the context passages off the event loop.
+        """
+        history = list(history or [])
+        # Fold whole blocks only, so the folded prefix (and its cache key) only changes once per block
+        foldable = max(0, len(history) - self.recent_messages)
+        folded_count = foldable - foldable % self.fold_block
+        older, recent = history[:folded_count], history[folded_count:]
+
+        summary = ""
+        fold_calls = 0
+        if older:
+            # Newest cached summary first, then one call folds whatever came after it
+            ends = list(range(folded_count, 0, -self.fold_block))
+            found = await find_summary([format_messages(older[:end]) for end in ends])
+            done = 0
+            if found is not None:
+                done, summary = ends[found[0]], found[1]
+            if done < folded_count:
+                summary = await summarize(summary, format_messages(older[done:]), format_messages(older))
+                fold_calls = 1
+
+        # Whatever is left of the history budget is shared by the recent messages
+        budget = max(self.history_tokens - estimate_tokens(summary), self.history_tokens // 2)
+        recent_text = self._fit_recent(recent, budget)
+
+        context_text = ""
+        if context:
+            if run_blocking is not None:
+                context_text = await run_blocking(self.select_passages, context, message, recent)
+            else:
+                context_text = self.select_passages(context, message, recent)
+        stats = {
+            "messages": len(history),
+            "foldedMessages": folded_count,
+            "foldCalls": fold_calls,
+            "summaryTokens": estimate_tokens(summary),
+            "recentTokens": estimate_tokens(recent_text),
+            "contextTokens": estimate_tokens(context_text),
+        }
+        return summary, recent_text, context_text, stats
+
+    def select_passages(self, context, message, recent=()):
+        """Reduce a context document to the passages most relevant to the question."""
+        if estimate_tokens(context) <= self.context_tokens:
+            return context
+
+        passages = split_into_chunks(context, self.passage_tokens)
+        # The latest question counts double, the last user turn helps with follow-ups
+        terms = Counter(query_terms(message) * 2)
+        for msg in list(recent)[-2:]:
+            if msg.role == "user":
+                terms.update(query_terms(msg.content))
+
+        scored = []
+        for index, passage in enumerate(passages):
+            counts = Counter(query_terms(passage))
+            score = sum(weight * math.log1p(counts[term]) for term, weight in terms.items() if term in counts)
+            scored.append((score, index))
+        # Best passages first; with no overlap at all this keeps the start of the document
+        scored.sort(key=lambda item: (-item[0], item[1]))
+
+        selected = []
+        used = 0
+        for _, index in scored:
+            size = estimate_tokens(passages[index])
+            if used + size > self.context_tokens:
+                continue
+            selected.append(index)
+            used += size
+        return "\n[...]\n".join(passages[index] for index in sorted(selected))
+
+    def _fit_recent(self, recent, budget):
+        text = format_messages(recent)
+        if estimate_tokens(text) <= budget or not recent:
+            return text
+        # Clip long individual messages, the newest keeps the largest share
+        per_message = max(budget // (len(recent) + 1), 32)
+        return "\n".join(
+            format_message(msg, per_message * 2 if index == len(recent) - 1 else per_message)
+            for index, msg in enumerate(recent)
+        )
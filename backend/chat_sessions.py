@@ -0,0 +1,200 @@
+import json
+import os
+import secrets
+import sqlite3
+import threading
+import time
+from collections import OrderedDict, namedtuple
+
+SessionMessage = namedtuple("SessionMessage", ["role", "content"])
+
+
+class SessionNotFound(KeyError):
+    pass
+
+
+class ChatSession:
+    def __init__(self, session_id, context=None, document_id=None, messages=None, created_at=None,
+                 last_used=None):
+        self.id = session_id
+        self.context = context
+        self.document_id = document_id
+        self.messages = messages or []
+        self.created_at = created_at or time.time()
+        self.last_used = last_used or self.created_at
+        self.saved_last_used = self.last_used  # last_used as of the last write to disk
+
+    def to_dict(self):
+        return {
+            "sessionId": self.id,
+            "documentId": self.document_id,
+            "hasContext": bool(self.context),
+            "messages": [msg._asdict() for msg in self.messages],
+            "createdAt": self.created_at,
+            "lastUsed": self.last_used,
+        }
+
+
+class ChatSessionStore:
+    """Bounded in-memory store of chat sessions with idle-time expiry.
+
+    Sessions hold the conversation (and optionally the context text or the ID of
+    a stored document) so clients only send the new message each turn. At most
+    max_sessions are kept, least recently used first out, and each keeps its last
+    max_messages messages. With persist_path set, sessions are also written to a
+    local SQLite file and reloaded on demand after a restart. Reads only write the
+    new last-used time to disk once it is touch_interval seconds stale, and expired
+    sessions are deleted from disk at most every expire_interval seconds.
+    """
+
+    def __init__(self, max_sessions=1000, ttl_seconds=24 * 3600, max_messages=500, persist_path=None,
+                 touch_interval=60, expire_interval=60):
+        self.max_sessions = max_sessions
+        self.ttl_seconds = ttl_seconds
+        self.max_messages = max_messages
+        self.persist_path = persist_path
+        self.touch_interval = touch_interval
+        self.expire_interval = expire_interval
+        self.expired = 0
+        self._last_disk_expiry = 0.0
+        self._sessions = OrderedDict()  # session ID -> ChatSession
+        self._lock = threading.Lock()
+        self._conn = None
+
+        if persist_path:
+            directory = os.path.dirname(persist_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._conn = sqlite3.connect(persist_path, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute(
+                """CREATE TABLE IF NOT EXISTS chat_sessions (
+                    id TEXT PRIMARY KEY,
+                    context TEXT,
+                    document_id TEXT,
+                    messages TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    last_used REAL NOT NULL
+                )"""
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS chat_sessions_last_used ON chat_sessions (last_used)")
+            self._conn.commit()
+
+    def create(self, context=None, document_id=None):
+        session = ChatSession(secrets.token_urlsafe(16), context=context, document_id=document_id)
+        with self._lock:
+            self._remember(session)
+            self._persist(session)
+        return session
+
+    def get(self, session_id):
+        now = time.time()
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is None:
+                session = self._load(session_id)
+            if session is None or session.last_used + self.ttl_seconds <= now:
+                if session is not None:
+                    self._discard(session_id)
+                    self.expired += 1
+                raise SessionNotFound(session_id)
+            session.last_used = now
+            self._sessions.move_to_end(session_id)
+            if self._conn is not None and now - session.saved_last_used >= self.touch_interval:
+                self._conn.execute("UPDATE chat_sessions SET last_used = ? WHERE id = ?", (now, session_id))
+                self._conn.commit()
+                session.saved_last_used = now
+            return session
+
+    def append(self, session_id, *messages):
+        """Append (role, content) pairs to a session's history."""
+        with self._lock:
+            session = self._sessions.get(session_id) or self._load(session_id)
+            if session is None:
+                raise SessionNotFound(session_id)
+            session.messages.extend(SessionMessage(role, content) for role, content in messages)
+            if len(session.messages) > self.max_messages:
+                del session.messages[:len(session.messages) - self.max_messages]
+            session.last_used = time.time()
+            self._persist(session)
+
+    def delete(self, session_id):
+        with self._lock:
+            if session_id not in self._sessions and self._load(session_id) is None:
+                raise SessionNotFound(session_id)
+            self._discard(session_id)
+
+    def stats(self):
+        with self._lock:
+            self._expire(time.time())
+            return {
+                "sessions": len(self._sessions),
+                "maxSessions": self.max_sessions,
+                "expired": self.expired,
+                "persistent": self._conn is not None,
+            }
+
+    def _remember(self, session):
+        self._sessions[session.id] = session
+        self._sessions.move_to_end(session.id)
+        self._expire(time.time())
+        while len(self._sessions) > self.max_sessions:
+            # Evicted sessions stay on disk and are reloaded if used again
+            self._sessions.popitem(last=False)
+
+    def _expire(self, now):
+        # Oldest first, stop at the first session that is still live
+        while self._sessions:
+            session_id, session = next(iter(self._sessions.items()))
+            if session.last_used + self.ttl_seconds > now:
+                break
+            self._discard(session_id)
+            self.expired += 1
+        if self._conn is not None and now - self._last_disk_expiry >= self.expire_interval:
+            self._last_disk_expiry = now
+            # The stored last_used can lag by up to touch_interval, so only delete what is surely expired
+            self._conn.execute(
+                "DELETE FROM chat_sessions WHERE last_used <= ?", (now - self.ttl_seconds - self.touch_interval,)
+            )
+            self._conn.commit()
+
+    def _discard(self, session_id):
+        self._sessions.pop(session_id, None)
+        if self._conn is not None:
+            self._conn.execute("DELETE FROM chat_sessions WHERE id = ?", (session_id,))
+            self._conn.commit()
+
+    def _persist(self, session):
+        if self._conn is None:
+            return
+        self._conn.execute(
+            "INSERT OR REPLACE INTO chat_sessions (id, context, document_id, messages, created_at, last_used) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            (session.id, session.context, session.document_id,
+             json.dumps([list(msg) for msg in session.messages], ensure_ascii=False),
+             session.created_at, session.last_used),
+        )
+        self._conn.commit()
+        session.saved_last_used = session.last_used
+
+    def _load(self, session_id):
+        if self._conn is None:
+            return None
+        row = self._conn.execute(
+            "SELECT context, document_id, messages, created_at, last_used FROM chat_sessions WHERE id = ?",
+            (session_id,),
+        ).fetchone()
+        if row is None:
+            return None
+        context, document_id, messages, created_at, last_used = row
+        session = ChatSession(
+            session_id,
+            context=context,
+            document_id=document_id,
+            messages=[SessionMessage(*msg) for msg in json.loads(messages)],
+            created_at=created_at,
+            last_used=last_used,
+        )
+        self._remember(session)
+        return session
@@ -0,0 +1,189 @@
+import hashlib
+import io
+import os
+import re
+import threading
+from collections import OrderedDict
+
+from PyPDF2 import PdfReader
+
+# Document IDs are the hex SHA-256 of the uploaded bytes
+DOCUMENT_ID_PATTERN = re.compile(r"^[0-9a-f]{64}$")
+
+
+class DocumentNotFound(KeyError):
+    pass
+
+
+class StoredDocument:
+    """A parsed PDF held in memory, with the lock to hold while using its reader.
+
+    PdfReader is not thread-safe and handlers use it from worker threads, so
+    the lock lives and dies with the reader. The page count is read once here,
+    so callers never have to touch the reader just to check a page number.
+    """
+
+    def __init__(self, reader, size):
+        self.reader = reader
+        self.size = size
+        self.lock = threading.Lock()
+        # Also forces the page tree to load now rather than on first use
+        self.page_count = len(reader.pages)
+
+
+class DocumentStore:
+    """Content-addressed store for uploaded PDFs.
+
+    The raw bytes of every document are written once to a local directory, and
+    the parsed PdfReader objects are kept in a bounded in-memory LRU so repeated
+    calls for the same document skip both the upload and the xref parsing.
+    """
+
+    def __init__(self, directory, max_documents=16, max_memory_bytes=512 * 1024 * 1024,
+                 max_disk_bytes=4 * 1024 * 1024 * 1024):
+        self.directory = directory
+        self.max_documents = max_documents
+        self.max_memory_bytes = max_memory_bytes
+        self.max_disk_bytes = max_disk_bytes
+        self._documents = OrderedDict()  # document_id -> StoredDocument
+        self._memory_bytes = 0
+        self._lock = threading.RLock()
+        os.makedirs(self.directory, exist_ok=True)
+
+    @staticmethod
+    def document_id_for(content):
+        return hashlib.sha256(content).hexdigest()
+
+    def path(self, document_id):
+        if not DOCUMENT_ID_PATTERN.match(document_id or ""):
+            raise DocumentNotFound(document_id)
+        return os.path.join(self.directory, f"{document_id}.pdf")
+
+    def has(self, document_id):
+        try:
+            path = self.path(document_id)
+        except DocumentNotFound:
+            return False
+        with self._lock:
+            if document_id in self._documents:
+                return True
+        return os.path.exists(path)
+
+    def put(self, content):
+        """Store PDF bytes and return their document ID.
+
+        The document is parsed immediately so that invalid PDFs are rejected
+        before anything is written to disk.
+        """
+        document_id = self.document_id_for(content)
+
+        with self._lock:
+            if document_id in self._documents:
+                self._documents.move_to_end(document_id)
+                self._touch(document_id)
+                return document_id
+
+        document = StoredDocument(PdfReader(io.BytesIO(content)), len(content))
+
+        path = self.path(document_id)
+        if not os.path.exists(path):
+            tmp_path = f"{path}.{threading.get_ident()}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(content)
+            os.replace(tmp_path, path)
+            self._prune_disk(keep=document_id)
+        else:
+            self._touch(document_id)
+
+        self._remember(document_id, document)
+        return document_id
+
+    def get_bytes(self, document_id):
+        path = self.path(document_id)
+        try:
+            with open(path, "rb") as f:
+                return f.read()
+        except FileNotFoundError:
+            raise DocumentNotFound(document_id)
+
+    def get(self, document_id):
+        with self._lock:
+            document = self._documents.get(document_id)
+            if document is not None:
+                self._documents.move_to_end(document_id)
+                return document
+
+        # Not in memory any more, re-open it from the spill directory
+        content = self.get_bytes(document_id)
+        document = StoredDocument(PdfReader(io.BytesIO(content)), len(content))
+        self._touch(document_id)
+        return self._remember(document_id, document)
+
+    def page_count(self, document_id):
+        return self.get(document_id).page_count
+
+    def stats(self):
+        with self._lock:
+            return {
+                "documentsInMemory": len(self._documents),
+                "memoryBytes": self._memory_bytes,
+                "maxDocuments": self.max_documents,
+                "maxMemoryBytes": self.max_memory_bytes,
+            }
+
+    def _remember(self, document_id, document):
+        with self._lock:
+            if document_id in self._documents:
+                # Parsed twice concurrently: everyone shares the first copy and its lock
+                self._documents.move_to_end(document_id)
+                return self._documents[document_id]
+            self._documents[document_id] = document
+            self._memory_bytes += document.size
+
+            # Evict least recently used documents, but always keep the newest one.
+            # Requests still holding an evicted document keep using it and its lock.
+            while len(self._documents) > 1 and (
+                len(self._documents) > self.max_documents
+                or self._memory_bytes > self.max_memory_bytes
+            ):
+                _, evicted = self._documents.popitem(last=False)
+                self._memory_bytes -= evicted.size
+            return document
+
+    def _touch(self, document_id):
+        # Disk eviction is oldest-mtime first, so bump the mtime on use
+        try:
+            os.utime(self.path(document_id))
+        except OSError:
+            pass
+
+    def _prune_disk(self, keep):
+        if not self.max_disk_bytes:
+            return
+        entries = []
+        total = 0
+        for name in os.listdir(self.directory):
+            if not name.endswith(".pdf"):
+                continue
+            full_path = os.path.join(self.directory, name)
+            try:
+                stat = os.stat(full_path)
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, name[:-4], full_path))
+            total += stat.st_size
+
+        entries.sort()
+        for _, size, document_id, full_path in entries:
+            if total <= self.max_disk_bytes:
+                break
+            if document_id == keep:
+                continue
+            with self._lock:
+                if document_id in self._documents:
+                    continue
+            try:
+                os.remove(full_path)
+                total -= size
+            except OSError:
+                pass
@@ -0,0 +1,135 @@
+import asyncio
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+
+def _percentile(samples, quantile):
+    if not samples:
+        return 0.0
+    samples = sorted(samples)
+    return samples[min(int(len(samples) * quantile), len(samples) - 1)]
+
+
+class _Pool:
+    def __init__(self, name, workers, samples):
+        self.name = name
+        self.workers = workers
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix=f"{name}-worker")
+        self.submitted = 0
+        self.running = 0
+        self.completed = 0
+        self.cancelled = 0  # dropped from the queue before they started
+        self.errors = 0
+        self.busy_seconds = 0.0
+        self.queue_waits = deque(maxlen=samples)  # seconds between submit and start
+        self.lock = threading.Lock()
+
+    def stats(self):
+        with self.lock:
+            waits = list(self.queue_waits)
+            return {
+                "workers": self.workers,
+                "queued": self.submitted - self.running - self.completed - self.cancelled,
+                "running": self.running,
+                "completed": self.completed,
+                "cancelled": self.cancelled,
+                "errors": self.errors,
+                "avgRunMs": round(self.busy_seconds / self.completed * 1000, 1) if self.completed else 0.0,
+                "queueWaitP50Ms": round(_percentile(waits, 0.5) * 1000, 1),
+                "queueWaitP95Ms": round(_percentile(waits, 0.95) * 1000, 1),
+                "queueWaitMaxMs": round(max(waits, default=0.0) * 1000, 1),
+            }
+
+
+class TaskExecutors:
+    """Named, bounded thread pools for the blocking work done by request handlers.
+
+    Handlers call `await executors.run("pdf", fn, *args)` instead of calling fn
+    inline, so PDF parsing, image encoding and the like never run on the event
+    loop. Each kind of work gets its own pool, so a burst of one kind (say, a
+    200-page render) only queues behind itself. Queue wait and run time are
+    recorded per pool.
+    """
+
+    def __init__(self, workers, samples=500):
+        self._pools = {name: _Pool(name, count, samples) for name, count in workers.items()}
+
+    async def run(self, pool_name, fn, *args, **kwargs):
+        pool = self._pools[pool_name]
+        submitted = time.perf_counter()
+        with pool.lock:
+            pool.submitted += 1
+
+        def task():
+            started = time.perf_counter()
+            with pool.lock:
+                pool.running += 1
+                pool.queue_waits.append(started - submitted)
+            failed = False
+            try:
+                return fn(*args, **kwargs)
+            except BaseException:
+                failed = True
+                raise
+            finally:
+                with pool.lock:
+                    pool.running -= 1
+                    pool.completed += 1
+                    pool.errors += failed
+                    pool.busy_seconds += time.perf_counter() - started
+
+        def on_done(future):
+            # A waiter cancelled while its job was still queued cancels the job, so task() never runs
+            if future.cancelled():
+                with pool.lock:
+                    pool.cancelled += 1
+
+        future = pool.executor.submit(task)
+        future.add_done_callback(on_done)
+        return await asyncio.wrap_future(future)
+
+    def stats(self):
+        return {name: pool.stats() for name, pool in self._pools.items()}
+
+    def shutdown(self):
+        for pool in self._pools.values():
+            pool.executor.shutdown(wait=False, cancel_futures=True)
+
+
+class LoopLagMonitor:
+    """Measures event loop lag: how late a timer that should fire every interval actually fires."""
+
+    def __init__(self, interval=0.05, samples=1200):
+        self.interval = interval
+        self.lags = deque(maxlen=samples)
+        self._task = None
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        while True:
+            expected = time.perf_counter() + self.interval
+            await asyncio.sleep(self.interval)
+            self.lags.append(max(time.perf_counter() - expected, 0.0))
+
+    def stats(self):
+        lags = list(self.lags)
+        return {
+            "samples": len(lags),
+            "lagP50Ms": round(_percentile(lags, 0.5) * 1000, 1),
+            "lagP99Ms": round(_percentile(lags, 0.99) * 1000, 1),
+            "lagMaxMs": round(max(lags, default=0.0) * 1000, 1),
+        }
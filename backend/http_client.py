@@ -0,0 +1,92 @@
+import time
+from contextlib import asynccontextmanager
+
+import aiohttp
+
+
+class HttpClient:
+    """Application-lifetime aiohttp session with a tuned connection pool.
+
+    Created once in the FastAPI lifespan hook so requests to the model provider
+    reuse DNS lookups and keep-alive TLS connections instead of paying for a new
+    handshake every time.
+    """
+
+    def __init__(self, limit=100, limit_per_host=32, keepalive_timeout=60, dns_cache_ttl=300,
+                 timeout=120):
+        self.limit = limit
+        self.limit_per_host = limit_per_host
+        self.keepalive_timeout = keepalive_timeout
+        self.dns_cache_ttl = dns_cache_ttl
+        self.timeout = timeout
+        self._session = None
+        self.requests = 0
+        self.errors = 0
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.total_seconds = 0.0
+
+    async def start(self):
+        if self._session is not None:
+            return
+        connector = aiohttp.TCPConnector(
+            limit=self.limit,
+            limit_per_host=self.limit_per_host,
+            keepalive_timeout=self.keepalive_timeout,
+            ttl_dns_cache=self.dns_cache_ttl,
+            use_dns_cache=True,
+        )
+        self._session = aiohttp.ClientSession(
+            connector=connector,
+            timeout=aiohttp.ClientTimeout(total=self.timeout),
+        )
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    @property
+    def session(self):
+        if self._session is None:
+            raise RuntimeError("HTTP client has not been started")
+        return self._session
+
+    @asynccontextmanager
+    async def post(self, url, **kwargs):
+        """session.post() that also records pool and latency metrics."""
+        if self._session is None:
+            # Used outside the app lifespan (scripts, tests); start lazily
+            await self.start()
+        self.requests += 1
+        self.in_flight += 1
+        self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+        started = time.perf_counter()
+        try:
+            async with self._session.post(url, **kwargs) as response:
+                yield response
+        except Exception:
+            self.errors += 1
+            raise
+        finally:
+            self.in_flight -= 1
+            self.total_seconds += time.perf_counter() - started
+
+    def stats(self):
+        connector = self._session.connector if self._session is not None else None
+        # aiohttp doesn't expose pool usage publicly, so read it defensively
+        acquired = len(getattr(connector, "_acquired", ())) if connector else 0
+        idle = sum(len(conns) for conns in getattr(connector, "_conns", {}).values()) if connector else 0
+        return {
+            "started": self._session is not None,
+            "requests": self.requests,
+            "errors": self.errors,
+            "inFlight": self.in_flight,
+            "peakInFlight": self.peak_in_flight,
+            "avgLatencyMs": round(self.total_seconds / self.requests * 1000, 1) if self.requests else 0.0,
+            "activeConnections": acquired,
+            "idleConnections": idle,
+            "limit": self.limit,
+            "limitPerHost": self.limit_per_host,
+            "poolUtilization": round(acquired / self.limit_per_host, 3) if self.limit_per_host else 0.0,
+        }
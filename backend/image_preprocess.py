@@ -0,0 +1,85 @@
+import io
+
+from PIL import Image, ImageOps, ImageStat, UnidentifiedImageError
+
+# format name -> (Pillow format, media type)
+OUTPUT_FORMATS = {
+    "jpeg": ("JPEG", "image/jpeg"),
+    "webp": ("WEBP", "image/webp"),
+}
+
+# Mean HSV saturation (0-255) below which an image is treated as black and white
+GRAYSCALE_SATURATION_THRESHOLD = 24
+
+
+def looks_grayscale(image):
+    if image.mode in ("L", "LA", "1"):
+        return True
+    # A small thumbnail is plenty to estimate colourfulness
+    sample = image.convert("RGB").resize((64, 64))
+    saturation = ImageStat.Stat(sample.convert("HSV")).mean[1]
+    return saturation < GRAYSCALE_SATURATION_THRESHOLD
+
+
+def normalize_image(image, grayscale="auto"):
+    """Apply EXIF orientation, flatten transparency and pick RGB or grayscale."""
+    image = ImageOps.exif_transpose(image)
+
+    # Flatten transparency onto white, JPEG has no alpha channel
+    if image.mode in ("RGBA", "LA", "P"):
+        image = image.convert("RGBA")
+        background = Image.new("RGB", image.size, (255, 255, 255))
+        background.paste(image, mask=image.getchannel("A"))
+        image = background
+
+    if grayscale == "always" or (grayscale == "auto" and looks_grayscale(image)):
+        return image.convert("L")
+    if image.mode != "RGB":
+        return image.convert("RGB")
+    return image
+
+
+def encode_image(image, output_format="jpeg", quality=85):
+    """Return (bytes, media_type) for an image in one of OUTPUT_FORMATS."""
+    pil_format, media_type = OUTPUT_FORMATS[output_format]
+    output = io.BytesIO()
+    image.save(output, format=pil_format, quality=quality)
+    return output.getvalue(), media_type
+
+
+def prepare_image_for_ocr(content, content_type, max_edge=2048, output_format="jpeg", quality=85,
+                          grayscale="auto"):
+    """Auto-orient, optionally grayscale, downsize and recompress an image before OCR.
+
+    Returns (bytes, media_type, info). If the image can't be decoded, or the
+    result would be larger than what was uploaded, the original bytes are sent.
+    """
+    info = {"originalBytes": len(content), "sentBytes": len(content), "processed": False}
+    try:
+        image = Image.open(io.BytesIO(content))
+        image.load()
+    except (UnidentifiedImageError, OSError) as e:
+        info["error"] = str(e)
+        return content, content_type, info
+
+    original_size = image.size
+    # EXIF orientation tag, anything other than 1 means the pixels need rotating
+    needs_rotation = image.getexif().get(0x0112, 1) != 1
+    image = normalize_image(image, grayscale)
+
+    if max(image.size) > max_edge:
+        image.thumbnail((max_edge, max_edge), Image.LANCZOS)
+
+    processed, media_type = encode_image(image, output_format, quality)
+
+    info.update({
+        "originalSize": list(original_size),
+        "sentSize": list(image.size),
+        "mode": image.mode,
+    })
+    if len(processed) >= len(content) and image.size == original_size and not needs_rotation:
+        # Already small and nothing needed fixing, recompressing only cost us
+        return content, content_type, info
+
+    info.update({"sentBytes": len(processed), "processed": True})
+    return processed, media_type, info
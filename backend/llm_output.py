@@ -0,0 +1,254 @@
+import json
+import random
+import re
+
+# Common ways models break otherwise valid JSON, fixed per object before giving up on it
+_TRAILING_COMMA = re.compile(r",\s*([\]}])")
+_DOUBLE_COMMA = re.compile(r",\s*,")
+_MISSING_COLON = re.compile(r'"(isCorrect|question|answer|text|explanation)"\s+(?=["\[{tf])')
+_UNQUOTED_BOOL = re.compile(r'"isCorrect"\s*:\s*(True|False)\b')
+_BROKEN_IS_CORRECT = re.compile(r'"isCorrect\s+(true|false)\b')
+_STRUCTURAL = re.compile(r'[{}"]')
+_STRING_SPECIAL = re.compile(r'["\\]')
+# A whole string literal, a brace, or the quote opening a string that never ends
+_OBJECT_TOKEN = re.compile(r'"[^"\\]*(?:\\.[^"\\]*)*"|[{}"]', re.S)
+_DECODER = json.JSONDecoder(strict=False)
+_CARD_LINE = re.compile(r'^\W*(question|answer)\W*:\s*"?(.*?)"?,?\s*$', re.IGNORECASE)
+
+
+class JsonObjectScanner:
+    """Pulls top-level JSON objects out of model output in a single pass.
+
+    Text can be fed in pieces (e.g. streamed tokens); feed() returns the source
+    of every object completed so far. Anything outside an object - code fences,
+    the enclosing array, commentary - is skipped, and an unfinished object at
+    the end of the output is simply never returned.
+    """
+
+    def __init__(self):
+        self._depth = 0
+        self._in_string = False
+        self._escaped = False
+        self._current = []
+
+    def feed(self, text, max_objects=None):
+        objects = []
+        start = 0 if self._depth else None
+        position = self._skip_escaped(text)
+        # Jump straight between the only characters that matter instead of walking every one
+        while True:
+            match = (_STRING_SPECIAL if self._in_string else _STRUCTURAL).search(text, position)
+            if match is None:
+                break
+            char = match.group()
+            position = match.end()
+            if self._in_string:
+                if char == "\\":
+                    # Skip the escaped character, which may be in the next piece
+                    self._escaped = position >= len(text)
+                    position += 1
+                else:
+                    self._in_string = False
+            elif char == '"':
+                # Quotes outside an object (commentary) don't matter
+                self._in_string = self._depth > 0
+            elif char == "{":
+                if self._depth == 0:
+                    start = match.start()
+                self._depth += 1
+            elif self._depth:
+                self._depth -= 1
+                if self._depth == 0:
+                    self._current.append(text[start:position])
+                    objects.append("".join(self._current))
+                    self._current = []
+                    start = None
+                    if len(objects) == max_objects:
+                        break
+        if self._depth and start is not None:
+            self._current.append(text[start:])
+        return objects
+
+    def _skip_escaped(self, text):
+        # An escape at the very end of the previous piece swallows this piece's first character
+        if self._escaped and text:
+            self._escaped = False
+            return 1
+        return 0
+
+
+def load_object(source):
+    """json.loads for one object, with a repair pass for the usual model mistakes."""
+    try:
+        value = _DECODER.decode(source)
+    except ValueError:
+        return repair_object(source)
+    return value if isinstance(value, dict) else None
+
+
+def repair_object(source):
+    """Decode an object that is known not to be valid JSON, or None if it can't be fixed."""
+    # Each fix only runs when its mistake can be present; the regexes dominate the cost here
+    repaired = source
+    if "True" in repaired or "False" in repaired:
+        repaired = _UNQUOTED_BOOL.sub(_lower_bool, repaired)
+    if '"isCorrect ' in repaired:
+        repaired = _BROKEN_IS_CORRECT.sub(r'"isCorrect": \1', repaired)
+    repaired = _MISSING_COLON.sub(r'"\1": ', repaired)
+    repaired = _TRAILING_COMMA.sub(r"\1", _DOUBLE_COMMA.sub(",", repaired))
+    try:
+        value = _DECODER.decode(repaired)
+    except ValueError:
+        return None
+    return value if isinstance(value, dict) else None
+
+
+def _lower_bool(match):
+    return f'"isCorrect": {match.group(1).lower()}'
+
+
+def normalize_flashcard(card):
+    question = card.get("question") or card.get("front")
+    answer = card.get("answer") or card.get("back")
+    if not isinstance(question, str) or not question.strip():
+        return None
+    if not isinstance(answer, str) or not answer.strip():
+        answer = "See summary for details"
+    return {"question": question.strip(), "answer": answer.strip()}
+
+
+def normalize_mcq(mcq):
+    question = mcq.get("question")
+    options = mcq.get("options")
+    if not isinstance(question, str) or not isinstance(options, list) or not options:
+        return None
+
+    options = [
+        {"text": str(opt.get("text", "")).strip(), "isCorrect": opt.get("isCorrect") is True}
+        if isinstance(opt, dict) else {"text": str(opt).strip(), "isCorrect": False}
+        for opt in options
+    ]
+    # Exactly one correct answer; pick at random (not always the first) when the model got it wrong
+    correct = [index for index, opt in enumerate(options) if opt["isCorrect"]]
+    if len(correct) != 1:
+        keep = random.choice(correct) if correct else random.randrange(len(options))
+        for index, opt in enumerate(options):
+            opt["isCorrect"] = index == keep
+
+    explanation = mcq.get("explanation")
+    return {
+        "question": question.strip(),
+        "options": options,
+        "explanation": explanation.strip() if isinstance(explanation, str) else "",
+    }
+
+
+def item_key(item):
+    """Identity of a normalized flashcard or MCQ, for spotting the same item twice.
+
+    Everything counts except which option is correct, as normalize_mcq picks that
+    at random when the model marked none or several.
+    """
+    options = [opt["text"] for opt in item.get("options", ())]
+    return json.dumps([item["question"], item.get("answer"), options, item.get("explanation")], ensure_ascii=False)
+
+
+def iter_objects(text):
+    """Yield every top-level JSON object in text, repairing the ones that need it."""
+    position = 0
+    while True:
+        start = text.find("{", position)
+        if start == -1:
+            return
+        try:
+            # Well-formed objects are decoded at C speed
+            value, position = _DECODER.raw_decode(text, start)
+        except ValueError:
+            # Find where this object ends, then try to repair it
+            end = _object_end(text, start)
+            # raw_decode already failed on this object, go straight to the repairs
+            value = repair_object(text[start:end]) if end is not None else None
+            if value is None:
+                # A stray quote can hide the real end, so resume at the next brace; the objects after it may be fine
+                position = start + 1
+                continue
+            position = end
+        if isinstance(value, dict):
+            yield value
+
+
+def _object_end(text, start):
+    # Same job as JsonObjectScanner, but whole strings are matched by one regex step
+    depth = 0
+    for match in _OBJECT_TOKEN.finditer(text, start):
+        token = match.group()
+        if token == "{":
+            depth += 1
+        elif token == "}":
+            depth -= 1
+            if depth == 0:
+                return match.end()
+        elif token == '"':
+            return None
+    return None
+
+
+def iter_normalized(value, normalize):
+    """Yield the items in one decoded value, looking inside wrappers like {"flashcards": [...]}."""
+    if isinstance(value, list):
+        for entry in value:
+            yield from iter_normalized(entry, normalize)
+        return
+    if not isinstance(value, dict):
+        return
+    item = normalize(value)
+    if item is not None:
+        yield item
+        return
+    # Not an item itself: {"flashcards": [...]}, {"questions": [...]}, {"data": {"mcqs": [...]}}
+    for child in value.values():
+        if isinstance(child, (list, dict)):
+            yield from iter_normalized(child, normalize)
+
+
+def iter_parsed(text, normalize):
+    for value in iter_objects(text):
+        yield from iter_normalized(value, normalize)
+
+
+def parse_flashcards(output):
+    """Return the flashcards found in model output (a string or an already parsed list)."""
+    if isinstance(output, (list, dict)):
+        return list(iter_normalized(output, normalize_flashcard))
+    output = str(output)
+    cards = list(iter_parsed(output, normalize_flashcard))
+    return cards or _scan_card_lines(output)
+
+
+def parse_mcqs(output):
+    """Return the MCQs found in model output (a string or an already parsed list)."""
+    if isinstance(output, (list, dict)):
+        return list(iter_normalized(output, normalize_mcq))
+    return list(iter_parsed(str(output), normalize_mcq))
+
+
+def _scan_card_lines(output):
+    # Last resort for plain "Question: ... / Answer: ..." text
+    cards = []
+    current = {}
+    for line in output.splitlines():
+        match = _CARD_LINE.match(line.strip())
+        if not match or not match.group(2):
+            continue
+        field = match.group(1).lower()
+        if field == "question":
+            if current:
+                cards.append(normalize_flashcard(current))
+            current = {"question": match.group(2)}
+        elif current:
+            current["answer"] = match.group(2)
+            cards.append(normalize_flashcard(current))
+            current = {}
+    if current:
+        cards.append(normalize_flashcard(current))
+    return [card for card in cards if card]
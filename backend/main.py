@@ -1,23 +1,56 @@
-from fastapi import FastAPI, UploadFile, File, Form, HTTPException
+from fastapi import FastAPI, UploadFile, File, Form, HTTPException, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import Response
+from fastapi.responses import Response, StreamingResponse
 from pydantic import BaseModel
 from typing import Optional, List
+from contextlib import aclosing, asynccontextmanager
 import os
 import base64
 from dotenv import load_dotenv
 import asyncio
-from iointel import Agent, Workflow
+from iointel import Workflow
 import json
-import aiohttp
 import io
-from PIL import Image, ImageDraw, ImageFont
-from PyPDF2 import PdfReader
+import hashlib
+import zipfile
+import time
+from collections import Counter
+from document_store import DocumentStore, DocumentNotFound
+from page_text_cache import PageTextCache
+from pdf_extraction import PageExtractor
+from http_client import HttpClient
+from image_preprocess import prepare_image_for_ocr, OUTPUT_FORMATS
+from ocr_tiling import make_tiles, stitch_texts
+from response_cache import ResponseCache
+from singleflight import SingleFlight
+from agent_registry import AgentRegistry
+from question_count import estimate_question_count
+from llm_output import JsonObjectScanner, item_key, iter_normalized, load_object, normalize_flashcard, normalize_mcq, parse_flashcards, parse_mcqs
+from text_chunking import estimate_tokens, split_into_chunks, split_paragraphs
+from stream_cleanup import StreamCleaner, unwrap_json_response
+from chat_context import ChatContextBuilder
+from chat_sessions import ChatSessionStore, SessionNotFound
+from retrieval_index import RetrievalIndex
+from model_scheduler import ModelScheduler, PRIORITY_BATCH, PRIORITY_CHAT, PRIORITY_OCR, parse_model_limits
+from resilience import ResilientCaller, UpstreamError, parse_retry_after
+from executors import TaskExecutors, LoopLagMonitor
+from page_renderer import PageRenderer, IMAGE_FORMATS, MIN_DPI, MAX_DPI, MIN_WIDTH, MAX_WIDTH
 
 # Load environment variables
 load_dotenv()
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await http_client.start()
+    loop_monitor.start()
+    yield
+    await loop_monitor.stop()
+    await http_client.close()
+    pdf_extractor.shutdown()
+    page_renderer.close()
+    executors.shutdown()
+
+app = FastAPI(lifespan=lifespan)
 
 # Add CORS middleware to allow requests from your Next.js frontend
 app.add_middleware(
@@ -33,13 +66,180 @@ api_key = os.getenv("IO_API_KEY")
 if not api_key:
     raise ValueError("IO_API_KEY environment variable is not set")
 
+IO_API_BASE_URL = os.getenv("IO_API_BASE_URL", "https://api.intelligence.io.solutions/api/v1")
+
+# Agents are built once at startup from agents.json and hot-reloaded when the file changes
+agent_registry = AgentRegistry(
+    os.getenv("AGENTS_CONFIG_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "agents.json")),
+    api_key=api_key,
+    base_url=IO_API_BASE_URL,
+    reload_interval=float(os.getenv("AGENTS_RELOAD_INTERVAL_SECONDS", "5")),
+)
+
+# Uploaded PDFs are stored once and referenced by document ID afterwards
+document_store = DocumentStore(
+    os.getenv("DOCUMENT_STORE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "document_store")),
+    max_documents=int(os.getenv("DOCUMENT_STORE_MAX_DOCUMENTS", "16")),
+    max_memory_bytes=int(os.getenv("DOCUMENT_STORE_MAX_MEMORY_MB", "512")) * 1024 * 1024,
+    max_disk_bytes=int(os.getenv("DOCUMENT_STORE_MAX_DISK_MB", "4096")) * 1024 * 1024,
+)
+
+# Extracted page text is cached per (document ID, page) across requests and restarts
+page_text_cache = PageTextCache(
+    os.getenv("PAGE_TEXT_CACHE_PATH", os.path.join(document_store.directory, "page_text.sqlite3")),
+    max_bytes=int(os.getenv("PAGE_TEXT_CACHE_MAX_MB", "256")) * 1024 * 1024,
+)
+
+# Blocking work never runs on the event loop: each kind gets its own bounded thread pool
+executors = TaskExecutors({
+    "pdf": int(os.getenv("EXECUTOR_PDF_WORKERS", "4")),  # PdfReader parsing and text extraction
+    "image": int(os.getenv("EXECUTOR_IMAGE_WORKERS", "4")),  # rendering, OCR preprocessing, encoding
+    "text": int(os.getenv("EXECUTOR_TEXT_WORKERS", "4")),  # parsing model output, retrieval indexes, cache keys
+    "io": int(os.getenv("EXECUTOR_IO_WORKERS", "8")),  # SQLite caches and session store
+})
+loop_monitor = LoopLagMonitor()
+
+# Multi-page extraction runs on a process pool; set PDF_EXTRACT_WORKERS=0 to use a thread instead
+pdf_extractor = PageExtractor(
+    workers=int(os.getenv("PDF_EXTRACT_WORKERS", str(os.cpu_count() or 1))),
+    chunk_size=int(os.getenv("PDF_EXTRACT_CHUNK_SIZE", "16")),
+)
+
+# Rendered page images are cached by (document ID, page, DPI, width, format)
+page_renderer = PageRenderer(max_cache_bytes=int(os.getenv("RENDER_CACHE_MAX_MB", "128")) * 1024 * 1024)
+MAX_BATCH_PAGES = int(os.getenv("RENDER_MAX_BATCH_PAGES", "100"))
+
+# One pooled HTTP session for direct calls to the IO Intelligence API, opened in the lifespan hook
+http_client = HttpClient(
+    limit=int(os.getenv("HTTP_POOL_LIMIT", "100")),
+    limit_per_host=int(os.getenv("HTTP_POOL_LIMIT_PER_HOST", "32")),
+    keepalive_timeout=int(os.getenv("HTTP_KEEPALIVE_SECONDS", "60")),
+    dns_cache_ttl=int(os.getenv("HTTP_DNS_CACHE_SECONDS", "300")),
+)
+
+# Images are downscaled and recompressed before they're sent to the vision model
+OCR_MAX_EDGE = int(os.getenv("OCR_MAX_EDGE", "2048"))
+OCR_IMAGE_FORMAT = os.getenv("OCR_IMAGE_FORMAT", "jpeg")
+OCR_IMAGE_QUALITY = int(os.getenv("OCR_IMAGE_QUALITY", "85"))
+OCR_GRAYSCALE = os.getenv("OCR_GRAYSCALE", "auto")  # auto, always or never
+if OCR_IMAGE_FORMAT not in OUTPUT_FORMATS:
+    raise ValueError(f"OCR_IMAGE_FORMAT must be one of: {', '.join(OUTPUT_FORMATS)}")
+
+# Tiled OCR splits large or dense scans into overlapping strips sent concurrently
+OCR_TILE_HEIGHT = int(os.getenv("OCR_TILE_HEIGHT", "1024"))
+OCR_TILE_OVERLAP = int(os.getenv("OCR_TILE_OVERLAP", "128"))
+OCR_TILE_MAX_EDGE = int(os.getenv("OCR_TILE_MAX_EDGE", "4096"))
+OCR_TILE_CONCURRENCY = int(os.getenv("OCR_TILE_CONCURRENCY", "4"))
+if not OCR_TILE_HEIGHT > OCR_TILE_OVERLAP >= 0:
+    raise ValueError("OCR_TILE_HEIGHT must be greater than OCR_TILE_OVERLAP, and OCR_TILE_OVERLAP can't be negative")
+
+VISION_MODEL = "meta-llama/Llama-3.2-90B-Vision-Instruct"
+OCR_PROMPT = "Extract all text visible in this image. Return only the raw extracted text without any headers, commentary, or formatting. Do not add 'Extracted Text:' or any other labels."
+OCR_TILE_PROMPT = OCR_PROMPT + " This image is one strip of a larger page and may start or end in the middle of a line; transcribe only what is visible."
+
+# Responses of the text generation endpoints are cached by their normalized input.
+# Set LLM_CACHE_DISK_PATH to an empty string to keep the cache in memory only
+response_cache = ResponseCache(
+    max_entries=int(os.getenv("LLM_CACHE_MAX_ENTRIES", "1024")),
+    ttl_seconds=int(os.getenv("LLM_CACHE_TTL_SECONDS", str(7 * 24 * 3600))),
+    disk_path=os.getenv("LLM_CACHE_DISK_PATH", os.path.join(document_store.directory, "llm_cache.sqlite3")) or None,
+    disk_max_entries=int(os.getenv("LLM_CACHE_DISK_MAX_ENTRIES", "50000")),
+)
+
+# Concurrent requests for the same cache key share one upstream call
+llm_single_flight = SingleFlight()
+
+# Every upstream model call waits for a slot here: per-model concurrency caps, optional
+# request/token rate limits and priority classes (chat before OCR before batch generation).
+# LLM_MODEL_CONCURRENCY overrides the cap per model, e.g. "model-a=4,model-b=2"
+model_scheduler = ModelScheduler(
+    default_concurrency=int(os.getenv("LLM_MAX_CONCURRENCY", "8")),
+    model_concurrency=parse_model_limits(os.getenv("LLM_MODEL_CONCURRENCY", "")),
+    requests_per_minute=int(os.getenv("LLM_REQUESTS_PER_MINUTE", "0")),
+    tokens_per_minute=int(os.getenv("LLM_TOKENS_PER_MINUTE", "0")),
+)
+
+# Deadlines (covering retries, counted from when the call gets its scheduler slot), retry with
+# backoff on 429/5xx and optional hedging per endpoint. Streams also have to send their first
+# chunk within UPSTREAM_FIRST_CHUNK_SECONDS, and are only retried until they have.
+# UPSTREAM_HEDGE_ENDPOINTS lists the endpoints that may send a second request, e.g. "chat,ocr"
+upstream = ResilientCaller(
+    deadlines={
+        "ocr": float(os.getenv("OCR_DEADLINE_SECONDS", "60")),
+        "chat": float(os.getenv("CHAT_DEADLINE_SECONDS", "60")),
+        "summarize": float(os.getenv("SUMMARIZE_DEADLINE_SECONDS", "90")),
+        "flashcards": float(os.getenv("FLASHCARDS_DEADLINE_SECONDS", "120")),
+        "mcqs": float(os.getenv("MCQS_DEADLINE_SECONDS", "120")),
+        "translate": float(os.getenv("TRANSLATE_DEADLINE_SECONDS", "90")),
+    },
+    max_attempts=int(os.getenv("UPSTREAM_MAX_ATTEMPTS", "3")),
+    base_delay=float(os.getenv("UPSTREAM_RETRY_BASE_SECONDS", "0.5")),
+    hedge_endpoints=[name.strip() for name in os.getenv("UPSTREAM_HEDGE_ENDPOINTS", "").split(",") if name.strip()],
+    first_chunk_timeout=float(os.getenv("UPSTREAM_FIRST_CHUNK_SECONDS", "30")),
+)
+
+# Each part of /api/study-pack gets this long before it is reported as timed out
+STUDY_PACK_PART_TIMEOUT = float(os.getenv("STUDY_PACK_PART_TIMEOUT_SECONDS", "90"))
+STUDY_PACK_PARTS = ("summary", "flashcards", "mcqs")
+
+# Texts longer than one chunk are summarized map-reduce style, see summarize_hierarchically()
+SUMMARY_CHUNK_TOKENS = int(os.getenv("SUMMARY_CHUNK_TOKENS", "3000"))
+SUMMARY_MAP_CONCURRENCY = int(os.getenv("SUMMARY_MAP_CONCURRENCY", "4"))
+SUMMARY_CHUNK_WORDS = 150
+
+# Token budgets for the chat prompt, see ChatContextBuilder
+chat_context = ChatContextBuilder(
+    history_tokens=int(os.getenv("CHAT_HISTORY_TOKENS", "1500")),
+    recent_messages=int(os.getenv("CHAT_RECENT_MESSAGES", "6")),
+    fold_block=int(os.getenv("CHAT_SUMMARY_BLOCK", "6")),
+    context_tokens=int(os.getenv("CHAT_CONTEXT_TOKENS", "2000")),
+)
+CHAT_SUMMARY_WORDS = 150
+
+# Long texts are translated in paragraph batches, see generate_translation()
+TRANSLATE_CHUNK_TOKENS = int(os.getenv("TRANSLATE_CHUNK_TOKENS", "800"))
+TRANSLATE_CONCURRENCY = int(os.getenv("TRANSLATE_CONCURRENCY", "4"))
+
+# Per-document BM25 indexes that chat uses to pick relevant passages
+retrieval_index = RetrievalIndex(
+    max_documents=int(os.getenv("RETRIEVAL_MAX_DOCUMENTS", "32")),
+    passage_tokens=int(os.getenv("RETRIEVAL_PASSAGE_TOKENS", "200")),
+)
+CHAT_RETRIEVAL_TOP_K = int(os.getenv("CHAT_RETRIEVAL_TOP_K", "6"))
+
+# Server-side chat sessions; set CHAT_SESSIONS_PATH to keep them across restarts
+chat_sessions = ChatSessionStore(
+    max_sessions=int(os.getenv("CHAT_SESSIONS_MAX", "1000")),
+    ttl_seconds=int(os.getenv("CHAT_SESSION_TTL_SECONDS", str(24 * 3600))),
+    max_messages=int(os.getenv("CHAT_SESSION_MAX_MESSAGES", "500")),
+    persist_path=os.getenv("CHAT_SESSIONS_PATH") or None,
+)
+
+# Bump an endpoint's version whenever its prompt template changes so old cached responses
+# aren't served. Agent instruction and model changes in agents.json are picked up automatically
+PROMPT_VERSIONS = {
+    "summarize": "2",
+    "flashcards": "1",
+    "mcqs": "1",
+    "translate": "2",
+}
+
 # Models for request/response
 class TextRequest(BaseModel):
     text: str
+    bypassCache: bool = False
+
+class MCQRequest(TextRequest):
+    # "local" estimates the question count from the text, "model" asks the LLM first (slower)
+    countMode: str = "local"
+
+class StudyPackRequest(MCQRequest):
+    parts: List[str] = list(STUDY_PACK_PARTS)
 
 class TranslationRequest(BaseModel):
     text: str
     targetLanguage: str
+    bypassCache: bool = False
 
 class ChatMessage(BaseModel):
     role: str  # "user" or "assistant"
@@ -49,25 +249,109 @@ class ChatRequest(BaseModel):
     message: str
     context: Optional[str] = None
     chatHistory: Optional[List[ChatMessage]] = None
+    # With a session, history and context are kept on the server and only the message is sent
+    sessionId: Optional[str] = None
+    # Ground the answer in a stored document's most relevant passages
+    documentId: Optional[str] = None
 
-@app.post("/api/pdf-page-count")
-async def pdf_page_count(file: UploadFile = File(...)):
+class ChatSessionRequest(BaseModel):
+    context: Optional[str] = None
+    documentId: Optional[str] = None
+    # Seed the session, e.g. when a client recreates an expired one
+    chatHistory: Optional[List[ChatMessage]] = None
+
+async def load_pdf(file: Optional[UploadFile], document_id: Optional[str]):
+    """Resolve a PDF from a stored document ID, or store an uploaded file first.
+
+    Returns a (document_id, StoredDocument) tuple.
+    """
+    if document_id:
+        try:
+            return document_id, await executors.run("pdf", document_store.get, document_id)
+        except DocumentNotFound:
+            raise HTTPException(status_code=404, detail=f"Document {document_id} not found. Please upload it again")
+
+    if file is None:
+        raise HTTPException(status_code=400, detail="Either a file or a documentId is required")
+
+    content = await file.read()
+    document_id = await executors.run("pdf", document_store.put, content)
+    return document_id, await executors.run("pdf", document_store.get, document_id)
+
+def get_page_text(document_id: str, pdf, page: int):
+    # Pages are 1-based, matching the "--- Page N ---" markers
+    text = page_text_cache.get(document_id, page)
+    if text is None:
+        with pdf.lock:
+            text = pdf.reader.pages[page - 1].extract_text()
+        page_text_cache.put(document_id, page, text)
+    return text
+
+def get_pages_text(document_id: str, pdf, pages):
+    texts = page_text_cache.get_many(document_id, pages)
+    with pdf.lock:
+        missing = {page: pdf.reader.pages[page - 1].extract_text() for page in pages if page not in texts}
+    page_text_cache.put_many(document_id, missing)
+    texts.update(missing)
+    return [texts[page] for page in pages]
+
+async def extract_all_pages_text(document_id: str, page_count: int):
+    return await extract_pages_text(document_id, range(1, page_count + 1))
+
+async def extract_pages_text(document_id: str, pages):
+    texts = await executors.run("io", page_text_cache.get_many, document_id, pages)
+    
+    # Only pages that aren't cached yet go to the extraction workers
+    missing = [page for page in pages if page not in texts]
+    if missing:
+        extracted = await pdf_extractor.extract(document_store.path(document_id), missing)
+        await executors.run("io", page_text_cache.put_many, document_id, extracted)
+        texts.update(extracted)
+    
+    return [texts[page] for page in pages]
+
+@app.post("/api/documents")
+async def upload_document(file: UploadFile = File(...)):
     try:
         # Read file content
         content = await file.read()
-        print(f"Received PDF file for page count: {file.filename}, size: {len(content)} bytes")
+        print(f"Received PDF document: {file.filename}, size: {len(content)} bytes")
         
-        # Create a BytesIO object from the content
-        pdf_bytes = io.BytesIO(content)
+        # Store the PDF once, later calls only need to send the document ID
+        document_id = await executors.run("pdf", document_store.put, content)
+        page_count = await executors.run("pdf", document_store.page_count, document_id)
         
-        # Use PyPDF2 to get page count
-        pdf = PdfReader(pdf_bytes)
-        page_count = len(pdf.pages)
+        print(f"Stored PDF as {document_id} ({page_count} pages)")
+        
+        return {"documentId": document_id, "pageCount": page_count, "size": len(content)}
+            
+    except Exception as e:
+        print(f"Error storing PDF document: {str(e)}")
+        import traceback
+        traceback.print_exc()
+        raise HTTPException(status_code=500, detail=f"Failed to store PDF document: {str(e)}")
+
+@app.get("/api/documents/{document_id}")
+async def get_document(document_id: str):
+    if not document_store.has(document_id):
+        raise HTTPException(status_code=404, detail=f"Document {document_id} not found")
+    
+    return {"documentId": document_id, "pageCount": await executors.run("pdf", document_store.page_count, document_id)}
+
+@app.post("/api/pdf-page-count")
+async def pdf_page_count(file: Optional[UploadFile] = File(None), document_id: Optional[str] = Form(None, alias="documentId")):
+    try:
+        document_id, pdf = await load_pdf(file, document_id)
+        print(f"Getting page count for PDF: {document_id}")
+        
+        page_count = pdf.page_count
         
         print(f"PDF has {page_count} pages")
         
-        return {"pageCount": page_count}
+        return {"pageCount": page_count, "documentId": document_id}
             
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"Error getting PDF page count: {str(e)}")
         import traceback
@@ -75,266 +359,575 @@ async def pdf_page_count(file: UploadFile = File(...)):
         raise HTTPException(status_code=500, detail=f"Failed to get PDF page count: {str(e)}")
 
 @app.post("/api/extract-pdf-text")
-async def extract_pdf_text(file: UploadFile = File(...), page: int = Form(None)):
+async def extract_pdf_text(file: Optional[UploadFile] = File(None), page: int = Form(None), document_id: Optional[str] = Form(None, alias="documentId")):
     try:
-        # Read file content
-        content = await file.read()
-        print(f"Extracting text from PDF: {file.filename}")
-        
-        # Create a BytesIO object from the content
-        pdf_bytes = io.BytesIO(content)
-        
-        # Use PyPDF2 to read the PDF
-        pdf = PdfReader(pdf_bytes)
+        document_id, pdf = await load_pdf(file, document_id)
+        print(f"Extracting text from PDF: {document_id}")
         
         # Extract text from all pages or specific page
         if page is not None:
-            if page < 1 or page > len(pdf.pages):
-                raise HTTPException(status_code=400, detail=f"Page {page} does not exist. PDF has {len(pdf.pages)} pages")
+            if page < 1 or page > pdf.page_count:
+                raise HTTPException(status_code=400, detail=f"Page {page} does not exist. PDF has {pdf.page_count} pages")
             
             # Extract text from the specified page
-            text = pdf.pages[page - 1].extract_text()
-            return {"text": f"--- Page {page} ---\n{text}"}
+            text = await executors.run("pdf", get_page_text, document_id, pdf, page)
+            return {"text": f"--- Page {page} ---\n{text}", "documentId": document_id}
         else:
             # Extract text from all pages (limit to first 4)
             all_text = []
-            max_pages = min(len(pdf.pages), 4)
+            max_pages = min(pdf.page_count, 4)
             
-            for i in range(max_pages):
-                page_text = pdf.pages[i].extract_text()
+            page_texts = await executors.run("pdf", get_pages_text, document_id, pdf, range(1, max_pages + 1))
+            for i, page_text in enumerate(page_texts):
                 all_text.append(f"--- Page {i+1} ---\n{page_text}")
             
             # Add note if there are more pages
-            if len(pdf.pages) > max_pages:
+            if pdf.page_count > max_pages:
                 all_text.append(f"\n--- Page {max_pages+1} and beyond omitted (only first {max_pages} pages processed) ---\n")
             
             # Join all text from all pages
             combined_text = "\n\n".join(all_text)
             
             print(f"Successfully extracted text from PDF: {len(combined_text)} characters")
-            return {"text": combined_text}
+            return {"text": combined_text, "documentId": document_id}
             
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"Error extracting text from PDF: {str(e)}")
         import traceback
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=f"Failed to extract text from PDF: {str(e)}")
 
+def check_render_options(dpi: int, image_format: str, width: Optional[int], mode: Optional[str]):
+    if image_format not in IMAGE_FORMATS:
+        raise HTTPException(status_code=400, detail=f"Unsupported format {image_format}. Use one of: {', '.join(IMAGE_FORMATS)}")
+    if not MIN_DPI <= dpi <= MAX_DPI:
+        raise HTTPException(status_code=400, detail=f"dpi must be between {MIN_DPI} and {MAX_DPI}")
+    if width is not None and not MIN_WIDTH <= width <= MAX_WIDTH:
+        raise HTTPException(status_code=400, detail=f"width must be between {MIN_WIDTH} and {MAX_WIDTH}")
+    if mode not in (None, "raster", "text"):
+        raise HTTPException(status_code=400, detail="mode must be 'raster' or 'text'")
+    
+    # Rasterize when pypdfium2 is available, otherwise draw the extracted text
+    if mode != "text" and page_renderer.can_rasterize:
+        return "raster"
+    return "text"
+
+def parse_page_range(spec: str, page_count: int):
+    # Accepts "5", "1-20" or a comma separated mix like "1-3,7,10-12"
+    pages = []
+    seen = set()
+    for part in spec.replace(" ", "").split(","):
+        if not part:
+            continue
+        try:
+            if "-" in part:
+                first, last = part.split("-", 1)
+                first, last = int(first), int(last)
+            else:
+                first = last = int(part)
+        except ValueError:
+            raise HTTPException(status_code=400, detail=f"Invalid page range: {spec}")
+        if first < 1 or last > page_count or first > last:
+            raise HTTPException(status_code=400, detail=f"Invalid page range {part}. PDF has {page_count} pages")
+        for page in range(first, last + 1):
+            if page not in seen:
+                seen.add(page)
+                pages.append(page)
+    if not pages:
+        raise HTTPException(status_code=400, detail="No pages requested")
+    return pages
+
+def make_etag(*parts):
+    return '"' + hashlib.sha256(":".join(str(part) for part in parts).encode("utf-8")).hexdigest()[:32] + '"'
+
+def etag_matches(request: Request, etag: str):
+    if_none_match = request.headers.get("if-none-match", "")
+    return etag in [tag.strip() for tag in if_none_match.split(",")]
+
+async def render_page_image(request: Request, document_id: str, pdf, page: int, dpi: int, image_format: str, width: Optional[int], mode: Optional[str]):
+    # Check if page exists
+    if page < 1 or page > pdf.page_count:
+        raise HTTPException(status_code=400, detail=f"Page {page} does not exist. PDF has {pdf.page_count} pages")
+    mode = check_render_options(dpi, image_format, width, mode)
+    
+    # Documents are content-addressed, so a rendered page never changes
+    key = page_renderer.cache_key(document_id, page, dpi, image_format, width, mode)
+    etag = make_etag(key)
+    headers = {"ETag": etag, "Cache-Control": "public, max-age=604800, immutable"}
+    
+    if etag_matches(request, etag):
+        return Response(status_code=304, headers=headers)
+    
+    content = page_renderer.get_cached(key)
+    if content is None:
+        if mode == "raster":
+            content = await executors.run("image", page_renderer.render, document_store.path(document_id), page, dpi, image_format, width)
+        else:
+            text = await executors.run("pdf", get_page_text, document_id, pdf, page)
+            content = await executors.run("image", page_renderer.render_text_preview, text, page, image_format, width)
+        page_renderer.store(key, content)
+        print(f"Rendered page {page} of PDF {document_id} ({mode}, {dpi} dpi, {image_format}, {len(content)} bytes)")
+    
+    return Response(content=content, media_type=IMAGE_FORMATS[image_format][1], headers=headers)
+
+@app.get("/api/documents/{document_id}/pages/{page}/image")
+async def document_page_image(request: Request, document_id: str, page: int, dpi: int = 96, image_format: str = Query("png", alias="format"), width: Optional[int] = None, mode: Optional[str] = None):
+    try:
+        document_id, pdf = await load_pdf(None, document_id)
+        return await render_page_image(request, document_id, pdf, page, dpi, image_format, width, mode)
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"Error converting PDF to image: {str(e)}")
+        import traceback
+        traceback.print_exc()
+        raise HTTPException(status_code=500, detail=f"Failed to convert PDF to image: {str(e)}")
+
 @app.post("/api/pdf-to-image")
-async def pdf_to_image(file: UploadFile = File(...), page: int = Form(1)):
+async def pdf_to_image(request: Request, file: Optional[UploadFile] = File(None), page: int = Form(1), document_id: Optional[str] = Form(None, alias="documentId"), dpi: int = Form(96), image_format: str = Form("png", alias="format"), width: Optional[int] = Form(None), mode: Optional[str] = Form(None)):
     try:
-        # Read file content
-        content = await file.read()
-        print(f"Converting page {page} of PDF: {file.filename}")
-        
-        # Create a BytesIO object from the content
-        pdf_bytes = io.BytesIO(content)
-        
-        # Use PyPDF2 to read the PDF
-        pdf = PdfReader(pdf_bytes)
-        
-        # Check if page exists
-        if page < 1 or page > len(pdf.pages):
-            raise HTTPException(status_code=400, detail=f"Page {page} does not exist. PDF has {len(pdf.pages)} pages")
-        
-        # Extract text from the page
-        text = pdf.pages[page - 1].extract_text()
-        
-        # Generate a simple image with the text using PIL
-        # This is a fallback solution when we can't render the PDF directly
-        # Create a blank image
-        img = Image.new('RGB', (800, 1000), color=(255, 255, 255))
-        d = ImageDraw.Draw(img)
+        document_id, pdf = await load_pdf(file, document_id)
+        print(f"Converting page {page} of PDF: {document_id}")
         
-        # Use default font
-        try:
-            font = ImageFont.truetype("arial.ttf", 16)
-        except:
-            font = ImageFont.load_default()
-        
-        # Draw text
-        d.text((20, 20), f"Page {page}\n\n{text}", fill=(0, 0, 0), font=font)
-        
-        # Save to bytes
-        img_byte_arr = io.BytesIO()
-        img.save(img_byte_arr, format='PNG')
-        img_byte_arr.seek(0)
-        
-        print(f"Created image representation of PDF page {page}")
-        
-        # Return the image
-        return Response(
-            content=img_byte_arr.getvalue(),
-            media_type="image/png"
-        )
+        return await render_page_image(request, document_id, pdf, page, dpi, image_format, width, mode)
             
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"Error converting PDF to image: {str(e)}")
         import traceback
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=f"Failed to convert PDF to image: {str(e)}")
 
+@app.post("/api/pdf-to-images")
+async def pdf_to_images(request: Request, file: Optional[UploadFile] = File(None), pages: str = Form("1-20"), document_id: Optional[str] = Form(None, alias="documentId"), dpi: int = Form(96), image_format: str = Form("webp", alias="format"), width: Optional[int] = Form(160), mode: Optional[str] = Form(None)):
+    try:
+        document_id, pdf = await load_pdf(file, document_id)
+        page_numbers = parse_page_range(pages, pdf.page_count)
+        if len(page_numbers) > MAX_BATCH_PAGES:
+            raise HTTPException(status_code=400, detail=f"At most {MAX_BATCH_PAGES} pages can be rendered per request")
+        mode = check_render_options(dpi, image_format, width, mode)
+        print(f"Converting pages {pages} of PDF: {document_id}")
+        
+        keys = {page: page_renderer.cache_key(document_id, page, dpi, image_format, width, mode) for page in page_numbers}
+        etag = make_etag(*keys.values())
+        headers = {"ETag": etag, "Cache-Control": "public, max-age=604800, immutable"}
+        if etag_matches(request, etag):
+            return Response(status_code=304, headers=headers)
+        
+        images = {}
+        for page, key in keys.items():
+            content = page_renderer.get_cached(key)
+            if content is not None:
+                images[page] = content
+        
+        # Everything that isn't cached is rendered in a single pass over the document
+        missing = [page for page in page_numbers if page not in images]
+        if missing:
+            if mode == "raster":
+                rendered = await executors.run("image", page_renderer.render_many, document_store.path(document_id), missing, dpi, image_format, width)
+            else:
+                texts = dict(zip(missing, await executors.run("pdf", get_pages_text, document_id, pdf, missing)))
+                rendered = await executors.run(
+                    "image",
+                    lambda: {page: page_renderer.render_text_preview(texts[page], page, image_format, width) for page in missing}
+                )
+            for page, content in rendered.items():
+                page_renderer.store(keys[page], content)
+            images.update(rendered)
+        
+        def build_zip():
+            # The images are already compressed, so store them as-is
+            archive = io.BytesIO()
+            with zipfile.ZipFile(archive, "w", compression=zipfile.ZIP_STORED) as zf:
+                for page in page_numbers:
+                    zf.writestr(f"page-{page:04d}.{image_format}", images[page])
+            return archive.getvalue()
+        
+        content = await executors.run("image", build_zip)
+        print(f"Created {len(page_numbers)} page images of PDF ({len(content)} bytes)")
+        
+        headers["Content-Disposition"] = f'attachment; filename="{document_id[:12]}-pages-{page_numbers[0]}-{page_numbers[-1]}.zip"'
+        return Response(content=content, media_type="application/zip", headers=headers)
+            
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"Error converting PDF pages to images: {str(e)}")
+        import traceback
+        traceback.print_exc()
+        raise HTTPException(status_code=500, detail=f"Failed to convert PDF pages to images: {str(e)}")
+
 @app.post("/api/extract-pdf-all-pages")
-async def extract_pdf_all_pages(file: UploadFile = File(...)):
+async def extract_pdf_all_pages(file: Optional[UploadFile] = File(None), document_id: Optional[str] = Form(None, alias="documentId")):
     try:
-        # Read file content
-        content = await file.read()
-        print(f"Extracting text from all PDF pages: {file.filename}")
-        
-        # Create a BytesIO object from the content
-        pdf_bytes = io.BytesIO(content)
-        
-        # Use PyPDF2 to read the PDF
-        pdf = PdfReader(pdf_bytes)
+        document_id, pdf = await load_pdf(file, document_id)
+        print(f"Extracting text from all PDF pages: {document_id}")
         
         # Extract text from ALL pages
         all_text = []
         
-        for i in range(len(pdf.pages)):
-            page_text = pdf.pages[i].extract_text()
+        page_texts = await extract_all_pages_text(document_id, pdf.page_count)
+        for i, page_text in enumerate(page_texts):
             all_text.append(f"--- Page {i+1} ---\n{page_text}")
         
         # Join all text from all pages
         combined_text = "\n\n".join(all_text)
         
-        print(f"Successfully extracted text from all {len(pdf.pages)} PDF pages: {len(combined_text)} characters")
-        return {"text": combined_text}
+        print(f"Successfully extracted text from all {pdf.page_count} PDF pages: {len(combined_text)} characters")
+        return {"text": combined_text, "documentId": document_id}
             
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"Error extracting text from PDF: {str(e)}")
         import traceback
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=f"Failed to extract text from PDF: {str(e)}")
 
+def format_stream_event(event: dict, stream_format: str):
+    if stream_format == "sse":
+        return f"event: {event['type']}\ndata: {json.dumps(event)}\n\n"
+    return json.dumps(event) + "\n"
+
+async def stream_pages_text(document_id: str, pdf, page_count: int):
+    # Only the set of cached page numbers is loaded up front; text is fetched page by page
+    cached = await executors.run("io", page_text_cache.cached_pages, document_id)
+    missing = [page for page in range(1, page_count + 1) if page not in cached]
+    extracted = pdf_extractor.iter_extract(document_store.path(document_id), missing)
+    
+    try:
+        for page in range(1, page_count + 1):
+            text = None
+            if page in cached:
+                text = await executors.run("io", page_text_cache.get, document_id, page)
+                if text is None:
+                    # Evicted since we looked, extract it directly
+                    text = await executors.run("pdf", get_page_text, document_id, pdf, page)
+            else:
+                _, text = await extracted.__anext__()
+                await executors.run("io", page_text_cache.put, document_id, page, text)
+            yield page, text
+    finally:
+        await extracted.aclose()
+
+@app.post("/api/extract-pdf-all-pages/stream")
+async def extract_pdf_all_pages_stream(file: Optional[UploadFile] = File(None), document_id: Optional[str] = Form(None, alias="documentId"), stream_format: str = Form("ndjson", alias="format")):
+    if stream_format not in ("ndjson", "sse"):
+        raise HTTPException(status_code=400, detail="format must be 'ndjson' or 'sse'")
+    
+    try:
+        document_id, pdf = await load_pdf(file, document_id)
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"Error reading PDF for streaming extraction: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Failed to extract text from PDF: {str(e)}")
+    
+    page_count = pdf.page_count
+    print(f"Streaming text from all {page_count} PDF pages: {document_id}")
+    
+    async def event_stream():
+        # Each page is sent as soon as it's extracted, followed by a progress event
+        yield format_stream_event({"type": "start", "documentId": document_id, "pageCount": page_count}, stream_format)
+        characters = 0
+        try:
+            async for page, text in stream_pages_text(document_id, pdf, page_count):
+                characters += len(text)
+                yield format_stream_event({"type": "page", "page": page, "text": f"--- Page {page} ---\n{text}"}, stream_format)
+                yield format_stream_event({"type": "progress", "completed": page, "total": page_count}, stream_format)
+        except Exception as e:
+            print(f"Error streaming text from PDF: {str(e)}")
+            yield format_stream_event({"type": "error", "detail": f"Failed to extract text from PDF: {str(e)}"}, stream_format)
+            return
+        
+        print(f"Successfully streamed text from all {page_count} PDF pages: {characters} characters")
+        yield format_stream_event({"type": "done", "pageCount": page_count, "characters": characters}, stream_format)
+    
+    media_type = "text/event-stream" if stream_format == "sse" else "application/x-ndjson"
+    return StreamingResponse(event_stream(), media_type=media_type, headers={"Cache-Control": "no-cache"})
+
+async def run_model_call(endpoint: str, priority: int, prompt: str, call, model: Optional[str] = None):
+    """Run one upstream call, call() making a fresh attempt each time it's invoked.
+    
+    Every attempt (retries and hedges included) waits for its own scheduler slot, and the
+    deadline starts once the first one is admitted.
+    """
+    model = model or agent_registry.model(endpoint)
+    tokens = estimate_tokens(prompt)
+    return await upstream.call(endpoint, call, admit=lambda: model_scheduler.slot(model, priority, tokens))
+
+def upstream_http_error(e: UpstreamError, action: str):
+    # Rate limits and timeouts are passed on as such, anything else is a bad gateway
+    if e.status == 429:
+        headers = {"Retry-After": str(int(e.retry_after or 1))}
+        return HTTPException(status_code=429, detail=f"Failed to {action}: provider rate limit", headers=headers)
+    if e.status == 504:
+        return HTTPException(status_code=504, detail=f"Failed to {action}: {str(e)}")
+    return HTTPException(status_code=502, detail=f"Failed to {action}: {str(e)}")
+
+def build_vision_payload(image_bytes: bytes, media_type: str, prompt: str):
+    # Convert to base64 for the model
+    base64_encoded = base64.b64encode(image_bytes).decode("utf-8")
+    data_url = f"data:{media_type};base64,{base64_encoded}"
+    
+    # Create the request body for vision model
+    body = {
+        "model": VISION_MODEL,
+        "messages": [
+            {
+                "role": "user",
+                "content": [
+                    {"type": "text", "text": prompt},
+                    {
+                        "type": "image_url",
+                        "image_url": {"url": data_url}
+                    }
+                ]
+            }
+        ],
+        "max_tokens": 2048
+    }
+    return json.dumps(body)
+
+async def call_vision_model(image_bytes: bytes, media_type: str, prompt: str = OCR_PROMPT):
+    # Encoding a multi-megabyte image is done off the event loop
+    payload = await executors.run("image", build_vision_payload, image_bytes, media_type, prompt)
+    
+    # Make a direct API call to the IO Intelligence API
+    headers = {
+        'Authorization': f'Bearer {api_key}',
+        'Content-Type': 'application/json'
+    }
+    
+    # Make the API call over the shared connection pool
+    async def post():
+        async with http_client.post(
+            f"{IO_API_BASE_URL}/chat/completions",
+            headers=headers,
+            data=payload
+        ) as response:
+            if response.status != 200:
+                error_text = await response.text()
+                print(f"API Error: {error_text}")
+                raise UpstreamError(response.status, f"API Error: {response.status}", parse_retry_after(response.headers.get("Retry-After")))
+            
+            return await response.json()
+    
+    data = await run_model_call("ocr", PRIORITY_OCR, prompt, post, model=VISION_MODEL)
+    
+    # Extract the text from the response
+    return clean_extracted_text(data["choices"][0]["message"]["content"])
+
+def clean_extracted_text(extracted_text: str):
+    # Clean up common headers that the model might add despite instructions
+    headers_to_remove = [
+        "**Extracted Text:**",
+        "*Extracted Text:*",
+        "Extracted Text:",
+        "**Text from image:**",
+        "*Text from image:*",
+        "Text from image:",
+        "**Text:**",
+        "*Text:*",
+        "Text:"
+    ]
+    
+    for header in headers_to_remove:
+        if extracted_text.startswith(header):
+            extracted_text = extracted_text[len(header):].strip()
+    
+    # Remove any leading asterisks
+    while extracted_text.startswith('*'):
+        extracted_text = extracted_text[1:].strip()
+    
+    return extracted_text
+
+async def extract_text_tiled(content: bytes, columns: int):
+    tiles, media_type = await executors.run(
+        "image",
+        make_tiles,
+        content,
+        tile_height=OCR_TILE_HEIGHT,
+        overlap=OCR_TILE_OVERLAP,
+        columns=columns,
+        max_edge=OCR_TILE_MAX_EDGE,
+        output_format=OCR_IMAGE_FORMAT,
+        quality=OCR_IMAGE_QUALITY,
+        grayscale=OCR_GRAYSCALE,
+    )
+    print(f"Split image into {len(tiles)} tiles ({columns} column(s)), {sum(len(tile) for _, tile in tiles)} bytes total")
+    
+    # Bounded concurrency so one big scan can't take every connection to the provider
+    semaphore = asyncio.Semaphore(OCR_TILE_CONCURRENCY)
+    
+    async def read_tile(tile: bytes):
+        async with semaphore:
+            return await call_vision_model(tile, media_type, OCR_TILE_PROMPT)
+    
+    texts = await asyncio.gather(*(read_tile(tile) for _, tile in tiles))
+    
+    # Overlaps are only de-duplicated within a column, columns are joined as paragraphs
+    column_texts = []
+    for column in range(columns):
+        column_texts.append(stitch_texts([text for (tile_column, _), text in zip(tiles, texts) if tile_column == column]))
+    return "\n\n".join(text for text in column_texts if text)
+
 @app.post("/api/extract-text")
-async def extract_text(file: UploadFile = File(...)):
+async def extract_text(file: UploadFile = File(...), preprocess: bool = Form(True), tiled: bool = Form(False), columns: int = Form(1)):
     try:
         # Read file content
         content = await file.read()
         print(f"Received file: {file.filename}, size: {len(content)} bytes")
         
-        # Convert to base64 for the model
-        base64_encoded = base64.b64encode(content).decode("utf-8")
-        data_url = f"data:{file.content_type};base64,{base64_encoded}"
-        
-        # Make a direct API call to the IO Intelligence API
-        headers = {
-            'Authorization': f'Bearer {api_key}',
-            'Content-Type': 'application/json'
-        }
-        
-        # Create the request body for vision model
-        body = {
-            "model": "meta-llama/Llama-3.2-90B-Vision-Instruct",
-            "messages": [
-                {
-                    "role": "user",
-                    "content": [
-                        {"type": "text", "text": "Extract all text visible in this image. Return only the raw extracted text without any headers, commentary, or formatting. Do not add 'Extracted Text:' or any other labels."},
-                        {
-                            "type": "image_url",
-                            "image_url": {"url": data_url}
-                        }
-                    ]
-                }
-            ],
-            "max_tokens": 2048
-        }
-        
-        # Make the API call
-        async with aiohttp.ClientSession() as session:
-            async with session.post(
-                "https://api.intelligence.io.solutions/api/v1/chat/completions",
-                headers=headers,
-                json=body
-            ) as response:
-                if response.status != 200:
-                    error_text = await response.text()
-                    print(f"API Error: {error_text}")
-                    raise HTTPException(status_code=500, detail=f"API Error: {response.status}")
-                
-                data = await response.json()
-        
-        # Extract the text from the response
-        extracted_text = data["choices"][0]["message"]["content"]
-        
-        # Clean up common headers that the model might add despite instructions
-        headers_to_remove = [
-            "**Extracted Text:**",
-            "*Extracted Text:*",
-            "Extracted Text:",
-            "**Text from image:**",
-            "*Text from image:*",
-            "Text from image:",
-            "**Text:**",
-            "*Text:*",
-            "Text:"
-        ]
-        
-        for header in headers_to_remove:
-            if extracted_text.startswith(header):
-                extracted_text = extracted_text[len(header):].strip()
-        
-        # Remove any leading asterisks
-        while extracted_text.startswith('*'):
-            extracted_text = extracted_text[1:].strip()
+        if tiled:
+            if not 1 <= columns <= 4:
+                raise HTTPException(status_code=400, detail="columns must be between 1 and 4")
+            extracted_text = await extract_text_tiled(content, columns)
+            print(f"Successfully extracted text from tiled image: {len(extracted_text)} characters")
+            return {"text": extracted_text}
+        
+        # Shrink the image before upload, full-size phone photos don't read any better
+        media_type = file.content_type
+        if preprocess:
+            content, media_type, info = await executors.run(
+                "image",
+                prepare_image_for_ocr,
+                content,
+                file.content_type,
+                max_edge=OCR_MAX_EDGE,
+                output_format=OCR_IMAGE_FORMAT,
+                quality=OCR_IMAGE_QUALITY,
+                grayscale=OCR_GRAYSCALE,
+            )
+            print(f"Prepared image for OCR: {info['originalBytes']} -> {info['sentBytes']} bytes ({info})")
+        
+        extracted_text = await call_vision_model(content, media_type)
         
         print(f"Successfully extracted text from image: {len(extracted_text)} characters")
         return {"text": extracted_text}
         
+    except HTTPException:
+        raise
+    except UpstreamError as e:
+        print(f"Upstream error extracting text from image: {str(e)}")
+        raise upstream_http_error(e, "extract text from image")
     except Exception as e:
         print(f"Error extracting text from image: {str(e)}")
         import traceback
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=f"Failed to extract text from image: {str(e)}")
 
+def llm_cache_key(endpoint: str, text: str, target_language: Optional[str] = None, variant: str = ""):
+    # Normalizing and hashing a whole book takes a while, so handlers run this on the text pool
+    prompt_version = f"{PROMPT_VERSIONS[endpoint]}:{agent_registry.version(endpoint)}:{variant}"
+    return response_cache.make_key(endpoint, agent_registry.model(endpoint), prompt_version, text, target_language)
+
+async def cached_llm_response(endpoint: str, text: str, generate, bypass_cache: bool = False, target_language: Optional[str] = None, variant: str = ""):
+    # generate() returns (response, cacheable); fallback responses are never cached
+    key = await executors.run("text", llm_cache_key, endpoint, text, target_language, variant)
+    if not bypass_cache:
+        cached = await executors.run("io", response_cache.get, key)
+        if cached is not None:
+            print(f"Serving cached {endpoint} response")
+            return cached
+    
+    async def generate_and_cache():
+        response, cacheable = await generate()
+        if cacheable:
+            await executors.run("io", response_cache.set, key, response)
+        return response
+    
+    return await llm_single_flight.do(key, generate_and_cache)
+
 @app.post("/api/summarize")
 async def summarize(request: TextRequest):
+    return await cached_llm_response("summarize", request.text, lambda: generate_summary(request.text, request.bypassCache), bypass_cache=request.bypassCache)
+
+def extract_summary_text(result):
+    # Check if result is a dictionary with summarize_text key
+    if isinstance(result, dict) and "summarize_text" in result:
+        result = result["summarize_text"]
+    
+    # Structured output from the summarize task (SummaryResult)
+    if hasattr(result, "summary"):
+        clean_summary = result.summary
+    # Check if result is a string containing [final_result(...)]
+    elif isinstance(result, str) and "[final_result" in result:
+        import re
+        # Try to extract summary from final_result format
+        summary_match = re.search(r'summary="([^"]+)"', result)
+        if summary_match:
+            clean_summary = summary_match.group(1)
+        else:
+            # If can't extract, use the whole result as is
+            clean_summary = result
+    else:
+        # Just convert to string if it's some other format
+        clean_summary = str(result)
+    
+    # Clean up any remaining formatting or special characters
+    return clean_summary.replace('\\n', '\n').replace('\\t', '\t')
+
+async def run_summary_task(text: str, max_words: int, priority: int = PRIORITY_BATCH):
+    # Borrow the pre-built agent from the registry
+    agent = agent_registry.get("summarize")
+    
+    def run():
+        workflow = Workflow(objective=text, client_mode=False)
+        return workflow.summarize_text(
+            max_words=max_words,
+            agents=[agent]
+        ).run_tasks()
+    
+    result = (await run_model_call("summarize", priority, text, run))["results"]
+    return extract_summary_text(result)
+
+async def summarize_hierarchically(text: str, bypass_cache: bool = False):
+    """Map-reduce summary for texts larger than one chunk.
+    
+    Chunk summaries run concurrently (at most SUMMARY_MAP_CONCURRENCY at a time) and
+    are cached by chunk content, so re-summarizing an edited document only pays for
+    the chunks that changed. If the joined chunk summaries are still too long they
+    are chunked and summarized again before the final reduce call. With bypass_cache
+    the chunk summaries are regenerated too.
+    """
+    semaphore = asyncio.Semaphore(SUMMARY_MAP_CONCURRENCY)
+    
+    async def summarize_chunk(chunk):
+        async def generate():
+            async with semaphore:
+                chunk_summary = await run_summary_task(chunk, SUMMARY_CHUNK_WORDS)
+            return {"summary": chunk_summary}, bool(chunk_summary.strip())
+        
+        response = await cached_llm_response("summarize", chunk, generate, bypass_cache=bypass_cache, variant="chunk")
+        return response["summary"]
+    
+    chunks = await executors.run("text", split_into_chunks, text, SUMMARY_CHUNK_TOKENS)
+    level = 1
+    while True:
+        print(f"Summarizing {len(chunks)} chunks (level {level})")
+        combined = "\n\n".join(await asyncio.gather(*(summarize_chunk(chunk) for chunk in chunks)))
+        if estimate_tokens(combined) <= SUMMARY_CHUNK_TOKENS:
+            break
+        next_chunks = split_into_chunks(combined, SUMMARY_CHUNK_TOKENS)
+        if len(next_chunks) >= len(chunks):
+            # Summaries aren't shrinking the text, reduce what we have
+            break
+        chunks = next_chunks
+        level += 1
+    
+    return await run_summary_task(combined, 250)
+
+async def generate_summary(text: str, bypass_cache: bool = False):
     try:
-        # Create agent and workflow
-        agent = Agent(
-            name="Summary Agent",
-            instructions="""You are an assistant specialized in summarization. Create clear, concise summaries in simple English that capture the main points.
-            Focus on providing meaningful information and key concepts.
-            Format your response as plain text without any metadata or function calls.
-            Include important details, structures, and processes.
-            Make the summary informative and educational.
-            """,
-            model="meta-llama/Llama-4-Maverick-17B-128E-Instruct-FP8",
-            api_key=api_key,
-            base_url="https://api.intelligence.io.solutions/api/v1"
-        )
-        
-        workflow = Workflow(objective=request.text, client_mode=False)
+        if estimate_tokens(text) > SUMMARY_CHUNK_TOKENS:
+            return {"summary": await summarize_hierarchically(text, bypass_cache)}, True
         
         # Run summarization task
-        result = (await workflow.summarize_text(
-            max_words=250,  # Increased word limit for more detailed summary
-            agents=[agent]
-        ).run_tasks())["results"]
-        
-        # Process the result to extract clean summary
-        clean_summary = ""
-        
-        # Check if result is a dictionary with summarize_text key
-        if isinstance(result, dict) and "summarize_text" in result:
-            clean_summary = result["summarize_text"]
-        # Check if result is a string containing [final_result(...)]
-        elif isinstance(result, str) and "[final_result" in result:
-            import re
-            # Try to extract summary from final_result format
-            summary_match = re.search(r'summary="([^"]+)"', result)
-            if summary_match:
-                clean_summary = summary_match.group(1)
-            else:
-                # If can't extract, use the whole result as is
-                clean_summary = result
-        else:
-            # Just convert to string if it's some other format
-            clean_summary = str(result)
-        
-        # Clean up any remaining formatting or special characters
-        clean_summary = clean_summary.replace('\\n', '\n').replace('\\t', '\t')
+        clean_summary = await run_summary_task(text, 250)  # Increased word limit for more detailed summary
         
         # Add a custom post-processing step to enhance the summary if needed
         if len(clean_summary) < 100:  # If summary is too short, add more context
@@ -342,7 +935,7 @@ async def summarize(request: TextRequest):
             enhanced_prompt = f"""
             The following text needs a more detailed summary:
             
-            {request.text}
+            {text}
             
             Please provide a comprehensive summary that includes:
             1. Main concepts and structures
@@ -353,247 +946,117 @@ async def summarize(request: TextRequest):
             Format as plain text without metadata.
             """
             
-            enhanced_result = (await workflow.custom(
-                name="enhanced-summary",
-                objective=enhanced_prompt,
-                instructions="Create a detailed, informative summary",
-                agents=[agent],
-            ).run_tasks())["results"]
+            agent = agent_registry.get("summarize")
+            
+            def run():
+                workflow = Workflow(objective=text, client_mode=False)
+                return workflow.custom(
+                    name="enhanced-summary",
+                    objective=enhanced_prompt,
+                    instructions="Create a detailed, informative summary",
+                    agents=[agent],
+                ).run_tasks()
+            
+            enhanced_result = (await run_model_call("summarize", PRIORITY_BATCH, enhanced_prompt, run))["results"]
             
             clean_summary = str(enhanced_result)
         
-        return {"summary": clean_summary}
+        return {"summary": clean_summary}, True
+    except UpstreamError as e:
+        print(f"Upstream error in summary generation: {str(e)}")
+        raise upstream_http_error(e, "generate summary")
     except Exception as e:
         print(f"Error in summary generation: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Failed to generate summary: {str(e)}")
 
 @app.post("/api/flashcards")
 async def generate_flashcards(request: TextRequest):
+    return await cached_llm_response("flashcards", request.text, lambda: build_flashcards(request.text), bypass_cache=request.bypassCache)
+
+def task_output(results, task_name: str, key: str):
+    # The workflow returns {task name: output}; some models hand back the parsed list directly
+    if isinstance(results, dict):
+        if task_name in results:
+            return results[task_name]
+        if key in results:
+            return results[key]
+    return results
+
+FLASHCARDS_INSTRUCTIONS = "Generate flashcards in valid JSON format"
+
+def flashcards_prompt(text: str):
+    return f"""
+    Create a set of flashcards from the following text. 
+    Each flashcard should have a question on the front and an answer on the back.
+    Focus on key concepts, definitions, and important facts.
+    Format the output EXACTLY as a JSON array of objects with 'question' and 'answer' properties.
+    The output should be valid JSON that can be parsed directly.
+    
+    Example format: 
+    [
+      {{"question": "What is photosynthesis?", "answer": "The process by which plants convert light energy to chemical energy"}},
+      {{"question": "What is cellular respiration?", "answer": "The process of breaking down glucose to release energy"}}
+    ]
+    
+    Text: {text}
+    """
+
+async def build_flashcards(text: str):
     try:
-        # Create agent and workflow
-        agent = Agent(
-            name="Flashcard Extractor Agent",
-            instructions="""You are an assistant specialized in creating flashcards. 
-            Extract key concepts and create question-answer pairs that help with learning.
-            Focus on the most important information and format as a proper JSON array.
-            Each flashcard should have a clear question and concise answer.
-            """,
-            model="meta-llama/Llama-4-Maverick-17B-128E-Instruct-FP8",
-            api_key=api_key,
-            base_url="https://api.intelligence.io.solutions/api/v1"
-        )
+        # Borrow the pre-built agent from the registry
+        agent = agent_registry.get("flashcards")
         
-        workflow = Workflow(objective=request.text, client_mode=False)
+        custom_prompt = flashcards_prompt(text)
         
-        # Create custom prompt for flashcards
-        custom_prompt = f"""
-        Create a set of flashcards from the following text. 
-        Each flashcard should have a question on the front and an answer on the back.
-        Focus on key concepts, definitions, and important facts.
-        Format the output EXACTLY as a JSON array of objects with 'question' and 'answer' properties.
-        The output should be valid JSON that can be parsed directly.
+        # Run custom task
+        def run():
+            workflow = Workflow(objective=text, client_mode=False)
+            return workflow.custom(
+                name="create-flashcards",
+                objective=custom_prompt,
+                instructions=FLASHCARDS_INSTRUCTIONS,
+                agents=[agent],
+            ).run_tasks()
         
-        Example format: 
-        [
-          {{"question": "What is photosynthesis?", "answer": "The process by which plants convert light energy to chemical energy"}},
-          {{"question": "What is cellular respiration?", "answer": "The process of breaking down glucose to release energy"}}
-        ]
+        results = (await run_model_call("flashcards", PRIORITY_BATCH, custom_prompt, run))["results"]
         
-        Text: {request.text}
-        """
+        # Parse off the event loop; one pass pulls out every well-formed card
+        output = task_output(results, "create-flashcards", "flashcards")
+        flashcards = await executors.run("text", parse_flashcards, output)
+        print(f"Parsed {len(flashcards)} flashcards from {len(str(output))} characters of model output")
         
-        # Run custom task
-        results = (await workflow.custom(
-            name="create-flashcards",
-            objective=custom_prompt,
-            instructions="Generate flashcards in valid JSON format",
-            agents=[agent],
-        ).run_tasks())["results"]
-        
-        # Check if the response contains a create-flashcards key
-        if isinstance(results, dict) and 'create-flashcards' in results:
-            try:
-                # Extract the JSON string from the markdown code blocks
-                import re
-                json_str = results['create-flashcards']
-                
-                # Find JSON array between markdown code blocks if present
-                json_match = re.search(r'```(?:json)?\s*([\s\S]*?)\s*```', json_str)
-                if json_match:
-                    json_str = json_match.group(1)
-                else:
-                    # Try to find just a JSON array
-                    json_match = re.search(r'\[\s*\{.*\}\s*\]', json_str, re.DOTALL)
-                    if json_match:
-                        json_str = json_match.group(0)
-                
-                # Clean up the JSON string
-                json_str = json_str.replace('\n', ' ').replace('\\', '')
-                print("Extracted JSON string:", json_str)
-                
-                # Import json here to ensure it's available
-                import json
-                parsed_cards = json.loads(json_str)
-                print("Successfully parsed flashcards:", len(parsed_cards))
-                
-                # Return directly with the "flashcards" key that your frontend expects
-                return {"flashcards": parsed_cards}
-            except Exception as e:
-                print(f"Error parsing flashcards from create-flashcards key: {e}")
-                print(f"Content of create-flashcards: {results['create-flashcards']}")
-                # Continue with other parsing methods if this fails
-        
-        # Parse the JSON from the results
-        try:
-            # If results is already a dictionary, handle that case
-            if isinstance(results, dict):
-                print("Results is a dictionary:", results)
-                if "flashcards" in results:
-                    return {"flashcards": results["flashcards"]}
-            
-            # If results is a string, try to extract JSON from it
-            if isinstance(results, str):
-                # Clean up the results string to extract just the JSON part
-                import re
-                import json
-                
-                # Print the raw results for debugging
-                print("Raw flashcard results:", results)
-                
-                # Look for JSON array in the text
-                json_match = re.search(r'\[\s*\{.*\}\s*\]', results, re.DOTALL)
-                if json_match:
-                    json_str = json_match.group(0)
-                    # Clean up common formatting issues
-                    json_str = json_str.replace('\n', ' ').replace('\\', '')
-                    print("Extracted JSON string:", json_str)
-                    
-                    flashcards = json.loads(json_str)
-                    print("Successfully parsed flashcards:", len(flashcards))
-                    return {"flashcards": flashcards}
-            
-            # Try to find individual question/answer pairs
-            if isinstance(results, str):
-                questions = re.findall(r'"question":\s*"([^"]+)"', results)
-                answers = re.findall(r'"answer":\s*"([^"]+)"', results)
-                
-                if questions and answers and len(questions) == len(answers):
-                    flashcards = [{"question": q, "answer": a} for q, a in zip(questions, answers)]
-                    return {"flashcards": flashcards}
-            
-            # If we get here, we need to try a more aggressive approach
-            # Extract lines from either string or dict format
-            lines = []
-            if isinstance(results, str):
-                lines = results.split('\n')
-            elif isinstance(results, dict) and 'create-flashcards' in results:
-                lines = results['create-flashcards'].split('\n')
-            
-            flashcards = []
-            current_card = {}
-            
-            for line in lines:
-                line = line.strip()
-                if not line:
-                    continue
-                
-                # Look for question patterns
-                if "question" in line.lower() and ":" in line:
-                    if current_card and "question" in current_card:
-                        if "answer" not in current_card:
-                            current_card["answer"] = "See summary for details"
-                        flashcards.append(current_card)
-                        current_card = {}
-                    
-                    q_parts = line.split(":", 1)
-                    if len(q_parts) > 1:
-                        current_card["question"] = q_parts[1].strip().strip('"').strip()
-                
-                # Look for answer patterns
-                elif "answer" in line.lower() and ":" in line and "question" in current_card:
-                    a_parts = line.split(":", 1)
-                    if len(a_parts) > 1:
-                        current_card["answer"] = a_parts[1].strip().strip('"').strip()
-                        flashcards.append(current_card)
-                        current_card = {}
-            
-            # Add the last card if incomplete
-            if current_card and "question" in current_card:
-                if "answer" not in current_card:
-                    current_card["answer"] = "See summary for details"
-                flashcards.append(current_card)
-            
-            # If we found flashcards, return them
-            if flashcards:
-                return {"flashcards": flashcards}
-            
-            # Last resort: create some basic flashcards from the text
-            return {"flashcards": [
-                {"question": "What is the main topic of this text?", "answer": "See summary for details"},
-                {"question": "What are key concepts covered in this text?", "answer": "See summary for key points"}
-            ]}
-                
-        except Exception as parse_error:
-            print(f"Error parsing flashcards JSON: {parse_error}")
-            # Create some basic flashcards as fallback
-            return {"flashcards": [
-                {"question": "What is the main topic of this text?", "answer": "See summary for details"},
-                {"question": "What are key concepts covered in this text?", "answer": "See summary for key points"}
-            ]}
+        if flashcards:
+            return {"flashcards": flashcards}, True
+        
+        # Last resort: create some basic flashcards from the text
+        return {"flashcards": [
+            {"question": "What is the main topic of this text?", "answer": "See summary for details"},
+            {"question": "What are key concepts covered in this text?", "answer": "See summary for key points"}
+        ]}, False
         
+    except UpstreamError as e:
+        print(f"Upstream error in flashcards: {str(e)}")
+        raise upstream_http_error(e, "generate flashcards")
     except Exception as e:
+        # Fail the request instead of returning placeholder cards, so callers (study-pack) see the error
         print(f"Exception in flashcards: {str(e)}")
-        # Even if there's an error, return something usable
-        return {"flashcards": [
-            {"question": "Error occurred", "answer": "Please try regenerating the flashcards."}
-        ]}
+        raise HTTPException(status_code=500, detail=f"Failed to generate flashcards: {str(e)}")
 
 @app.post("/api/mcqs")
-async def generate_mcqs(request: TextRequest):
-    try:
-        # Add this helper function to fix malformed JSON
-        def fix_malformed_mcq_json(json_str):
-            # Fix missing colons after isCorrect
-            json_str = json_str.replace('"isCorrect false', '"isCorrect": false')
-            json_str = json_str.replace('"isCorrect true', '"isCorrect": true')
-            
-            # Fix other common issues
-            json_str = json_str.replace(',,', ',')
-            json_str = json_str.replace(',]', ']')
-            json_str = json_str.replace(',}', '}')
-            
-            return json_str
-            
-        # Create agent and workflow
-        agent = Agent(
-            name="MCQ Generator Agent",
-            instructions="""You are an assistant specialized in creating high-quality multiple-choice questions. 
-            Focus on extracting key concepts, important facts, names, numbers, and definitions from the text.
-            Create comprehensive multiple-choice questions that cover the main content of the text.
-            Each question must have EXACTLY ONE correct answer and three plausible distractors.
-            Each question must have a detailed explanation for why the correct answer is right and why others are wrong.
-            
-            IMPORTANT: Vary which option (A, B, C, or D) is the correct answer across different questions.
-            Do not make option A always the correct answer - distribute correct answers randomly among all options.
-            
-            Analyze the content carefully and create an appropriate number of questions:
-            - For simple or short content, create fewer questions (3-5)
-            - For medium complexity or length, create a moderate number of questions (5-15)
-            - For complex, detailed, or long content, create more questions (15-30)
-            - Focus on quality over quantity - each question should test important knowledge
-            
-            Ensure questions cover all major topics, concepts, and important details in the text.""",
-            model="meta-llama/Llama-4-Maverick-17B-128E-Instruct-FP8",
-            api_key=api_key,
-            base_url="https://api.intelligence.io.solutions/api/v1"
-        )
-        
-        # Add a unique ID to avoid workflow conflicts
-        import uuid
-        workflow_id = str(uuid.uuid4())
-        workflow = Workflow(objective=request.text, client_mode=False)
-        
-        # First, let's analyze the content to determine appropriate question count
+async def generate_mcqs(request: MCQRequest):
+    if request.countMode not in ("local", "model"):
+        raise HTTPException(status_code=400, detail="countMode must be 'local' or 'model'")
+    return await cached_llm_response(
+        "mcqs",
+        request.text,
+        lambda: build_mcqs(request.text, request.countMode),
+        bypass_cache=request.bypassCache,
+        variant=request.countMode,
+    )
+
+async def recommend_mcq_count(agent, text: str, count_mode: str):
+    if count_mode == "model":
+        # Opt-in: ask the model to analyze the content and recommend a question count
         analysis_prompt = f"""
         Analyze the following text and determine an appropriate number of multiple-choice questions to create.
         Consider the following factors:
@@ -601,20 +1064,24 @@ async def generate_mcqs(request: TextRequest):
         - Number of distinct topics, concepts, or facts
         - Length and detail level of the text
         - Educational importance of various elements
-        
+    
         Return only a number representing your recommended question count.
-        
-        Text: {request.text[:2000]}... (text truncated for analysis)
+    
+        Text: {text[:2000]}... (text truncated for analysis)
         """
-        
+    
         # Get recommendation for question count
-        analysis_result = (await workflow.custom(
-            name="analyze-content",
-            objective=analysis_prompt,
-            instructions="Analyze the content and recommend an appropriate number of MCQs. Return only a number.",
-            agents=[agent],
-        ).run_tasks())["results"]
+        def run():
+            workflow = Workflow(objective=text, client_mode=False)
+            return workflow.custom(
+                name="analyze-content",
+                objective=analysis_prompt,
+                instructions="Analyze the content and recommend an appropriate number of MCQs. Return only a number.",
+                agents=[agent],
+            ).run_tasks()
         
+        analysis_result = (await run_model_call("mcqs", PRIORITY_BATCH, analysis_prompt, run))["results"]
+    
         # Try to extract a number from the analysis result
         try:
             import re
@@ -628,336 +1095,659 @@ async def generate_mcqs(request: TextRequest):
                 recommended_count = 10
         except:
             recommended_count = 10
-            
-        print(f"Recommended MCQ count for this content: {recommended_count}")
         
-        # Create custom prompt for MCQs with the recommended count
-        custom_prompt = f"""
-        Create approximately {recommended_count} multiple-choice questions (MCQs) based on the following text.
-        The number of questions should be appropriate to cover the main content thoroughly.
-        
-        Focus on important information such as:
-        - Key concepts and principles
-        - Important names, dates, and numbers
-        - Definitions and terminologies
-        - Significant processes and relationships
-        
-        Each MCQ MUST have:
-        1. A clear, concise question
-        2. Four options (A, B, C, D) with EXACTLY ONE correct answer
-        3. A detailed explanation for why the correct answer is right and why the others are incorrect
-        
-        IMPORTANT REQUIREMENT: Distribute the correct answers randomly among options A, B, C, and D.
-        DO NOT always make option A the correct answer. Vary which option is correct across different questions.
-        
-        Format the output as a JSON array of objects with 'question', 'options', and 'explanation' properties.
-        The 'options' should be an array of objects, each with 'text' and 'isCorrect' properties.
-        
-        IMPORTANT: Each question MUST have EXACTLY ONE option marked as correct (isCorrect: true) and the other three as incorrect (isCorrect: false).
-        
-        Example format:
-        [
-          {{
-            "question": "What is the capital of France?",
-            "options": [
-              {{"text": "London", "isCorrect": false}},
-              {{"text": "Paris", "isCorrect": true}},
-              {{"text": "Berlin", "isCorrect": false}},
-              {{"text": "Madrid", "isCorrect": false}}
-            ],
-            "explanation": "Paris is the capital of France. London is the capital of the UK, Berlin is the capital of Germany, and Madrid is the capital of Spain."
-          }},
-          {{
-            "question": "Which element has the chemical symbol 'O'?",
-            "options": [
-              {{"text": "Osmium", "isCorrect": false}},
-              {{"text": "Oxygen", "isCorrect": true}},
-              {{"text": "Gold", "isCorrect": false}},
-              {{"text": "Silver", "isCorrect": false}}
-            ],
-            "explanation": "Oxygen has the chemical symbol 'O'. Osmium is 'Os', Gold is 'Au', and Silver is 'Ag'."
-          }},
-          {{
-            "question": "Who wrote 'Romeo and Juliet'?",
-            "options": [
-              {{"text": "Charles Dickens", "isCorrect": false}},
-              {{"text": "Jane Austen", "isCorrect": false}},
-              {{"text": "William Shakespeare", "isCorrect": true}},
-              {{"text": "Mark Twain", "isCorrect": false}}
-            ],
-            "explanation": "William Shakespeare wrote 'Romeo and Juliet'. Charles Dickens wrote 'Oliver Twist', Jane Austen wrote 'Pride and Prejudice', and Mark Twain wrote 'Adventures of Huckleberry Finn'."
-          }}
-        ]
+    else:
+        # Estimate the question count locally instead of spending a model round trip on it
+        recommended_count = await executors.run("text", estimate_question_count, text)
+    return recommended_count
+
+def mcqs_prompt(text: str, recommended_count: int):
+    return f"""
+    Create approximately {recommended_count} multiple-choice questions (MCQs) based on the following text.
+    The number of questions should be appropriate to cover the main content thoroughly.
+    
+    Focus on important information such as:
+    - Key concepts and principles
+    - Important names, dates, and numbers
+    - Definitions and terminologies
+    - Significant processes and relationships
+    
+    Each MCQ MUST have:
+    1. A clear, concise question
+    2. Four options (A, B, C, D) with EXACTLY ONE correct answer
+    3. A detailed explanation for why the correct answer is right and why the others are incorrect
+    
+    IMPORTANT REQUIREMENT: Distribute the correct answers randomly among options A, B, C, and D.
+    DO NOT always make option A the correct answer. Vary which option is correct across different questions.
+    
+    Format the output as a JSON array of objects with 'question', 'options', and 'explanation' properties.
+    The 'options' should be an array of objects, each with 'text' and 'isCorrect' properties.
+    
+    IMPORTANT: Each question MUST have EXACTLY ONE option marked as correct (isCorrect: true) and the other three as incorrect (isCorrect: false).
+    
+    Example format:
+    [
+      {{
+        "question": "What is the capital of France?",
+        "options": [
+          {{"text": "London", "isCorrect": false}},
+          {{"text": "Paris", "isCorrect": true}},
+          {{"text": "Berlin", "isCorrect": false}},
+          {{"text": "Madrid", "isCorrect": false}}
+        ],
+        "explanation": "Paris is the capital of France. London is the capital of the UK, Berlin is the capital of Germany, and Madrid is the capital of Spain."
+      }},
+      {{
+        "question": "Which element has the chemical symbol 'O'?",
+        "options": [
+          {{"text": "Osmium", "isCorrect": false}},
+          {{"text": "Oxygen", "isCorrect": true}},
+          {{"text": "Gold", "isCorrect": false}},
+          {{"text": "Silver", "isCorrect": false}}
+        ],
+        "explanation": "Oxygen has the chemical symbol 'O'. Osmium is 'Os', Gold is 'Au', and Silver is 'Ag'."
+      }},
+      {{
+        "question": "Who wrote 'Romeo and Juliet'?",
+        "options": [
+          {{"text": "Charles Dickens", "isCorrect": false}},
+          {{"text": "Jane Austen", "isCorrect": false}},
+          {{"text": "William Shakespeare", "isCorrect": true}},
+          {{"text": "Mark Twain", "isCorrect": false}}
+        ],
+        "explanation": "William Shakespeare wrote 'Romeo and Juliet'. Charles Dickens wrote 'Oliver Twist', Jane Austen wrote 'Pride and Prejudice', and Mark Twain wrote 'Adventures of Huckleberry Finn'."
+      }}
+    ]
+    
+    Text: {text}
+    """
+
+def mcqs_instructions(recommended_count: int):
+    return f"Generate approximately {recommended_count} high-quality MCQs in JSON format with EXACTLY ONE correct answer per question. Make sure to vary which option (A, B, C, or D) is correct."
+
+async def build_mcqs(text: str, count_mode: str = "local"):
+    try:
+        # Borrow the pre-built agent from the registry
+        agent = agent_registry.get("mcqs")
         
-        Text: {request.text}
-        """
+        recommended_count = await recommend_mcq_count(agent, text, count_mode)
+        print(f"Recommended MCQ count for this content: {recommended_count}")
+        
+        custom_prompt = mcqs_prompt(text, recommended_count)
         
         # Run custom task to generate MCQs
-        results = (await workflow.custom(
-            name="create-mcqs",
-            objective=custom_prompt,
-            instructions=f"Generate approximately {recommended_count} high-quality MCQs in JSON format with EXACTLY ONE correct answer per question. Make sure to vary which option (A, B, C, or D) is correct.",
-            agents=[agent],
-        ).run_tasks())["results"]
+        def run():
+            workflow = Workflow(objective=text, client_mode=False)
+            return workflow.custom(
+                name="create-mcqs",
+                objective=custom_prompt,
+                instructions=mcqs_instructions(recommended_count),
+                agents=[agent],
+            ).run_tasks()
         
-        # Parse the JSON from the results
-        try:
-            import re
-            import json
-            
-            print("Raw MCQ results:", results)
-            
-            mcqs_data = None
-            
-            # Approach 1: Direct JSON parsing if results is already a list
-            if isinstance(results, list):
-                mcqs_data = results
-            
-            # Approach 2: If results is a dict with create-mcqs key
-            elif isinstance(results, dict) and "create-mcqs" in results:
-                mcqs_text = results["create-mcqs"]
-                
-                # Look for JSON array in the text between markdown code blocks
-                json_match = re.search(r'```json\s*([\s\S]*?)\s*```', mcqs_text, re.DOTALL)
-                if json_match:
-                    json_str = json_match.group(1)
-                    # Clean up the JSON string
-                    json_str = json_str.replace('\n', ' ').strip()
-                    # Fix malformed JSON
-                    json_str = fix_malformed_mcq_json(json_str)
-                    mcqs_data = json.loads(json_str)
-                else:
-                    # Try to find just a JSON array
-                    json_match = re.search(r'\[\s*\{.*\}\s*\]', mcqs_text, re.DOTALL)
-                    if json_match:
-                        json_str = json_match.group(0)
-                        # Fix malformed JSON
-                        json_str = fix_malformed_mcq_json(json_str)
-                        mcqs_data = json.loads(json_str)
-            
-            # Approach 3: Extract JSON array using regex if results is a string
-            elif isinstance(results, str):
-                # Look for JSON array in the text
-                json_match = re.search(r'\[\s*\{.*\}\s*\]', results, re.DOTALL)
-                if json_match:
-                    json_str = json_match.group(0)
-                    # Clean up common formatting issues
-                    json_str = json_str.replace('\n', ' ').strip()
-                    # Fix malformed JSON
-                    json_str = fix_malformed_mcq_json(json_str)
-                    mcqs_data = json.loads(json_str)
-            
-            # Process the MCQs data if we found it
-            if mcqs_data and isinstance(mcqs_data, list):
-                # Validate and fix each MCQ to ensure exactly one correct answer
-                for mcq in mcqs_data:
-                    if "options" in mcq and isinstance(mcq["options"], list):
-                        # Count correct answers
-                        correct_count = sum(1 for opt in mcq["options"] if opt.get("isCorrect") is True)
-                        
-                        # If no correct answers, mark a random one as correct (not always the first)
-                        if correct_count == 0 and len(mcq["options"]) > 0:
-                            import random
-                            random_index = random.randint(0, len(mcq["options"]) - 1)
-                            mcq["options"][random_index]["isCorrect"] = True
-                        
-                        # If multiple correct answers, keep only one as correct (randomly)
-                        if correct_count > 1:
-                            # Find all correct options
-                            correct_indices = [i for i, opt in enumerate(mcq["options"]) if opt.get("isCorrect") is True]
-                            # Choose one randomly to keep as correct
-                            import random
-                            keep_index = random.choice(correct_indices)
-                            # Set all others to incorrect
-                            for i, opt in enumerate(mcq["options"]):
-                                opt["isCorrect"] = (i == keep_index)
-                
-                return {"mcqs": mcqs_data}
-            
-            # If we get here, we couldn't parse the JSON
-            raise ValueError("Could not extract valid JSON from the response")
-            
-        except Exception as parse_error:
-            print(f"Failed to parse MCQs: {parse_error}")
-            print(f"Results type: {type(results)}")
-            print(f"Results content: {results}")
-            
-            # Create default MCQs as fallback with randomized correct answers
-            import random
-            default_mcqs = [
-                {
-                    "question": "What is the main topic of this text?",
-                    "options": [
-                        {"text": "The text content", "isCorrect": False},
-                        {"text": "Something else", "isCorrect": True},
-                        {"text": "Not related", "isCorrect": False},
-                        {"text": "None of the above", "isCorrect": False}
-                    ],
-                    "explanation": "This is a default question because we couldn't parse the MCQs."
-                },
-                {
-                    "question": "What should you do next?",
-                    "options": [
-                        {"text": "Try again", "isCorrect": False},
-                        {"text": "Check your input", "isCorrect": False},
-                        {"text": "Contact support", "isCorrect": True},
-                        {"text": "None of the above", "isCorrect": False}
-                    ],
-                    "explanation": "This is a default question because we couldn't parse the MCQs."
-                }
-            ]
-            return {"mcqs": default_mcqs}
-            
-    except Exception as e:
-        print(f"Exception in MCQs generation: {str(e)}")
-        # Return a default set of MCQs instead of an error with randomized correct answers
-        import random
-        correct_index = random.randint(0, 3)
-        options = [
-            {"text": "Try again", "isCorrect": False},
-            {"text": "Check your input", "isCorrect": False},
-            {"text": "Verify API connection", "isCorrect": False},
-            {"text": "Contact support", "isCorrect": False}
-        ]
-        options[correct_index]["isCorrect"] = True
+        results = (await run_model_call("mcqs", PRIORITY_BATCH, custom_prompt, run))["results"]
+        
+        # Parse off the event loop; one pass pulls out every well-formed question
+        output = task_output(results, "create-mcqs", "mcqs")
+        mcqs_data = await executors.run("text", parse_mcqs, output)
+        print(f"Parsed {len(mcqs_data)} MCQs from {len(str(output))} characters of model output")
         
+        if mcqs_data:
+            return {"mcqs": mcqs_data}, True
+        
+        # Create default MCQs as fallback
         default_mcqs = [
             {
-                "question": "Error occurred while generating MCQs.",
-                "options": options,
-                "explanation": "There was an error generating MCQs. Please try again with different text."
+                "question": "What is the main topic of this text?",
+                "options": [
+                    {"text": "The text content", "isCorrect": False},
+                    {"text": "Something else", "isCorrect": True},
+                    {"text": "Not related", "isCorrect": False},
+                    {"text": "None of the above", "isCorrect": False}
+                ],
+                "explanation": "This is a default question because we couldn't parse the MCQs."
+            },
+            {
+                "question": "What should you do next?",
+                "options": [
+                    {"text": "Try again", "isCorrect": False},
+                    {"text": "Check your input", "isCorrect": False},
+                    {"text": "Contact support", "isCorrect": True},
+                    {"text": "None of the above", "isCorrect": False}
+                ],
+                "explanation": "This is a default question because we couldn't parse the MCQs."
             }
         ]
-        return {"mcqs": default_mcqs}
+        return {"mcqs": default_mcqs}, False
+            
+    except UpstreamError as e:
+        print(f"Upstream error in MCQs generation: {str(e)}")
+        raise upstream_http_error(e, "generate MCQs")
+    except Exception as e:
+        # Fail the request instead of returning placeholder questions, so callers (study-pack) see the error
+        print(f"Exception in MCQs generation: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Failed to generate MCQs: {str(e)}")
+
+
+async def stream_study_items(endpoint: str, item_type: str, text: str, build_query, normalize, parse, stream_format: str, bypass_cache: bool = False, variant: str = ""):
+    """Stream flashcards or MCQs one event per item as the model finishes writing each object.
+    
+    Emits an item event ({"type": item_type, "index", "item"}) per object, then "done" with
+    the full list under the endpoint's key, or "error". A cached response is replayed as
+    a burst of item events. The done list is in index order. iointel only forwards text
+    deltas, so an object that starts in the model's very first fragment is recovered
+    from the final output instead and arrives as a late item event.
+    
+    The streamed prompt and output differ from the non-streaming endpoint's (and may
+    include items from an attempt the model later retried), so streamed lists are
+    cached under their own key.
+    """
+    key = await executors.run("text", llm_cache_key, endpoint, text, None, f"{variant}:stream")
+    started = time.perf_counter()
+    
+    def item_event(index, item):
+        return {"type": item_type, "index": index, "item": item}
+    
+    def done_event(items, cached, first_item_ms=None):
+        return {
+            "type": "done",
+            endpoint: items,
+            "cached": cached,
+            "timeToFirstItemMs": first_item_ms,
+            "totalMs": round((time.perf_counter() - started) * 1000),
+        }
+    
+    async def event_stream():
+        if not bypass_cache:
+            cached = await executors.run("io", response_cache.get, key)
+            if cached is not None:
+                print(f"Serving cached {endpoint} response as a stream")
+                for index, item in enumerate(cached[endpoint]):
+                    yield format_stream_event(item_event(index, item), stream_format)
+                yield format_stream_event(done_event(cached[endpoint], True), stream_format)
+                return
+        
+        # Overlapping requests for the same stream share one model call, like cached_llm_response
+        async with aclosing(llm_single_flight.stream(key, generate_events)) as events:
+            async for event in events:
+                yield format_stream_event(event, stream_format)
+    
+    async def generate_events():
+        items = []
+        # An item is only sent again if one pass over the output (an attempt, or the final
+        # re-parse) holds more copies of it than have been sent so far
+        sent = Counter()
+        seen = Counter()
+        
+        def new_items(value):
+            for item in iter_normalized(value, normalize):
+                identity = item_key(item)
+                seen[identity] += 1
+                if seen[identity] > sent[identity]:
+                    sent[identity] += 1
+                    yield item
+        
+        first_item_ms = None
+        scanner = JsonObjectScanner()
+        final_result = None
+        try:
+            agent = agent_registry.get(endpoint)
+            query = await build_query()
+            # Leaving the block (once every client has disconnected) cancels the model call
+            model, tokens = agent_registry.model(endpoint), estimate_tokens(query)
+            stream = upstream.stream(
+                endpoint, lambda: agent.run_stream(query), admit=lambda: model_scheduler.slot(model, PRIORITY_BATCH, tokens)
+            )
+            async with aclosing(stream):
+                async for chunk in stream:
+                    if isinstance(chunk, dict) and chunk.get("__tool_retry__"):
+                        # The model starts over; items it repeats are not sent twice
+                        scanner = JsonObjectScanner()
+                        seen.clear()
+                        continue
+                    if not isinstance(chunk, str):
+                        final_result = chunk
+                        continue
+                    
+                    # Each closing brace at depth zero completes one object
+                    for source in scanner.feed(chunk):
+                        # Wrappers like {"flashcards": [...]} only complete at the end, all items at once
+                        for item in new_items(load_object(source)):
+                            if first_item_ms is None:
+                                first_item_ms = round((time.perf_counter() - started) * 1000)
+                                print(f"{endpoint} time to first item: {first_item_ms}ms")
+                            yield item_event(len(items), item)
+                            items.append(item)
+            
+            if final_result is not None and getattr(final_result, "result", None) is not None:
+                # Send whatever the deltas missed; items keep the index they were sent with
+                final_items = await executors.run("text", parse, final_result.result)
+                seen.clear()
+                for item in new_items(final_items):
+                    yield item_event(len(items), item)
+                    items.append(item)
+            
+            if not items:
+                yield {"type": "error", "detail": f"No {endpoint} found in the model output"}
+                return
+            
+            print(f"Streamed {len(items)} {endpoint}")
+            await executors.run("io", response_cache.set, key, {endpoint: items})
+            yield done_event(items, False, first_item_ms)
+        except Exception as e:
+            print(f"Error streaming {endpoint}: {str(e)}")
+            import traceback
+            traceback.print_exc()
+            yield {"type": "error", "detail": f"Failed to generate {endpoint}: {str(e)}"}
+    
+    media_type = "text/event-stream" if stream_format == "sse" else "application/x-ndjson"
+    return StreamingResponse(
+        event_stream(),
+        media_type=media_type,
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
+@app.post("/api/flashcards/stream")
+async def generate_flashcards_stream(request: TextRequest, stream_format: str = Query("ndjson", alias="format")):
+    if stream_format not in ("ndjson", "sse"):
+        raise HTTPException(status_code=400, detail="format must be 'ndjson' or 'sse'")
+    
+    async def build_query():
+        return f"{flashcards_prompt(request.text)}\n\n{FLASHCARDS_INSTRUCTIONS}"
+    
+    return await stream_study_items(
+        "flashcards", "flashcard", request.text, build_query, normalize_flashcard, parse_flashcards,
+        stream_format, bypass_cache=request.bypassCache,
+    )
+
+@app.post("/api/mcqs/stream")
+async def generate_mcqs_stream(request: MCQRequest, stream_format: str = Query("ndjson", alias="format")):
+    if stream_format not in ("ndjson", "sse"):
+        raise HTTPException(status_code=400, detail="format must be 'ndjson' or 'sse'")
+    if request.countMode not in ("local", "model"):
+        raise HTTPException(status_code=400, detail="countMode must be 'local' or 'model'")
+    
+    async def build_query():
+        recommended_count = await recommend_mcq_count(agent_registry.get("mcqs"), request.text, request.countMode)
+        print(f"Recommended MCQ count for this content: {recommended_count}")
+        return f"{mcqs_prompt(request.text, recommended_count)}\n\n{mcqs_instructions(recommended_count)}"
+    
+    return await stream_study_items(
+        "mcqs", "mcq", request.text, build_query, normalize_mcq, parse_mcqs,
+        stream_format, bypass_cache=request.bypassCache, variant=request.countMode,
+    )
+
+@app.post("/api/study-pack")
+async def generate_study_pack(request: StudyPackRequest):
+    unknown = [part for part in request.parts if part not in STUDY_PACK_PARTS]
+    if unknown or not request.parts:
+        raise HTTPException(status_code=400, detail=f"parts must be a non-empty subset of {', '.join(STUDY_PACK_PARTS)}")
+    if request.countMode not in ("local", "model"):
+        raise HTTPException(status_code=400, detail="countMode must be 'local' or 'model'")
+    
+    # Same cache keys as the individual endpoints, so results are shared both ways
+    generators = {
+        "summary": lambda: cached_llm_response("summarize", request.text, lambda: generate_summary(request.text, request.bypassCache), bypass_cache=request.bypassCache),
+        "flashcards": lambda: cached_llm_response("flashcards", request.text, lambda: build_flashcards(request.text), bypass_cache=request.bypassCache),
+        "mcqs": lambda: cached_llm_response(
+            "mcqs",
+            request.text,
+            lambda: build_mcqs(request.text, request.countMode),
+            bypass_cache=request.bypassCache,
+            variant=request.countMode,
+        ),
+    }
+    
+    async def run_part(part):
+        started = time.perf_counter()
+        try:
+            # A timed out part keeps running behind the single-flight shield and still fills the cache
+            return await asyncio.wait_for(generators[part](), timeout=STUDY_PACK_PART_TIMEOUT), None
+        except asyncio.TimeoutError:
+            return None, f"Timed out after {STUDY_PACK_PART_TIMEOUT:g}s"
+        except HTTPException as e:
+            return None, e.detail
+        except Exception as e:
+            print(f"Error generating study pack {part}: {str(e)}")
+            return None, str(e)
+        finally:
+            timings[part] = round((time.perf_counter() - started) * 1000)
+    
+    timings = {}
+    parts = list(dict.fromkeys(request.parts))
+    outcomes = await asyncio.gather(*(run_part(part) for part in parts))
+    
+    # Each part's payload has the same shape as its own endpoint ({"summary": ...} etc.)
+    response = {part: None for part in parts}
+    errors = {}
+    for part, (result, error) in zip(parts, outcomes):
+        if error is not None:
+            errors[part] = error
+        else:
+            response.update(result)
+    
+    if len(errors) == len(parts):
+        raise HTTPException(status_code=500, detail={"errors": errors})
+    
+    response["errors"] = errors
+    response["timingsMs"] = timings
+    return response
 
 @app.post("/api/translate")
 async def translate_text(request: TranslationRequest):
-    try:
-        # Create agent and workflow
-        agent = Agent(
-            name="Translation Agent",
-            instructions="You are an assistant specialized in translation. Translate text accurately while preserving meaning and context. Support multiple languages including Tamil, Hindi, Telugu, Malayalam, Bengali, Marathi, Urdu, Gujarati, Kannada, and others.",
-            model="meta-llama/Llama-4-Maverick-17B-128E-Instruct-FP8",
-            api_key=api_key,
-            base_url="https://api.intelligence.io.solutions/api/v1"
-        )
-        
-        workflow = Workflow(objective=request.text, client_mode=False)
-        
-        # Get language display name for prompt clarity
-        language_display_names = {
-            "english": "English",
-            "tamil": "Tamil (தமிழ்)",
-            "hindi": "Hindi (हिन्दी)",
-            "french": "French (Français)",
-            "telugu": "Telugu (తెలుగు)",
-            "malayalam": "Malayalam (മലയാളം)",
-            "spanish": "Spanish (Español)",
-            "german": "German (Deutsch)",
-            "italian": "Italian (Italiano)",
-            "portuguese": "Portuguese (Português)",
-            "russian": "Russian (Русский)",
-            "japanese": "Japanese (日本語)",
-            "chinese": "Chinese (中文)",
-            "arabic": "Arabic (العربية)",
-            "korean": "Korean (한국어)",
-            "bengali": "Bengali (বাংলা)",
-            "marathi": "Marathi (मराठी)",
-            "urdu": "Urdu (اردو)",
-            "gujarati": "Gujarati (ગુજરાતી)",
-            "kannada": "Kannada (ಕನ್ನಡ)"
-        }
-        
-        target_language = language_display_names.get(request.targetLanguage, request.targetLanguage)
-        
-        # Create a custom prompt for better translation with specific language instructions
-        custom_prompt = f"""
-        Translate the following text into {target_language}:
-        
-        {request.text}
-        
-        Ensure the translation:
-        1. Maintains the original meaning and context
-        2. Uses natural phrasing in the target language
-        3. Preserves paragraph structure and formatting
-        4. Handles specialized terms appropriately
-        5. Maintains the tone of the original text
-        
-        Return only the translated text without any additional explanations or metadata.
-        """
-        
-        # Use custom task for better control over translation
-        results = (await workflow.custom(
+    return await cached_llm_response(
+        "translate",
+        request.text,
+        lambda: generate_translation(request.text, request.targetLanguage, request.bypassCache),
+        bypass_cache=request.bypassCache,
+        target_language=request.targetLanguage,
+    )
+
+# Get language display name for prompt clarity
+LANGUAGE_DISPLAY_NAMES = {
+    "english": "English",
+    "tamil": "Tamil (தமிழ்)",
+    "hindi": "Hindi (हिन्दी)",
+    "french": "French (Français)",
+    "telugu": "Telugu (తెలుగు)",
+    "malayalam": "Malayalam (മലയാളം)",
+    "spanish": "Spanish (Español)",
+    "german": "German (Deutsch)",
+    "italian": "Italian (Italiano)",
+    "portuguese": "Portuguese (Português)",
+    "russian": "Russian (Русский)",
+    "japanese": "Japanese (日本語)",
+    "chinese": "Chinese (中文)",
+    "arabic": "Arabic (العربية)",
+    "korean": "Korean (한국어)",
+    "bengali": "Bengali (বাংলা)",
+    "marathi": "Marathi (मराठी)",
+    "urdu": "Urdu (اردو)",
+    "gujarati": "Gujarati (ગુજરાતી)",
+    "kannada": "Kannada (ಕನ್ನಡ)"
+}
+
+# Separates the paragraphs of one translation request so they can be cached one by one
+SEGMENT_SEPARATOR = "<<<SEGMENT>>>"
+
+async def translate_batch(paragraphs: List[str], target_language: str):
+    """Translate several paragraphs in one model call.
+    
+    Returns one translation per paragraph, or None when the model didn't keep the
+    segment separators and the translation can't be split back into paragraphs.
+    """
+    # Borrow the pre-built agent from the registry
+    agent = agent_registry.get("translate")
+    
+    text = f"\n\n{SEGMENT_SEPARATOR}\n\n".join(paragraphs)
+    
+    # Create a custom prompt for better translation with specific language instructions
+    custom_prompt = f"""
+    Translate the following text into {target_language}:
+    
+    {text}
+    
+    Ensure the translation:
+    1. Maintains the original meaning and context
+    2. Uses natural phrasing in the target language
+    3. Preserves paragraph structure and formatting
+    4. Handles specialized terms appropriately
+    5. Maintains the tone of the original text
+    
+    Return only the translated text without any additional explanations or metadata.
+    """
+    if len(paragraphs) > 1:
+        custom_prompt += f"\nThe text is split into segments by lines containing only {SEGMENT_SEPARATOR}. Keep every one of those lines unchanged and in place.\n"
+    
+    # Use custom task for better control over translation
+    def run():
+        workflow = Workflow(objective=text, client_mode=False)
+        return workflow.custom(
             name="enhanced-translation",
             objective=custom_prompt,
             instructions=f"Translate the text into {target_language} with high quality",
             agents=[agent],
-        ).run_tasks())["results"]
-        
-        # Clean up the results
-        if isinstance(results, dict) and "enhanced-translation" in results:
-            translation = results["enhanced-translation"]
-        else:
-            translation = str(results)
-            
-        # Remove any "Translation:" prefix that might appear
-        translation = translation.replace("Translation:", "").strip()
+        ).run_tasks()
+    
+    results = (await run_model_call("translate", PRIORITY_BATCH, custom_prompt, run))["results"]
+    
+    # Clean up the results
+    if isinstance(results, dict) and "enhanced-translation" in results:
+        translation = results["enhanced-translation"]
+    else:
+        translation = str(results)
+        
+    # Remove any "Translation:" prefix that might appear
+    translation = translation.replace("Translation:", "").strip()
+    
+    if len(paragraphs) == 1:
+        return [translation]
+    
+    parts = [part.strip() for part in translation.split(SEGMENT_SEPARATOR)]
+    if len(parts) != len(paragraphs):
+        print(f"Translation batch came back with {len(parts)} of {len(paragraphs)} segments")
+        return None
+    return parts
+
+async def generate_translation(text: str, target_language_code: str, bypass_cache: bool = False):
+    """Translate paragraph by paragraph, reusing cached paragraph translations.
+    
+    Paragraphs that aren't cached are packed into batches of up to TRANSLATE_CHUNK_TOKENS
+    and translated concurrently, at most TRANSLATE_CONCURRENCY at a time. Separators and
+    page markers are kept as they are, so the structure of the text is preserved. With
+    bypass_cache every paragraph is translated again (and the cache refreshed).
+    """
+    try:
+        target_language = LANGUAGE_DISPLAY_NAMES.get(target_language_code, target_language_code)
+        segments = await executors.run("text", split_paragraphs, text)
+        paragraphs = list(dict.fromkeys(segment for segment, is_paragraph in segments if is_paragraph))
         
-        return {"translation": translation}
+        keys = await executors.run(
+            "text", lambda: {paragraph: llm_cache_key("translate", paragraph, target_language_code, "paragraph") for paragraph in paragraphs}
+        )
+        cached = {}
+        if not bypass_cache:
+            cached = await executors.run("io", lambda: {paragraph: response_cache.get(key) for paragraph, key in keys.items()})
+        translations = {paragraph: value["translation"] for paragraph, value in cached.items() if value is not None}
+        missing = [paragraph for paragraph in paragraphs if paragraph not in translations]
+        
+        batches = []
+        for paragraph in missing:
+            size = estimate_tokens(paragraph)
+            if batches and batches[-1][1] + size <= TRANSLATE_CHUNK_TOKENS:
+                batches[-1][0].append(paragraph)
+                batches[-1][1] += size
+            else:
+                batches.append([[paragraph], size])
+        print(f"Translating {len(missing)} of {len(paragraphs)} paragraphs in {len(batches)} batches ({len(translations)} cached)")
+        
+        semaphore = asyncio.Semaphore(TRANSLATE_CONCURRENCY)
+        
+        async def run_batch(batch):
+            async with semaphore:
+                results = await translate_batch(batch, target_language)
+            if results is None:
+                # The model merged or dropped separators: retry both halves concurrently, each
+                # waiting for its own slot (a single paragraph always comes back whole)
+                middle = len(batch) // 2
+                await asyncio.gather(run_batch(batch[:middle]), run_batch(batch[middle:]))
+                return
+            for paragraph, translation in zip(batch, results):
+                translations[paragraph] = translation
+                if translation:
+                    await executors.run("io", response_cache.set, keys[paragraph], {"translation": translation})
+        
+        await asyncio.gather(*(run_batch(batch) for batch, _ in batches))
+        
+        translation = "".join(translations[segment] if is_paragraph else segment for segment, is_paragraph in segments)
+        return {"translation": translation.strip()}, True
+    except UpstreamError as e:
+        raise upstream_http_error(e, "translate text")
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to translate text: {str(e)}")
 
+@app.post("/api/chat/sessions")
+async def create_chat_session(request: ChatSessionRequest):
+    if request.documentId and not document_store.has(request.documentId):
+        raise HTTPException(status_code=404, detail=f"Document {request.documentId} not found. Please upload it again")
+    
+    session = await executors.run("io", chat_sessions.create, request.context, request.documentId)
+    if request.chatHistory:
+        await executors.run("io", chat_sessions.append, session.id, *((msg.role, msg.content) for msg in request.chatHistory))
+    return {"sessionId": session.id, "expiresInSeconds": chat_sessions.ttl_seconds}
+
+@app.get("/api/chat/sessions/{session_id}")
+async def get_chat_session(session_id: str):
+    try:
+        session = await executors.run("io", chat_sessions.get, session_id)
+    except SessionNotFound:
+        raise HTTPException(status_code=404, detail=f"Chat session {session_id} not found or expired")
+    return session.to_dict()
+
+@app.delete("/api/chat/sessions/{session_id}")
+async def delete_chat_session(session_id: str):
+    try:
+        await executors.run("io", chat_sessions.delete, session_id)
+    except SessionNotFound:
+        raise HTTPException(status_code=404, detail=f"Chat session {session_id} not found or expired")
+    return {"deleted": session_id}
+
+CHAT_INSTRUCTIONS = "Provide a helpful educational response as plain text only"
+
+def chat_summary_key(folded_text: str):
+    return llm_cache_key("summarize", folded_text, None, "chat-history")
+
+async def summarize_chat_history(previous_summary: str, messages_text: str, folded_text: str):
+    # One fold of the rolling history summary, cached as the summary of the whole folded prefix
+    text = messages_text
+    if previous_summary:
+        text = f"Summary of the conversation so far:\n{previous_summary}\n\nLater messages:\n{messages_text}"
+    
+    async def generate():
+        summary = await run_summary_task(text, CHAT_SUMMARY_WORDS, PRIORITY_CHAT)
+        return {"summary": summary}, bool(summary.strip())
+    
+    return (await cached_llm_response("summarize", folded_text, generate, variant="chat-history"))["summary"]
+
+async def find_chat_summary(folded_texts):
+    # Longest folded prefix with a cached summary, so a turn never re-folds what's already summarized
+    def lookup():
+        for index, folded_text in enumerate(folded_texts):
+            cached = response_cache.get(chat_summary_key(folded_text))
+            if cached is not None:
+                return index, cached["summary"]
+        return None
+    
+    return await executors.run("io", lookup)
+
+async def get_document_index(document_id: str):
+    try:
+        page_count = await executors.run("pdf", document_store.page_count, document_id)
+    except DocumentNotFound:
+        raise HTTPException(status_code=404, detail=f"Document {document_id} not found. Please upload it again")
+    
+    # Built once per document, later turns only index pages that weren't indexed yet
+    index = retrieval_index.get(document_id)
+    missing = index.missing_pages(page_count)
+    if missing:
+        texts = await extract_pages_text(document_id, missing)
+        await executors.run("text", index.add_pages, dict(zip(missing, texts)))
+        print(f"Indexed {len(missing)} pages of {document_id}: {index.stats()}")
+    return index
+
+async def retrieve_document_passages(document_id: str, message: str, history):
+    # Follow-up questions ("what about the second one?") lean on the previous user turn
+    query = message
+    previous = [msg.content for msg in (history or []) if msg.role == "user"][-1:]
+    if previous:
+        query = f"{message}\n{previous[0]}"
+    
+    index = await get_document_index(document_id)
+    passages = []
+    used = 0
+    for score, page, text in await executors.run("text", index.search, query, CHAT_RETRIEVAL_TOP_K):
+        size = estimate_tokens(text)
+        if used + size > chat_context.context_tokens:
+            # A smaller, lower ranked passage may still fit
+            continue
+        passages.append(f"[Page {page}] {text}")
+        used += size
+    return "\n\n".join(passages)
+
+async def resolve_chat_inputs(request: ChatRequest):
+    """Return (history, context, document_id) for a chat turn, taken from the session when there is one."""
+    if not request.sessionId:
+        return request.chatHistory, request.context, request.documentId
+    try:
+        session = await executors.run("io", chat_sessions.get, request.sessionId)
+    except SessionNotFound:
+        raise HTTPException(status_code=404, detail=f"Chat session {request.sessionId} not found or expired")
+    return list(session.messages), session.context, session.document_id or request.documentId
+
+async def save_chat_turn(request: ChatRequest, response: str):
+    if request.sessionId:
+        try:
+            await executors.run("io", chat_sessions.append, request.sessionId, ("user", request.message), ("assistant", response))
+        except SessionNotFound:
+            print(f"Chat session {request.sessionId} expired before the turn could be saved")
+
+async def build_chat_prompt(request: ChatRequest):
+    # Old turns are folded into a rolling summary and long context is cut down to the
+    # relevant passages, so the prompt stays about the same size however long the chat gets
+    history, context, document_id = await resolve_chat_inputs(request)
+    if document_id:
+        # Only the passages of the document that match the question are sent
+        context = await retrieve_document_passages(document_id, request.message, history)
+    history_summary, recent_history, context_text, context_stats = await chat_context.build(
+        request.message, history, context, summarize_chat_history, find_chat_summary,
+        run_blocking=lambda fn, *args: executors.run("text", fn, *args),
+    )
+    print(f"Chat context: {context_stats}")
+    
+    chat_history_text = ""
+    if history_summary:
+        chat_history_text += f"Summary of the earlier conversation:\n{history_summary}\n\n"
+    if recent_history:
+        chat_history_text += f"Previous conversation:\n{recent_history}\n"
+    
+    prompt = f"""
+    {chat_history_text}
+    
+    User's current question: {request.message}
+    
+    Please provide a helpful, educational response to this question.
+    If the question refers to previous messages in the conversation, make sure to address those references.
+    If the question is about a specific topic, explain the key concepts clearly.
+    If it's a complex topic, break it down into simpler parts.
+    
+    FORMAT YOUR RESPONSE AS PLAIN TEXT ONLY.
+    """
+    
+    if context_text and document_id:
+        prompt += f"\n\nRelevant passages from the user's document:\n{context_text}"
+        prompt += "\n\nBase your answer on these passages when they are relevant and mention the page numbers you used."
+    elif context_text:
+        prompt += f"\n\nAdditional context provided by the user:\n{context_text}"
+    return prompt
 
 @app.post("/api/chat")
 async def chat(request: ChatRequest):
     try:
-        # Create agent and workflow
-        agent = Agent(
-            name="Chat Assistant Agent",
-            instructions="""You are a helpful study assistant that answers questions about various academic topics.
-            Provide clear, concise, and accurate answers to help the user understand the subject matter.
-            If you don't know the answer, admit it rather than making something up.
-            Use examples and analogies when appropriate to help explain complex concepts.
-            Format your responses as plain text without any JSON, markdown, or other formatting.""",
-            model="meta-llama/Llama-4-Maverick-17B-128E-Instruct-FP8",
-            api_key=api_key,
-            base_url="https://api.intelligence.io.solutions/api/v1"
-        )
-        
-        # Prepare the prompt with chat history
-        chat_history_text = ""
-        if request.chatHistory and len(request.chatHistory) > 0:
-            chat_history_text = "Previous conversation:\n"
-            for msg in request.chatHistory:
-                role = "User" if msg.role == "user" else "Assistant"
-                chat_history_text += f"{role}: {msg.content}\n"
-        
-        prompt = f"""
-        {chat_history_text}
-        
-        User's current question: {request.message}
-        
-        Please provide a helpful, educational response to this question.
-        If the question refers to previous messages in the conversation, make sure to address those references.
-        If the question is about a specific topic, explain the key concepts clearly.
-        If it's a complex topic, break it down into simpler parts.
-        
-        FORMAT YOUR RESPONSE AS PLAIN TEXT ONLY.
-        """
-        
-        if request.context:
-            prompt += f"\n\nAdditional context provided by the user:\n{request.context}"
-        
-        workflow = Workflow(objective=prompt, client_mode=False)
+        # Borrow the pre-built agent from the registry
+        agent = agent_registry.get("chat")
+        prompt = await build_chat_prompt(request)
         
         # Run custom task
-        results = (await workflow.custom(
-            name="direct-chat-response",
-            objective=prompt,
-            instructions="Provide a helpful educational response as plain text only",
-            agents=[agent],
-        ).run_tasks())["results"]
+        def run():
+            workflow = Workflow(objective=prompt, client_mode=False)
+            return workflow.custom(
+                name="direct-chat-response",
+                objective=prompt,
+                instructions=CHAT_INSTRUCTIONS,
+                agents=[agent],
+            ).run_tasks()
+        
+        results = (await run_model_call("chat", PRIORITY_CHAT, prompt, run))["results"]
         
         # Clean up the results
         clean_response = results
@@ -972,28 +1762,125 @@ async def chat(request: ChatRequest):
         if not isinstance(clean_response, str):
             clean_response = str(clean_response)
             
-        # Remove any JSON formatting that might be present
-        clean_response = clean_response.replace('```json', '').replace('```', '').strip()
-        
-        # If it still looks like JSON, try to extract the text
-        if clean_response.startswith('{') and clean_response.endswith('}'):
-            try:
-                import json
-                parsed = json.loads(clean_response)
-                for key in ["response", "text", "answer", "content", "message"]:
-                    if key in parsed:
-                        clean_response = parsed[key]
-                        break
-            except:
-                pass
+        # Remove any JSON formatting that might be present and unwrap {"response": ...} answers
+        clean_response = unwrap_json_response(clean_response)
         
+        await save_chat_turn(request, clean_response)
         return {"response": clean_response}
+    except HTTPException:
+        raise
+    except UpstreamError as e:
+        raise upstream_http_error(e, "get chat response")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to get chat response: {str(e)}")
+
+@app.post("/api/chat/stream")
+async def chat_stream(request: ChatRequest):
+    """Server-sent events version of /api/chat.
+    
+    Emits "token" events with cleaned text as the model generates it, a "reset" event
+    if the text streamed so far has to be discarded, then "done" with the full response
+    (or "error"). Clients should show the "done" response as the final text: iointel
+    only forwards text deltas, so the opening fragment of an answer can be missing from
+    the token events. Failures before the stream starts (an unknown session, an upstream
+    error while summarizing the history) are returned as plain HTTP errors, as in /api/chat.
+    
+    Unlike the study item streams, chat is neither cached nor coalesced with single-flight
+    (nor is /api/chat): every turn has its own history and is saved to its own session.
+    """
+    # Prompt building fails before anything is streamed, so it gets a proper HTTP status like /api/chat
+    try:
+        # Borrow the pre-built agent from the registry
+        agent = agent_registry.get("chat")
+        query = f"{await build_chat_prompt(request)}\n\n{CHAT_INSTRUCTIONS}"
+    except HTTPException:
+        raise
+    except UpstreamError as e:
+        raise upstream_http_error(e, "get chat response")
     except Exception as e:
+        print(f"Error preparing chat response: {str(e)}")
+        import traceback
+        traceback.print_exc()
         raise HTTPException(status_code=500, detail=f"Failed to get chat response: {str(e)}")
+    
+    async def event_stream():
+        started = time.perf_counter()
+        first_token_ms = None
+        cleaner = StreamCleaner()
+        final_result = None
+        try:
+            # Leaving the block (including on client disconnect) cancels the model call
+            model, tokens = agent_registry.model("chat"), estimate_tokens(query)
+            stream = upstream.stream(
+                "chat", lambda: agent.run_stream(query), admit=lambda: model_scheduler.slot(model, PRIORITY_CHAT, tokens)
+            )
+            async with aclosing(stream):
+                async for item in stream:
+                    if isinstance(item, str):
+                        text = cleaner.feed(item)
+                    elif isinstance(item, dict) and item.get("__tool_retry__"):
+                        # What was streamed turned out to be a misplaced tool call, start over
+                        cleaner = StreamCleaner()
+                        yield format_stream_event({"type": "reset"}, "sse")
+                        continue
+                    else:
+                        final_result = item
+                        continue
+                    
+                    if text:
+                        if first_token_ms is None:
+                            first_token_ms = round((time.perf_counter() - started) * 1000)
+                            print(f"Chat time to first token: {first_token_ms}ms")
+                        yield format_stream_event({"type": "token", "text": text}, "sse")
+            
+            text = cleaner.finish()
+            if cleaner.replaced:
+                # The whole output cleaned up differently than the streamed part suggested
+                yield format_stream_event({"type": "reset"}, "sse")
+            if text:
+                yield format_stream_event({"type": "token", "text": text}, "sse")
+            
+            response = cleaner.text
+            if final_result is not None and getattr(final_result, "result", None) is not None:
+                response = unwrap_json_response(str(final_result.result))
+            await save_chat_turn(request, response)
+            yield format_stream_event({
+                "type": "done",
+                "response": response,
+                "timeToFirstTokenMs": first_token_ms,
+                "totalMs": round((time.perf_counter() - started) * 1000),
+            }, "sse")
+        except Exception as e:
+            print(f"Error streaming chat response: {str(e)}")
+            import traceback
+            traceback.print_exc()
+            yield format_stream_event({"type": "error", "detail": f"Failed to get chat response: {str(e)}"}, "sse")
+    
+    # X-Accel-Buffering stops nginx style proxies from holding tokens back
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
 @app.get("/health")
 def health_check():
-    return {"status": "ok"}
+    return {
+        "status": "ok",
+        "documentStore": document_store.stats(),
+        "pageTextCache": page_text_cache.stats(),
+        "renderCache": page_renderer.stats(),
+        "httpClient": http_client.stats(),
+        "responseCache": response_cache.stats(),
+        "singleFlight": llm_single_flight.stats(),
+        "modelScheduler": model_scheduler.stats(),
+        "upstream": upstream.stats(),
+        "executors": executors.stats(),
+        "eventLoop": loop_monitor.stats(),
+        "agents": agent_registry.stats(),
+        "chatSessions": chat_sessions.stats(),
+        "retrievalIndex": retrieval_index.stats(),
+    }
 
 if __name__ == "__main__":
     import uvicorn
@@ -0,0 +1,189 @@
+import asyncio
+import heapq
+import itertools
+import time
+from collections import defaultdict, deque
+from contextlib import asynccontextmanager
+
+# Lower runs first: interactive chat, then OCR, then batch generation
+PRIORITY_CHAT = 0
+PRIORITY_OCR = 1
+PRIORITY_BATCH = 2
+PRIORITY_NAMES = {PRIORITY_CHAT: "chat", PRIORITY_OCR: "ocr", PRIORITY_BATCH: "batch"}
+
+
+def parse_model_limits(spec):
+    """Parse "model-a=4,model-b=2" into {"model-a": 4, "model-b": 2}."""
+    limits = {}
+    for entry in (spec or "").split(","):
+        if not entry.strip():
+            continue
+        model, _, limit = entry.rpartition("=")
+        if not model.strip():
+            raise ValueError(f"Invalid model limit {entry!r}, expected model=limit")
+        limits[model.strip()] = int(limit)
+    return limits
+
+
+class TokenBucket:
+    """Refills continuously at rate_per_minute, holding at most one minute's worth."""
+
+    def __init__(self, rate_per_minute):
+        self.rate_per_minute = rate_per_minute
+        self.capacity = float(rate_per_minute)
+        self.level = self.capacity
+        self._updated = time.monotonic()
+
+    def wait_time(self, amount):
+        """Seconds until amount can be taken (0 when it can be taken now)."""
+        if not self.rate_per_minute:
+            return 0.0
+        self._refill()
+        # A single request larger than the bucket only has to wait for a full bucket
+        missing = min(amount, self.capacity) - self.level
+        return max(missing, 0.0) * 60.0 / self.rate_per_minute
+
+    def take(self, amount):
+        if self.rate_per_minute:
+            self._refill()
+            self.level -= min(amount, self.capacity)
+
+    def _refill(self):
+        now = time.monotonic()
+        self.level = min(self.capacity, self.level + (now - self._updated) * self.rate_per_minute / 60.0)
+        self._updated = now
+
+
+class _ModelQueue:
+    def __init__(self, limit, requests_per_minute, tokens_per_minute):
+        self.limit = limit
+        self.active = 0
+        self.waiters = []  # heap of (priority, sequence, tokens, future)
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+        self.timer = None
+        self.peak_queued = 0
+
+
+class ModelScheduler:
+    """Admission control for every upstream model call.
+
+    Callers wrap a provider call in `async with scheduler.slot(model, priority, tokens)`.
+    Each model gets at most its concurrency limit of calls in flight, and an
+    optional requests-per-minute and tokens-per-minute budget (prompt tokens, as
+    the completion length isn't known up front). Waiting calls are admitted
+    strictly by priority class and then in arrival order, so chat never queues
+    behind a backlog of batch generation.
+    """
+
+    def __init__(self, default_concurrency=8, model_concurrency=None, requests_per_minute=0,
+                 tokens_per_minute=0, wait_samples=500):
+        self.default_concurrency = default_concurrency
+        self.model_concurrency = dict(model_concurrency or {})
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self._queues = {}
+        self._sequence = itertools.count()
+        self._admitted = defaultdict(int)  # priority -> calls admitted
+        self._waits = defaultdict(lambda: deque(maxlen=wait_samples))  # priority -> recent waits in seconds
+
+    @asynccontextmanager
+    async def slot(self, model, priority=PRIORITY_BATCH, tokens=0):
+        queued_at = time.perf_counter()
+        await self._acquire(model, priority, tokens)
+        self._admitted[priority] += 1
+        self._waits[priority].append(time.perf_counter() - queued_at)
+        try:
+            yield
+        finally:
+            self._release(model)
+
+    async def _acquire(self, model, priority, tokens):
+        queue = self._queue(model)
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(queue.waiters, (priority, next(self._sequence), tokens, future))
+        queue.peak_queued = max(queue.peak_queued, len(queue.waiters))
+        self._dispatch(model)
+        try:
+            await future
+        except asyncio.CancelledError:
+            # Admitted just as the caller went away: hand the slot to the next waiter
+            if future.done() and not future.cancelled():
+                self._release(model)
+            else:
+                future.cancel()
+                self._dispatch(model)
+            raise
+
+    def _release(self, model):
+        queue = self._queues[model]
+        queue.active -= 1
+        self._dispatch(model)
+
+    def _dispatch(self, model):
+        queue = self._queues[model]
+        while queue.waiters and queue.active < queue.limit:
+            _, _, tokens, future = queue.waiters[0]
+            if future.done():
+                # Cancelled while waiting
+                heapq.heappop(queue.waiters)
+                continue
+            wait = max(queue.requests.wait_time(1), queue.tokens.wait_time(tokens))
+            if wait > 0:
+                # Rate limited: look again once the buckets have refilled enough
+                if queue.timer is None:
+                    queue.timer = asyncio.get_running_loop().call_later(wait, self._on_timer, model)
+                return
+            heapq.heappop(queue.waiters)
+            queue.requests.take(1)
+            queue.tokens.take(tokens)
+            queue.active += 1
+            future.set_result(None)
+
+    def _on_timer(self, model):
+        self._queues[model].timer = None
+        self._dispatch(model)
+
+    def _queue(self, model):
+        queue = self._queues.get(model)
+        if queue is None:
+            queue = _ModelQueue(
+                self.model_concurrency.get(model, self.default_concurrency),
+                self.requests_per_minute,
+                self.tokens_per_minute,
+            )
+            self._queues[model] = queue
+        return queue
+
+    def stats(self):
+        # Called from the health check's worker thread, so work on copies
+        queues = list(self._queues.items())
+        priorities = {}
+        for priority, name in PRIORITY_NAMES.items():
+            waits = sorted(list(self._waits[priority]))
+            priorities[name] = {
+                "admitted": self._admitted[priority],
+                "queued": sum(
+                    1 for _, queue in queues
+                    for waiter in list(queue.waiters) if waiter[0] == priority and not waiter[3].done()
+                ),
+                "waitP50Ms": round(waits[len(waits) // 2] * 1000, 1) if waits else 0.0,
+                "waitP95Ms": round(waits[int(len(waits) * 0.95)] * 1000, 1) if waits else 0.0,
+                "waitMaxMs": round(waits[-1] * 1000, 1) if waits else 0.0,
+            }
+        models = {
+            model: {
+                "active": queue.active,
+                "limit": queue.limit,
+                "queued": sum(1 for waiter in list(queue.waiters) if not waiter[3].done()),
+                "peakQueued": queue.peak_queued,
+            }
+            for model, queue in queues
+        }
+        return {
+            "defaultConcurrency": self.default_concurrency,
+            "requestsPerMinute": self.requests_per_minute,
+            "tokensPerMinute": self.tokens_per_minute,
+            "priorities": priorities,
+            "models": models,
+        }
@@ -0,0 +1,92 @@
+import difflib
+import io
+
+from PIL import Image
+
+from image_preprocess import normalize_image, encode_image
+
+
+def tile_boxes(width, height, tile_height=1024, overlap=128, columns=1):
+    """Return (column, box) crops in reading order: each column top to bottom, left to right.
+
+    Neighbouring strips overlap by `overlap` pixels so a line of text cut by one
+    strip boundary appears whole in the next strip.
+    """
+    if not tile_height > overlap >= 0:
+        raise ValueError(f"tile_height must be greater than overlap >= 0, got {tile_height} and {overlap}")
+    if columns < 1:
+        raise ValueError(f"columns must be at least 1, got {columns}")
+    tile_height = max(tile_height, overlap * 2)
+    column_width = width // columns
+    step = tile_height - overlap
+
+    boxes = []
+    for column in range(columns):
+        left = column * column_width
+        right = width if column == columns - 1 else left + column_width
+        top = 0
+        while True:
+            bottom = min(top + tile_height, height)
+            boxes.append((column, (left, top, right, bottom)))
+            if bottom >= height:
+                break
+            top += step
+    return boxes
+
+
+def make_tiles(content, tile_height=1024, overlap=128, columns=1, max_edge=4096,
+               output_format="jpeg", quality=85, grayscale="auto"):
+    """Split an image into overlapping strips. Returns ([(column, encoded tile)], media_type)."""
+    image = normalize_image(Image.open(io.BytesIO(content)), grayscale)
+    # Tiles keep more resolution than the single-request path, that's the point of tiling
+    if max(image.size) > max_edge:
+        image.thumbnail((max_edge, max_edge), Image.LANCZOS)
+
+    tiles = []
+    media_type = None
+    for column, box in tile_boxes(image.width, image.height, tile_height, overlap, columns):
+        tile, media_type = encode_image(image.crop(box), output_format, quality)
+        tiles.append((column, tile))
+    return tiles, media_type
+
+
+def _normalize_line(line):
+    return " ".join(line.lower().split())
+
+
+def _lines_match(a, b):
+    if a == b:
+        return True
+    # OCR of the same line can differ slightly between strips, but short lines
+    # like "Step 2" / "Step 3" must not be merged, so only fuzzy-match long ones
+    return min(len(a), len(b)) >= 20 and difflib.SequenceMatcher(None, a, b).ratio() >= 0.9
+
+
+def _overlap_length(previous, current, max_lines):
+    """Number of leading lines of `current` that repeat the tail of `previous`."""
+    for size in range(min(max_lines, len(previous), len(current)), 0, -1):
+        tail = previous[-size:]
+        # The first line of a strip is often a half-cut line, so allow skipping it
+        for skip in (0, 1):
+            head = current[skip:skip + size]
+            if len(head) == size and all(_lines_match(a, b) for a, b in zip(tail, head)):
+                return skip + size
+    return 0
+
+
+def stitch_texts(texts, max_overlap_lines=8):
+    """Join the text of consecutive tiles, dropping lines repeated across an overlap.
+
+    Only non-blank lines are matched and dropped, blank lines (paragraph breaks) are kept.
+    """
+    stitched = []
+    normalized = []  # non-blank lines kept so far
+    for text in texts:
+        lines = [line.rstrip() for line in text.strip().splitlines()]
+        content = [index for index, line in enumerate(lines) if line.strip()]
+        current = [_normalize_line(lines[index]) for index in content]
+        drop = _overlap_length(normalized, current, max_overlap_lines) if normalized else 0
+        # Skip through the last repeated line, along with any blank lines inside the overlap
+        stitched.extend(lines[content[drop - 1] + 1 if drop else 0:])
+        normalized.extend(current[drop:])
+    return "\n".join(stitched)
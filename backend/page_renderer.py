@@ -0,0 +1,157 @@
+import io
+import threading
+from collections import OrderedDict
+
+from PIL import Image, ImageDraw, ImageFont
+
+try:
+    import pypdfium2 as pdfium
+except ImportError:  # Optional, without it we fall back to the text preview
+    pdfium = None
+
+# format name -> (Pillow format, media type)
+IMAGE_FORMATS = {
+    "png": ("PNG", "image/png"),
+    "jpeg": ("JPEG", "image/jpeg"),
+    "webp": ("WEBP", "image/webp"),
+}
+
+MIN_DPI, MAX_DPI = 36, 300
+MIN_WIDTH, MAX_WIDTH = 32, 2400
+
+
+class PageRenderer:
+    """Renders PDF pages to images and keeps a bounded LRU cache of the results.
+
+    Pages are rasterized with pypdfium2 when it is installed. Otherwise (or with
+    mode="text") we draw the page's extracted text onto a blank canvas, which is
+    what /api/pdf-to-image always did before.
+    """
+
+    def __init__(self, max_cache_bytes=128 * 1024 * 1024, max_open_documents=4):
+        self.max_cache_bytes = max_cache_bytes
+        self.max_open_documents = max_open_documents
+        self.hits = 0
+        self.misses = 0
+        self._cache = OrderedDict()  # cache key -> encoded image bytes
+        self._cache_bytes = 0
+        self._cache_lock = threading.Lock()
+        # pdfium is not thread-safe, every call into it goes through this lock
+        self._pdfium_lock = threading.Lock()
+        self._documents = OrderedDict()  # path -> pdfium.PdfDocument
+        self._font = None
+
+    @property
+    def can_rasterize(self):
+        return pdfium is not None
+
+    @staticmethod
+    def cache_key(document_id, page, dpi, image_format, width, mode):
+        return f"{document_id}:{page}:{dpi}:{width or 0}:{image_format}:{mode}"
+
+    def get_cached(self, key):
+        with self._cache_lock:
+            content = self._cache.get(key)
+            if content is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._cache.move_to_end(key)
+            return content
+
+    def store(self, key, content):
+        with self._cache_lock:
+            if key in self._cache:
+                return
+            self._cache[key] = content
+            self._cache_bytes += len(content)
+            while len(self._cache) > 1 and self._cache_bytes > self.max_cache_bytes:
+                _, evicted = self._cache.popitem(last=False)
+                self._cache_bytes -= len(evicted)
+
+    def render(self, path, page, dpi=96, image_format="png", width=None):
+        """Rasterize a 1-based page of the PDF at path. Blocking, run it off the event loop."""
+        return self.render_many(path, [page], dpi, image_format, width)[page]
+
+    def render_many(self, path, pages, dpi=96, image_format="png", width=None):
+        """Rasterize several pages in one pass over the document. Returns {page: bytes}."""
+        rendered = {}
+        for page in pages:
+            # Hold the pdfium lock only while rasterizing, other renders can go ahead while we encode
+            with self._pdfium_lock:
+                pdf_page = self._open_document(path)[page - 1]
+                bitmap = None
+                try:
+                    # An explicit width (thumbnails) takes precedence over the DPI
+                    scale = width / pdf_page.get_width() if width else dpi / 72
+                    bitmap = pdf_page.render(scale=scale)
+                    # Copy out of pdfium's buffer so the bitmap can be freed under the lock
+                    image = bitmap.to_pil().copy()
+                finally:
+                    if bitmap is not None:
+                        bitmap.close()
+                    pdf_page.close()
+            # Encode right away so only one full-size bitmap is alive at a time
+            rendered[page] = self.encode(image, image_format)
+        return rendered
+
+    def render_text_preview(self, text, page, image_format="png", width=None):
+        """Draw the extracted text of a page onto a blank canvas."""
+        img = Image.new('RGB', (800, 1000), color=(255, 255, 255))
+        d = ImageDraw.Draw(img)
+        d.text((20, 20), f"Page {page}\n\n{text}", fill=(0, 0, 0), font=self._get_font())
+        if width:
+            img = img.resize((width, round(1000 * width / 800)))
+        return self.encode(img, image_format)
+
+    @staticmethod
+    def encode(image, image_format):
+        pil_format, _ = IMAGE_FORMATS[image_format]
+        if image.mode not in ("RGB", "L"):
+            image = image.convert("RGB")
+        output = io.BytesIO()
+        if pil_format == "PNG":
+            image.save(output, format=pil_format, optimize=False)
+        else:
+            image.save(output, format=pil_format, quality=80)
+        return output.getvalue()
+
+    def stats(self):
+        with self._cache_lock:
+            lookups = self.hits + self.misses
+            return {
+                "rasterizer": "pdfium" if self.can_rasterize else "text",
+                "hits": self.hits,
+                "misses": self.misses,
+                "hitRate": round(self.hits / lookups, 3) if lookups else 0.0,
+                "entries": len(self._cache),
+                "sizeBytes": self._cache_bytes,
+                "maxBytes": self.max_cache_bytes,
+            }
+
+    def close(self):
+        with self._pdfium_lock:
+            for document in self._documents.values():
+                document.close()
+            self._documents.clear()
+
+    def _open_document(self, path):
+        document = self._documents.get(path)
+        if document is not None:
+            self._documents.move_to_end(path)
+            return document
+        document = pdfium.PdfDocument(path)
+        self._documents[path] = document
+        while len(self._documents) > self.max_open_documents:
+            _, evicted = self._documents.popitem(last=False)
+            evicted.close()
+        return document
+
+    def _get_font(self):
+        # Loading the TrueType font is slow, so do it once
+        if self._font is None:
+            try:
+                self._font = ImageFont.truetype("arial.ttf", 16)
+            except OSError:
+                self._font = ImageFont.load_default()
+        return self._font
@@ -0,0 +1,148 @@
+import os
+import sqlite3
+import threading
+import time
+
+
+class PageTextCache:
+    """Persistent cache of extracted page text keyed by (document ID, page number).
+
+    Entries live in a local SQLite file so extraction survives restarts. When the
+    stored text grows past max_bytes the least recently used pages are evicted.
+    """
+
+    def __init__(self, path, max_bytes=256 * 1024 * 1024):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS page_text (
+                document_id TEXT NOT NULL,
+                page INTEGER NOT NULL,
+                text TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                last_used REAL NOT NULL,
+                PRIMARY KEY (document_id, page)
+            )"""
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS page_text_last_used ON page_text (last_used)")
+        self._conn.commit()
+        self._size = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM page_text").fetchone()[0]
+
+    def get(self, document_id, page):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT text FROM page_text WHERE document_id = ? AND page = ?",
+                (document_id, page),
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+
+            self.hits += 1
+            self._conn.execute(
+                "UPDATE page_text SET last_used = ? WHERE document_id = ? AND page = ?",
+                (time.time(), document_id, page),
+            )
+            self._conn.commit()
+            return row[0]
+
+    def get_many(self, document_id, pages):
+        """Return a {page: text} dict for the pages that are already cached."""
+        pages = list(pages)
+        found = {}
+        with self._lock:
+            # Stay well below SQLite's bound-parameter limit
+            for start in range(0, len(pages), 500):
+                batch = pages[start:start + 500]
+                placeholders = ",".join("?" * len(batch))
+                rows = self._conn.execute(
+                    f"SELECT page, text FROM page_text WHERE document_id = ? AND page IN ({placeholders})",
+                    (document_id, *batch),
+                ).fetchall()
+                found.update(rows)
+
+            if found:
+                self._conn.executemany(
+                    "UPDATE page_text SET last_used = ? WHERE document_id = ? AND page = ?",
+                    [(time.time(), document_id, page) for page in found],
+                )
+                self._conn.commit()
+
+            self.hits += len(found)
+            self.misses += len(pages) - len(found)
+        return found
+
+    def cached_pages(self, document_id):
+        """Return the set of page numbers cached for a document, without loading their text."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT page FROM page_text WHERE document_id = ?", (document_id,)
+            ).fetchall()
+        return {row[0] for row in rows}
+
+    def put(self, document_id, page, text):
+        self.put_many(document_id, {page: text})
+
+    def put_many(self, document_id, texts):
+        if not texts:
+            return
+        now = time.time()
+        with self._lock:
+            for page, text in texts.items():
+                size = len(text.encode("utf-8"))
+                previous = self._conn.execute(
+                    "SELECT size FROM page_text WHERE document_id = ? AND page = ?",
+                    (document_id, page),
+                ).fetchone()
+                if previous:
+                    self._size -= previous[0]
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO page_text (document_id, page, text, size, last_used) VALUES (?, ?, ?, ?, ?)",
+                    (document_id, page, text, size, now),
+                )
+                self._size += size
+            self._evict()
+            self._conn.commit()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hitRate": round(self.hits / lookups, 3) if lookups else 0.0,
+                "evictions": self.evictions,
+                "sizeBytes": self._size,
+                "maxBytes": self.max_bytes,
+            }
+
+    def _evict(self):
+        if self._size <= self.max_bytes:
+            return
+        # Trim to 90% of the budget so we don't evict on every insert
+        target = int(self.max_bytes * 0.9)
+        rows = self._conn.execute(
+            "SELECT document_id, page, size FROM page_text ORDER BY last_used ASC"
+        )
+        evicted = []
+        for document_id, page, size in rows:
+            if self._size <= target:
+                break
+            evicted.append((document_id, page))
+            self._size -= size
+        self._conn.executemany(
+            "DELETE FROM page_text WHERE document_id = ? AND page = ?", evicted
+        )
+        self.evictions += len(evicted)
@@ -0,0 +1,116 @@
+import asyncio
+import itertools
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from PyPDF2 import PdfReader
+
+# Each worker process keeps the last document it opened, so consecutive chunks
+# of the same PDF only parse the xref table once per worker
+_worker_reader = (None, None)
+
+
+def _open_reader(path):
+    global _worker_reader
+    cached_path, reader = _worker_reader
+    if cached_path != path:
+        reader = PdfReader(path)
+        _worker_reader = (path, reader)
+    return reader
+
+
+def _extract_with_reader(reader, pages):
+    return [(page, reader.pages[page - 1].extract_text()) for page in pages]
+
+
+def extract_pages(path, pages):
+    """Extract text for the given 1-based page numbers. Runs inside a worker process."""
+    return _extract_with_reader(_open_reader(path), pages)
+
+
+def chunk_pages(pages, chunk_size):
+    pages = list(pages)
+    return [pages[i:i + chunk_size] for i in range(0, len(pages), chunk_size)]
+
+
+class PageExtractor:
+    """Extracts PDF page text on a process pool.
+
+    The page range is split into chunks of chunk_size pages; every worker opens
+    the document from the document store's file on disk rather than receiving
+    the bytes over a pipe, and results are reassembled in page order.
+    """
+
+    def __init__(self, workers=None, chunk_size=16):
+        self.workers = workers if workers is not None else (os.cpu_count() or 1)
+        self.chunk_size = max(1, chunk_size)
+        self._executor = None
+
+    def _get_executor(self):
+        if self._executor is None and self.workers > 0:
+            self._executor = ProcessPoolExecutor(max_workers=self.workers)
+        return self._executor
+
+    async def extract(self, path, pages):
+        """Return a {page: text} dict for the requested pages without blocking the event loop."""
+        chunks = chunk_pages(pages, self.chunk_size)
+        if not chunks:
+            return {}
+
+        loop = asyncio.get_running_loop()
+        executor = self._get_executor()
+        if executor is None:
+            # Process pool disabled, extract in a single background thread.
+            # PdfReader is not thread-safe, so the fallback uses its own reader
+            reader = await asyncio.to_thread(PdfReader, path)
+            results = [await asyncio.to_thread(_extract_with_reader, reader, pages)]
+        else:
+            results = await asyncio.gather(*(loop.run_in_executor(executor, extract_pages, path, chunk) for chunk in chunks))
+
+        return {page: text for chunk_result in results for page, text in chunk_result}
+
+    async def iter_extract(self, path, pages, max_pending=None):
+        """Yield (page, text) pairs in page order as soon as each chunk is done.
+
+        At most max_pending chunks are in flight at once, so memory stays bounded
+        no matter how many pages the document has.
+        """
+        pages = list(pages)
+        if not pages:
+            return
+
+        # A single-page first chunk gets the first page back as quickly as possible
+        chunks = iter([pages[:1]] + chunk_pages(pages[1:], self.chunk_size))
+
+        loop = asyncio.get_running_loop()
+        executor = self._get_executor()
+        if executor is None:
+            reader = await asyncio.to_thread(PdfReader, path)
+            for chunk in chunks:
+                for item in await asyncio.to_thread(_extract_with_reader, reader, chunk):
+                    yield item
+            return
+
+        max_pending = max_pending or max(2, self.workers * 2)
+        pending = deque(
+            loop.run_in_executor(executor, extract_pages, path, chunk)
+            for chunk in itertools.islice(chunks, max_pending)
+        )
+        try:
+            while pending:
+                result = await pending.popleft()
+                next_chunk = next(chunks, None)
+                if next_chunk is not None:
+                    pending.append(loop.run_in_executor(executor, extract_pages, path, next_chunk))
+                for item in result:
+                    yield item
+        finally:
+            # The client went away or something failed, drop the queued chunks
+            for future in pending:
+                future.cancel()
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
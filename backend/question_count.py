@@ -0,0 +1,69 @@
+import re
+
+MIN_QUESTIONS = 3
+MAX_QUESTIONS = 30
+
+_SENTENCE_END = re.compile(r"[.!?]+(?:\s|$)")
+_WORD = re.compile(r"[^\W\d_][\w'-]*", re.UNICODE)
+_NUMBER = re.compile(r"\b\d[\d,.]*\b")
+_PAGE_MARKER = re.compile(r"^--- Page \d+ ---$")
+_NUMBERED_HEADING = re.compile(r"^(?:\d+(?:\.\d+)*\.?|[IVXLC]+\.|Chapter\s+\w+|Section\s+\w+)\s+\S", re.IGNORECASE)
+
+# Very common words that say nothing about how many distinct facts a text has
+STOPWORDS = frozenset("""
+a about above after again against all also am an and any are as at be because been before being
+below between both but by can could did do does doing down during each few for from further had has
+have having he her here hers herself him himself his how i if in into is it its itself just more most
+my myself no nor not now of off on once only or other our ours ourselves out over own same she should
+so some such than that the their theirs them themselves then there these they this those through to
+too under until up very was we were what when where which while who whom why will with would you your
+yours yourself yourselves may might must shall upon within without however therefore thus also
+""".split())
+
+
+def _is_heading(line):
+    if _PAGE_MARKER.match(line):
+        return False
+    if line.startswith("#") or line.endswith(":"):
+        return True
+    if len(line) > 80 or line.endswith((".", "!", "?", ",", ";")):
+        return False
+    if _NUMBERED_HEADING.match(line):
+        return True
+    words = _WORD.findall(line)
+    # Short Title Case or ALL CAPS lines
+    return 0 < len(words) <= 10 and (line.isupper() or all(word[0].isupper() for word in words if len(word) > 3))
+
+
+def text_features(text):
+    lines = [line.strip() for line in text.splitlines() if line.strip()]
+    words = _WORD.findall(text)
+    terms = {word.lower() for word in words if len(word) > 3 and word.lower() not in STOPWORDS}
+    return {
+        "words": len(words),
+        "sentences": max(1, len(_SENTENCE_END.findall(text))) if words else 0,
+        "distinctTerms": len(terms),
+        "numbers": len(set(_NUMBER.findall(text))),
+        "headings": sum(1 for line in lines if _is_heading(line)),
+    }
+
+
+def estimate_question_count(text):
+    """Deterministically estimate how many MCQs a text supports (3-30).
+
+    Replaces the "analyze-content" model call. Longer texts, more sentences and
+    more distinct terms all add questions, and each heading suggests a topic
+    that deserves at least part of a question.
+    """
+    features = text_features(text)
+    if not features["words"]:
+        return MIN_QUESTIONS
+
+    by_length = features["words"] / 120
+    by_sentences = features["sentences"] / 4
+    by_terms = features["distinctTerms"] / 12
+    by_facts = min(features["numbers"], 20) / 10
+    estimate = 0.4 * by_length + 0.3 * by_sentences + 0.3 * by_terms + by_facts
+    estimate += 0.5 * min(features["headings"], 10)
+
+    return max(MIN_QUESTIONS, min(MAX_QUESTIONS, round(estimate)))
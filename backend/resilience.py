@@ -0,0 +1,285 @@
+import asyncio
+import random
+import time
+from collections import defaultdict, deque
+from contextlib import AsyncExitStack
+from email.utils import parsedate_to_datetime
+
+import aiohttp
+
+try:
+    # Errors raised through iointel: pydantic_ai wraps the openai client, which uses httpx
+    import httpx
+    import openai
+    from pydantic_ai.exceptions import ModelAPIError, ModelHTTPError
+except ImportError:  # Optional, without them only aiohttp and UpstreamError failures are classified
+    httpx = openai = ModelAPIError = ModelHTTPError = None
+
+# Failures that carry a provider status code as .status_code
+_STATUS_CODE_ERRORS = tuple(cls for cls in (
+    getattr(openai, "APIStatusError", None),
+    ModelHTTPError,
+) if cls is not None)
+# Failures to reach the provider at all, retried like a 503
+_CONNECTION_ERRORS = (ConnectionError, asyncio.TimeoutError, aiohttp.ClientConnectionError) + tuple(cls for cls in (
+    getattr(openai, "APIConnectionError", None),
+    getattr(httpx, "TransportError", None),
+) if cls is not None)
+
+RETRYABLE_STATUSES = {408, 429, 500, 502, 503, 504}
+
+_END = object()
+
+
+class UpstreamError(Exception):
+    """A failed provider response, with its HTTP status and Retry-After (seconds) if any."""
+
+    def __init__(self, status, message="", retry_after=None):
+        super().__init__(message or f"Upstream returned {status}")
+        self.status = status
+        self.retry_after = retry_after
+
+
+class UpstreamTimeout(UpstreamError):
+    def __init__(self, endpoint, deadline):
+        super().__init__(504, f"{endpoint} did not finish within {deadline:g}s")
+
+
+def parse_retry_after(value):
+    """Retry-After is either a number of seconds or an HTTP date."""
+    if not value:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        return max(parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+
+def error_status(exc):
+    """HTTP status of an upstream failure, or None if exc isn't one of the known client errors."""
+    if isinstance(exc, UpstreamError):
+        return exc.status
+    if isinstance(exc, aiohttp.ClientResponseError):
+        return exc.status
+    if _STATUS_CODE_ERRORS and isinstance(exc, _STATUS_CODE_ERRORS):
+        return exc.status_code
+    if isinstance(exc, _CONNECTION_ERRORS):
+        return 503
+    # pydantic_ai re-raises openai connection failures as ModelAPIError
+    if ModelAPIError is not None and isinstance(exc, ModelAPIError) and exc.__cause__ is not None:
+        return error_status(exc.__cause__)
+    return None
+
+
+def error_retry_after(exc):
+    retry_after = getattr(exc, "retry_after", None)
+    if retry_after is not None:
+        return retry_after
+    # openai style errors carry the response
+    headers = getattr(getattr(exc, "response", None), "headers", None)
+    return parse_retry_after(headers.get("retry-after")) if headers else None
+
+
+class ResilientCaller:
+    """Deadlines, retries and hedging around upstream model calls.
+
+    call(endpoint, attempt) runs attempt() (a coroutine factory making one
+    provider call) until it succeeds or the endpoint's deadline passes. 429 and
+    5xx failures are retried with full-jitter exponential backoff, waiting at
+    least as long as the provider's Retry-After. For endpoints listed in
+    hedge_endpoints, a second attempt is started when the first has been running
+    longer than the endpoint's recent p95 latency, and whichever finishes first
+    wins. stream() does the same for streamed calls, minus the hedging.
+
+    Given admit (a factory for the context manager that admits one attempt, i.e.
+    a scheduler slot), the deadline starts once the first attempt is admitted:
+    time spent queued behind our own calls is not the provider being slow.
+    """
+
+    def __init__(self, deadlines=None, default_deadline=120.0, max_attempts=3, base_delay=0.5, max_delay=8.0,
+                 hedge_endpoints=(), hedge_quantile=0.95, hedge_min_samples=20, latency_samples=200,
+                 first_chunk_timeout=30.0):
+        self.deadlines = dict(deadlines or {})
+        self.default_deadline = default_deadline
+        self.first_chunk_timeout = first_chunk_timeout
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.hedge_endpoints = set(hedge_endpoints)
+        self.hedge_quantile = hedge_quantile
+        self.hedge_min_samples = hedge_min_samples
+        self._latencies = defaultdict(lambda: deque(maxlen=latency_samples))
+        self._counts = defaultdict(lambda: defaultdict(int))  # endpoint -> counter -> value
+
+    def deadline(self, endpoint):
+        return self.deadlines.get(endpoint, self.default_deadline)
+
+    async def call(self, endpoint, attempt, admit=None):
+        deadline = self.deadline(endpoint)
+        counts = self._counts[endpoint]
+        counts["calls"] += 1
+        try:
+            async with asyncio.timeout(None if admit else deadline) as timeout:
+                if admit is not None:
+                    attempt = self._admitted(attempt, admit, timeout, deadline)
+                return await self._retry(endpoint, attempt)
+        except TimeoutError:
+            counts["timeouts"] += 1
+            raise UpstreamTimeout(endpoint, deadline) from None
+        except UpstreamError:
+            counts["failures"] += 1
+            raise
+        except Exception as e:
+            counts["failures"] += 1
+            # Provider failures leave as UpstreamError whichever client raised them, so handlers map them one way
+            status = error_status(e)
+            if status is None:
+                raise
+            raise UpstreamError(status, str(e), error_retry_after(e)) from e
+
+    async def _retry(self, endpoint, attempt):
+        counts = self._counts[endpoint]
+        for number in range(1, self.max_attempts + 1):
+            try:
+                return await self._hedged(endpoint, attempt)
+            except Exception as e:
+                status = error_status(e)
+                if status not in RETRYABLE_STATUSES or number == self.max_attempts:
+                    raise
+                delay = self._backoff(number, e)
+                counts["retries"] += 1
+                print(f"{endpoint} upstream call failed with {status}, retrying in {delay:.2f}s ({number}/{self.max_attempts})")
+                await asyncio.sleep(delay)
+
+    def _backoff(self, number, error):
+        # Full jitter, but never sooner than the provider asked for
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** (number - 1)))
+        retry_after = error_retry_after(error)
+        return delay if retry_after is None else max(delay, retry_after)
+
+    @staticmethod
+    def _admitted(attempt, admit, timeout, deadline):
+        async def run():
+            async with admit():
+                if timeout.when() is None:
+                    timeout.reschedule(asyncio.get_running_loop().time() + deadline)
+                return await attempt()
+        return run
+
+    async def stream(self, endpoint, open_stream, admit=None):
+        """Yield the chunks of a streamed upstream call.
+
+        open_stream() returns an async context manager over the chunks, like
+        agent.run_stream(query). The whole stream has the endpoint's deadline, and
+        the first chunk has to arrive within first_chunk_timeout. Until it does, a
+        failed or silent attempt is retried like call() retries; after that a
+        failure ends the stream, as chunks already passed on can't be taken back.
+        Failures leave as UpstreamError, or UpstreamTimeout for the deadline.
+        """
+        deadline = self.deadline(endpoint)
+        counts = self._counts[endpoint]
+        counts["calls"] += 1
+        loop = asyncio.get_running_loop()
+        expires = None
+        for number in range(1, self.max_attempts + 1):
+            received = False
+            try:
+                async with AsyncExitStack() as stack:
+                    if admit is not None:
+                        await stack.enter_async_context(admit())
+                    if expires is None:
+                        expires = loop.time() + deadline
+                    first_by = min(expires, loop.time() + self.first_chunk_timeout)
+                    # Timeouts only ever wrap our own awaits: one spanning a yield would cancel the consumer instead
+                    async with asyncio.timeout_at(first_by):
+                        chunks = aiter(await stack.enter_async_context(open_stream()))
+                    while True:
+                        async with asyncio.timeout_at(expires if received else first_by):
+                            chunk = await anext(chunks, _END)
+                        if chunk is _END:
+                            return
+                        received = True
+                        yield chunk
+            except TimeoutError:
+                if received or expires is None or loop.time() >= expires:
+                    counts["timeouts"] += 1
+                    raise UpstreamTimeout(endpoint, deadline) from None
+                error = UpstreamError(504, f"{endpoint} sent nothing within {self.first_chunk_timeout:g}s")
+            except UpstreamError as e:
+                error = e
+            except Exception as e:
+                status = error_status(e)
+                if status is None:
+                    counts["failures"] += 1
+                    raise
+                error = UpstreamError(status, str(e), error_retry_after(e))
+                error.__cause__ = e
+            if received or error.status not in RETRYABLE_STATUSES or number == self.max_attempts:
+                counts["failures"] += 1
+                raise error
+            delay = self._backoff(number, error)
+            if loop.time() + delay >= expires:
+                counts["timeouts"] += 1
+                raise UpstreamTimeout(endpoint, deadline) from error
+            counts["retries"] += 1
+            print(f"{endpoint} upstream stream failed with {error.status} before its first chunk, retrying in {delay:.2f}s ({number}/{self.max_attempts})")
+            await asyncio.sleep(delay)
+
+    async def _hedged(self, endpoint, attempt):
+        hedge_delay = self._hedge_delay(endpoint)
+        started = time.perf_counter()
+        if hedge_delay is None:
+            result = await attempt()
+            self._latencies[endpoint].append(time.perf_counter() - started)
+            return result
+
+        first = asyncio.ensure_future(attempt())
+        tasks = [first]
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=hedge_delay)
+            if not done:
+                self._counts[endpoint]["hedges"] += 1
+                tasks.append(asyncio.ensure_future(attempt()))
+            while True:
+                done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+                winner = next((task for task in done if not task.cancelled() and task.exception() is None), None)
+                if winner is not None:
+                    if winner is not first:
+                        self._counts[endpoint]["hedgeWins"] += 1
+                    self._latencies[endpoint].append(time.perf_counter() - started)
+                    return winner.result()
+                # A failed attempt only counts once every attempt has failed
+                tasks = [task for task in tasks if task not in done]
+                if not tasks:
+                    failed = [task for task in done if not task.cancelled()]
+                    raise failed[0].exception() if failed else asyncio.CancelledError()
+        finally:
+            for task in tasks:
+                task.cancel()
+            # Wait for the losers to unwind so their exceptions are retrieved, not logged as never retrieved
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    def _hedge_delay(self, endpoint):
+        if endpoint not in self.hedge_endpoints:
+            return None
+        latencies = sorted(self._latencies[endpoint])
+        if len(latencies) < self.hedge_min_samples:
+            return None
+        return latencies[min(int(len(latencies) * self.hedge_quantile), len(latencies) - 1)]
+
+    def stats(self):
+        endpoints = {}
+        for endpoint, counts in list(self._counts.items()):
+            latencies = sorted(list(self._latencies[endpoint]))
+            endpoints[endpoint] = {
+                **counts,
+                "deadlineSeconds": self.deadline(endpoint),
+                "hedged": endpoint in self.hedge_endpoints,
+                "latencyP95Ms": round(latencies[int(len(latencies) * 0.95)] * 1000, 1) if latencies else 0.0,
+                "latencyP99Ms": round(latencies[int(len(latencies) * 0.99)] * 1000, 1) if latencies else 0.0,
+            }
+        return {"maxAttempts": self.max_attempts, "endpoints": endpoints}
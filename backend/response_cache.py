@@ -0,0 +1,152 @@
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+
+_HORIZONTAL_WHITESPACE = re.compile(r"[ \t\f\v ]+")
+_EXTRA_BLANK_LINES = re.compile(r"\n{3,}")
+
+
+def normalize_text(text):
+    """Normalize text for cache keys without changing its paragraph structure."""
+    text = unicodedata.normalize("NFC", text).replace("\r\n", "\n").replace("\r", "\n")
+    lines = [_HORIZONTAL_WHITESPACE.sub(" ", line).strip() for line in text.split("\n")]
+    return _EXTRA_BLANK_LINES.sub("\n\n", "\n".join(lines)).strip()
+
+
+class ResponseCache:
+    """Two-tier TTL/LRU cache for LLM endpoint responses.
+
+    The in-process tier is an OrderedDict bounded by entry count. The optional
+    disk tier is a local SQLite file that survives restarts and is shared by all
+    workers on the machine; disk hits are promoted back into memory. Values are
+    kept serialized in both tiers, so every get() returns a fresh copy that the
+    caller is free to modify.
+    """
+
+    def __init__(self, max_entries=1024, ttl_seconds=7 * 24 * 3600, disk_path=None, disk_max_entries=50000,
+                 prune_interval=300):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.disk_path = disk_path
+        self.disk_max_entries = disk_max_entries
+        self.prune_interval = prune_interval
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._memory = OrderedDict()  # key -> (expires_at, value as JSON)
+        self._lock = threading.Lock()
+        self._conn = None
+        self._disk_entries = 0  # upper bound, replaced keys are counted twice until the next prune
+        self._last_prune = time.time()
+
+        if disk_path:
+            directory = os.path.dirname(disk_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._conn = sqlite3.connect(disk_path, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute(
+                """CREATE TABLE IF NOT EXISTS responses (
+                    key TEXT PRIMARY KEY,
+                    value TEXT NOT NULL,
+                    expires_at REAL NOT NULL,
+                    last_used REAL NOT NULL
+                )"""
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS responses_last_used ON responses (last_used)")
+            self._conn.commit()
+            self._disk_entries = self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+
+    @staticmethod
+    def make_key(endpoint, model, prompt_version, text, target_language=None):
+        payload = json.dumps(
+            [endpoint, model, prompt_version, normalize_text(text), (target_language or "").lower()],
+            ensure_ascii=False,
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key):
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                expires_at, serialized = entry
+                if expires_at > now:
+                    self._memory.move_to_end(key)
+                    self.memory_hits += 1
+                    return json.loads(serialized)
+                del self._memory[key]
+
+            if self._conn is not None:
+                row = self._conn.execute(
+                    "SELECT value, expires_at FROM responses WHERE key = ?", (key,)
+                ).fetchone()
+                if row is not None:
+                    if row[1] > now:
+                        self._conn.execute("UPDATE responses SET last_used = ? WHERE key = ?", (now, key))
+                        self._conn.commit()
+                        self._remember(key, row[1], row[0])
+                        self.disk_hits += 1
+                        return json.loads(row[0])
+                    self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                    self._conn.commit()
+
+            self.misses += 1
+            return None
+
+    def set(self, key, value):
+        now = time.time()
+        expires_at = now + self.ttl_seconds
+        serialized = json.dumps(value, ensure_ascii=False)
+        with self._lock:
+            self._remember(key, expires_at, serialized)
+            if self._conn is not None:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO responses (key, value, expires_at, last_used) VALUES (?, ?, ?, ?)",
+                    (key, serialized, expires_at, now),
+                )
+                self._disk_entries += 1
+                # Only prune once the table may be over budget, or now and then to drop expired rows
+                if self._disk_entries > self.disk_max_entries or now - self._last_prune >= self.prune_interval:
+                    self._prune_disk(now)
+                self._conn.commit()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.memory_hits + self.disk_hits + self.misses
+            return {
+                "memoryHits": self.memory_hits,
+                "diskHits": self.disk_hits,
+                "misses": self.misses,
+                "hitRate": round((self.memory_hits + self.disk_hits) / lookups, 3) if lookups else 0.0,
+                "memoryEntries": len(self._memory),
+                "maxEntries": self.max_entries,
+                "diskEnabled": self._conn is not None,
+            }
+
+    def _remember(self, key, expires_at, serialized):
+        self._memory[key] = (expires_at, serialized)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def _prune_disk(self, now):
+        self._last_prune = now
+        self._conn.execute("DELETE FROM responses WHERE expires_at <= ?", (now,))
+        count = self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+        if count > self.disk_max_entries:
+            # Trim to 90% of the budget so we don't prune on every insert
+            excess = count - int(self.disk_max_entries * 0.9)
+            self._conn.execute(
+                "DELETE FROM responses WHERE key IN (SELECT key FROM responses ORDER BY last_used ASC LIMIT ?)",
+                (excess,),
+            )
+            count -= excess
+        self._disk_entries = count
@@ -0,0 +1,106 @@
+import math
+import threading
+from collections import Counter, OrderedDict, defaultdict
+
+from chat_context import query_terms
+from text_chunking import split_into_chunks
+
+
+class DocumentIndex:
+    """BM25 index over the passages of one document.
+
+    Pages are added one at a time, so an index can be built while a document is
+    still being extracted and only new pages need processing later.
+    """
+
+    def __init__(self, passage_tokens=200, k1=1.5, b=0.75):
+        self.passage_tokens = passage_tokens
+        self.k1 = k1
+        self.b = b
+        self.passages = []  # (page, text)
+        self.lengths = []  # terms per passage
+        self.postings = defaultdict(list)  # term -> [(passage index, term frequency)]
+        self.pages = set()
+        self.total_length = 0
+        self._lock = threading.Lock()
+
+    def missing_pages(self, page_count):
+        with self._lock:
+            return [page for page in range(1, page_count + 1) if page not in self.pages]
+
+    def add_pages(self, texts):
+        """Index a {page: text} dict; pages that are already indexed are skipped."""
+        with self._lock:
+            for page in sorted(texts):
+                if page in self.pages:
+                    continue
+                for passage in split_into_chunks(texts[page], self.passage_tokens):
+                    terms = Counter(query_terms(passage))
+                    index = len(self.passages)
+                    self.passages.append((page, passage))
+                    self.lengths.append(sum(terms.values()))
+                    self.total_length += self.lengths[-1]
+                    for term, frequency in terms.items():
+                        self.postings[term].append((index, frequency))
+                self.pages.add(page)
+
+    def search(self, query, top_k=5):
+        """Return up to top_k (score, page, passage) tuples, best first."""
+        with self._lock:
+            count = len(self.passages)
+            if not count:
+                return []
+            average_length = self.total_length / count or 1
+            scores = defaultdict(float)
+            for term, weight in Counter(query_terms(query)).items():
+                postings = self.postings.get(term)
+                if not postings:
+                    continue
+                idf = math.log(1 + (count - len(postings) + 0.5) / (len(postings) + 0.5))
+                for index, frequency in postings:
+                    norm = self.k1 * (1 - self.b + self.b * self.lengths[index] / average_length)
+                    scores[index] += weight * idf * frequency * (self.k1 + 1) / (frequency + norm)
+            best = sorted(scores.items(), key=lambda item: (-item[1], item[0]))[:top_k]
+            return [(round(score, 4), *self.passages[index]) for index, score in best]
+
+    def stats(self):
+        with self._lock:
+            return {"pages": len(self.pages), "passages": len(self.passages), "terms": len(self.postings)}
+
+
+class RetrievalIndex:
+    """Per-document BM25 indexes keyed by document ID (the PDF's SHA-256).
+
+    Keeps the most recently used max_documents indexes in memory; an evicted
+    index is rebuilt from the page text cache when it is needed again.
+    """
+
+    def __init__(self, max_documents=32, passage_tokens=200):
+        self.max_documents = max_documents
+        self.passage_tokens = passage_tokens
+        self.builds = 0
+        self._indexes = OrderedDict()  # document ID -> DocumentIndex
+        self._lock = threading.Lock()
+
+    def get(self, document_id):
+        with self._lock:
+            index = self._indexes.get(document_id)
+            if index is None:
+                index = DocumentIndex(self.passage_tokens)
+                self._indexes[document_id] = index
+                self.builds += 1
+                while len(self._indexes) > self.max_documents:
+                    self._indexes.popitem(last=False)
+            self._indexes.move_to_end(document_id)
+            return index
+
+    def stats(self):
+        with self._lock:
+            indexes = list(self._indexes.values())
+            builds = self.builds
+        return {
+            "documents": len(indexes),
+            "maxDocuments": self.max_documents,
+            "builds": builds,
+            "passages": sum(index.stats()["passages"] for index in indexes),
+        }
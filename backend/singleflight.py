@@ -0,0 +1,93 @@
+import asyncio
+
+
+class _StreamFlight:
+    def __init__(self):
+        self.events = []
+        self.finished = False
+        self.subscribers = 0
+        self.changed = asyncio.Event()
+        self.task = None
+
+    def publish(self, event=None):
+        if event is not None:
+            self.events.append(event)
+        # Wake everyone waiting on the current event, later waits use a fresh one
+        self.changed.set()
+        self.changed = asyncio.Event()
+
+
+class SingleFlight:
+    """Collapse concurrent calls with the same key into one in-flight call.
+
+    The first caller for a key starts the work as its own task; everyone who
+    arrives while it is running awaits that same task and gets the same result
+    (or exception). The work is shielded, so one client disconnecting doesn't
+    cancel it for the others.
+
+    stream() does the same for async generators: every caller gets all of the
+    events, late joiners starting from the first one. The generator only stops
+    early once every caller has gone.
+    """
+
+    def __init__(self):
+        self._tasks = {}
+        self._streams = {}
+        self.leaders = 0
+        self.coalesced = 0
+
+    async def do(self, key, fn):
+        task = self._tasks.get(key)
+        if task is None:
+            self.leaders += 1
+            task = asyncio.ensure_future(fn())
+            self._tasks[key] = task
+            task.add_done_callback(lambda _: self._tasks.pop(key, None))
+        else:
+            self.coalesced += 1
+        return await asyncio.shield(task)
+
+    async def stream(self, key, produce):
+        flight = self._streams.get(key)
+        if flight is None:
+            self.leaders += 1
+            flight = self._streams[key] = _StreamFlight()
+            flight.task = asyncio.ensure_future(self._pump(key, flight, produce))
+        else:
+            self.coalesced += 1
+
+        flight.subscribers += 1
+        try:
+            index = 0
+            while True:
+                changed = flight.changed
+                while index < len(flight.events):
+                    index += 1
+                    yield flight.events[index - 1]
+                if flight.finished:
+                    return
+                await changed.wait()
+        finally:
+            flight.subscribers -= 1
+            if not flight.subscribers and not flight.finished:
+                # Nobody is listening any more, stop the work (and its model call)
+                if self._streams.get(key) is flight:
+                    del self._streams[key]
+                flight.task.cancel()
+
+    async def _pump(self, key, flight, produce):
+        try:
+            async for event in produce():
+                flight.publish(event)
+        finally:
+            flight.finished = True
+            flight.publish()
+            if self._streams.get(key) is flight:
+                del self._streams[key]
+
+    def stats(self):
+        return {
+            "inFlight": len(self._tasks) + len(self._streams),
+            "leaders": self.leaders,
+            "coalesced": self.coalesced,
+        }
@@ -0,0 +1,176 @@
+import json
+import re
+
+FENCES = ("```json", "```")
+# Keys the chat cleanup unwraps when the model answers with a JSON object
+RESPONSE_KEYS = ("response", "text", "answer", "content", "message")
+
+_JSON_FIELD_START = re.compile(r'\{\s*"(%s)"\s*:\s*"' % "|".join(RESPONSE_KEYS))
+_JSON_ESCAPES = {'"': '"', "\\": "\\", "/": "/", "b": "\b", "f": "\f", "n": "\n", "r": "\r", "t": "\t"}
+
+
+def unwrap_json_response(text):
+    """Strip code fences and unwrap {"response": "..."} style answers."""
+    text = text.replace("```json", "").replace("```", "").strip()
+    if text.startswith("{") and text.endswith("}"):
+        try:
+            parsed = json.loads(text)
+        except ValueError:
+            return text
+        if isinstance(parsed, dict):
+            for key in RESPONSE_KEYS:
+                if key in parsed:
+                    return parsed[key] if isinstance(parsed[key], str) else json.dumps(parsed[key])
+    return text
+
+
+class StreamCleaner:
+    """Applies the chat response cleanup to a token stream as it arrives.
+
+    feed() takes raw model deltas and returns the text that is safe to show so
+    far; finish() returns whatever was held back. Code fences are dropped as
+    soon as they are complete. An answer that starts with {"response": "... is
+    decoded on the fly, and any other JSON is held until the end and cleaned up
+    like the non-streaming endpoint does.
+
+    Should the streamed text turn out to differ from what unwrap_json_response
+    makes of the whole output (say {"text": ..., "response": ...}, or commentary
+    after the object), finish() sets replaced and returns the full corrected
+    text, which replaces everything emitted before.
+    """
+
+    def __init__(self):
+        self.text = ""  # everything emitted so far
+        self.replaced = False
+        self._raw = ""  # all input, to check the result against unwrap_json_response
+        self._pending = ""  # raw input that may still be part of a fence
+        self._mode = "start"  # start -> text | json-prefix -> json-string -> json-tail | json-buffer
+        self._buffer = ""
+        self._trailing = ""  # whitespace held back so the output ends up stripped
+
+    def feed(self, delta):
+        self._raw += delta
+        self._pending += delta
+        # Hold back a suffix that could still grow into a fence
+        held = ""
+        for size in range(min(len(self._pending), len(FENCES[0])), 0, -1):
+            if FENCES[0].startswith(self._pending[-size:]):
+                held = self._pending[-size:]
+                break
+        ready = self._pending[:len(self._pending) - len(held)]
+        self._pending = held
+        for fence in FENCES:
+            ready = ready.replace(fence, "")
+        return self._emit(self._process(ready))
+
+    def finish(self):
+        tail = self._pending.replace("```json", "").replace("```", "")
+        self._pending = ""
+        output = self._process(tail)
+        if self._mode in ("json-prefix", "json-buffer"):
+            output += unwrap_json_response(self._buffer)
+            self._buffer = ""
+        self._trailing = ""
+        output = self._emit(output)
+        expected = unwrap_json_response(self._raw)
+        if expected != self.text:
+            self.text = expected
+            self.replaced = True
+            return expected
+        return output
+
+    def _emit(self, output):
+        if not output:
+            return ""
+        output = self._trailing + output
+        stripped = output.rstrip()
+        self._trailing = output[len(stripped):]
+        self.text += stripped
+        return stripped
+
+    def _process(self, chunk):
+        if self._mode == "start":
+            chunk = chunk.lstrip()
+            if not chunk:
+                return ""
+            self._mode = "json-prefix" if chunk.startswith("{") else "text"
+
+        if self._mode == "text":
+            return chunk
+
+        if self._mode == "json-prefix":
+            self._buffer += chunk
+            match = _JSON_FIELD_START.match(self._buffer)
+            if match:
+                self._mode = "json-string"
+                rest = self._buffer[match.end():]
+                self._buffer = ""
+                return self._decode(rest)
+            if len(self._buffer) > 64 or re.match(r'\{\s*"[^"]*"\s*:\s*[^"\s]', self._buffer):
+                # Not a {"response": "..."} object, clean it up once it's complete
+                self._mode = "json-buffer"
+            return ""
+
+        if self._mode == "json-string":
+            return self._decode(chunk)
+
+        if self._mode == "json-buffer":
+            self._buffer += chunk
+        # json-tail: the rest of the object after the answer string is dropped
+        return ""
+
+    def _decode(self, chunk):
+        text = self._buffer + chunk
+        self._buffer = ""
+        output = []
+        index = 0
+        while index < len(text):
+            char = text[index]
+            if char == '"':
+                self._mode = "json-tail"
+                break
+            if char != "\\":
+                output.append(char)
+                index += 1
+                continue
+            # Escape sequences can be split across deltas, wait for the rest
+            if index + 1 >= len(text):
+                self._buffer = text[index:]
+                break
+            escape = text[index + 1]
+            if escape == "u":
+                if index + 6 > len(text):
+                    self._buffer = text[index:]
+                    break
+                try:
+                    code = int(text[index + 2:index + 6], 16)
+                except ValueError:
+                    output.append(text[index:index + 6])
+                    index += 6
+                    continue
+                if 0xD800 <= code < 0xDC00:
+                    # A high surrogate combines with the \u escape after it (emoji and the like)
+                    if index + 12 > len(text) and "\\u".startswith(text[index + 6:index + 8]):
+                        self._buffer = text[index:]
+                        break
+                    low = _low_surrogate(text[index + 6:index + 12])
+                    if low is not None:
+                        output.append(chr(0x10000 + (code - 0xD800) * 0x400 + low - 0xDC00))
+                        index += 12
+                        continue
+                output.append(chr(code))
+                index += 6
+                continue
+            output.append(_JSON_ESCAPES.get(escape, escape))
+            index += 2
+        return "".join(output)
+
+
+def _low_surrogate(escape):
+    if not escape.startswith("\\u"):
+        return None
+    try:
+        code = int(escape[2:], 16)
+    except ValueError:
+        return None
+    return code if 0xDC00 <= code < 0xE000 else None
@@ -0,0 +1,70 @@
+import asyncio
+from types import SimpleNamespace
+
+from chat_context import ChatContextBuilder
+
+
+def message(index):
+    return SimpleNamespace(role="user" if index % 2 == 0 else "assistant", content=f"message {index}")
+
+
+class Summaries:
+    """In-memory stand-in for the summary cache and the model."""
+
+    def __init__(self):
+        self.cache = {}
+        self.calls = []
+
+    async def summarize(self, previous, messages_text, folded_text):
+        self.calls.append(messages_text)
+        summary = f"{previous}|{len(messages_text.splitlines())}".strip("|")
+        self.cache[folded_text] = summary
+        return summary
+
+    async def find(self, folded_texts):
+        for index, folded_text in enumerate(folded_texts):
+            if folded_text in self.cache:
+                return index, self.cache[folded_text]
+        return None
+
+
+def build(builder, summaries, count):
+    history = [message(index) for index in range(count)]
+    return asyncio.run(builder.build("question", history, "", summaries.summarize, summaries.find))
+
+
+def test_short_history_is_not_folded():
+    summaries = Summaries()
+    summary, recent, _, stats = build(ChatContextBuilder(recent_messages=6, fold_block=6), summaries, 8)
+    assert summary == ""
+    assert summaries.calls == []
+    assert stats["foldCalls"] == 0
+    assert recent.count("\n") == 7
+
+
+def test_long_history_is_folded_in_one_call():
+    summaries = Summaries()
+    summary, recent, _, stats = build(ChatContextBuilder(recent_messages=6, fold_block=6), summaries, 40)
+    # 34 foldable messages, of which 5 whole blocks are folded
+    assert stats["foldedMessages"] == 30
+    assert stats["foldCalls"] == 1
+    assert len(summaries.calls) == 1
+    assert summary == "30"
+    assert recent.startswith("User: message 30")
+
+
+def test_later_turns_fold_only_the_new_block():
+    builder = ChatContextBuilder(recent_messages=6, fold_block=6)
+    summaries = Summaries()
+    build(builder, summaries, 40)
+
+    # Same blocks: the cached summary is reused
+    _, _, _, stats = build(builder, summaries, 41)
+    assert stats["foldCalls"] == 0
+
+    # One more block: a single call folds just that block onto the cached summary
+    summary, _, _, stats = build(builder, summaries, 42)
+    assert stats["foldCalls"] == 1
+    assert len(summaries.calls) == 2
+    assert len(summaries.calls[-1].splitlines()) == 6
+    assert summary == "30|6"
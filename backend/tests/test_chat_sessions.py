@@ -0,0 +1,61 @@
+import time
+
+import pytest
+
+from chat_sessions import ChatSessionStore, SessionNotFound
+
+
+def stored_last_used(store, session_id):
+    return store._conn.execute("SELECT last_used FROM chat_sessions WHERE id = ?", (session_id,)).fetchone()[0]
+
+
+def test_sessions_survive_a_restart(tmp_path):
+    path = str(tmp_path / "sessions.db")
+    store = ChatSessionStore(persist_path=path)
+    session = store.create(context="notes")
+    store.append(session.id, ("user", "hi"), ("assistant", "hello"))
+
+    reloaded = ChatSessionStore(persist_path=path).get(session.id)
+    assert reloaded.context == "notes"
+    assert [tuple(msg) for msg in reloaded.messages] == [("user", "hi"), ("assistant", "hello")]
+
+
+def test_reads_persist_last_used_once_it_is_stale(tmp_path):
+    store = ChatSessionStore(persist_path=str(tmp_path / "sessions.db"), touch_interval=60)
+    session = store.create()
+    saved = stored_last_used(store, session.id)
+
+    store.get(session.id)
+    assert stored_last_used(store, session.id) == saved
+
+    session.saved_last_used -= 120
+    store.get(session.id)
+    assert stored_last_used(store, session.id) == session.last_used > saved
+
+
+def test_disk_expiry_runs_on_an_interval(tmp_path):
+    store = ChatSessionStore(persist_path=str(tmp_path / "sessions.db"), ttl_seconds=100, touch_interval=0,
+                             expire_interval=3600)
+    old = store.create()
+    store._conn.execute("UPDATE chat_sessions SET last_used = ? WHERE id = ?", (time.time() - 1000, old.id))
+    store._conn.commit()
+    store._sessions.clear()
+
+    # Expiry already ran when the first session was created, so this doesn't touch the disk
+    store.create()
+    assert store._conn.execute("SELECT COUNT(*) FROM chat_sessions").fetchone()[0] == 2
+
+    store._last_disk_expiry -= 3600
+    store.create()
+    assert store._conn.execute("SELECT COUNT(*) FROM chat_sessions").fetchone()[0] == 2
+    with pytest.raises(SessionNotFound):
+        store.get(old.id)
+
+
+def test_idle_sessions_expire_in_memory():
+    store = ChatSessionStore(ttl_seconds=100)
+    session = store.create()
+    session.last_used -= 1000
+    with pytest.raises(SessionNotFound):
+        store.get(session.id)
+    assert store.stats()["expired"] == 1
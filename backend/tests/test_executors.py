@@ -0,0 +1,114 @@
+import asyncio
+import threading
+
+import pytest
+
+from executors import LoopLagMonitor, TaskExecutors
+
+
+def test_run_returns_result_and_records_stats():
+    executors = TaskExecutors({"text": 2})
+    try:
+        assert asyncio.run(executors.run("text", lambda a, b=0: a + b, 1, b=2)) == 3
+        stats = executors.stats()["text"]
+        assert stats["completed"] == 1
+        assert stats["queued"] == 0
+        assert stats["running"] == 0
+        assert stats["errors"] == 0
+    finally:
+        executors.shutdown()
+
+
+def test_errors_are_raised_and_counted():
+    executors = TaskExecutors({"text": 1})
+
+    def fail():
+        raise ValueError("bad page")
+
+    try:
+        with pytest.raises(ValueError):
+            asyncio.run(executors.run("text", fail))
+        stats = executors.stats()["text"]
+        assert stats["completed"] == 1
+        assert stats["errors"] == 1
+    finally:
+        executors.shutdown()
+
+
+def test_cancelled_waiter_does_not_leave_a_queued_job():
+    executors = TaskExecutors({"pdf": 1})
+    started = threading.Event()
+    release = threading.Event()
+    ran = []
+
+    def block():
+        started.set()
+        release.wait(5)
+
+    async def run():
+        busy = asyncio.ensure_future(executors.run("pdf", block))
+        await asyncio.get_running_loop().run_in_executor(None, started.wait, 5)
+        waiter = asyncio.ensure_future(executors.run("pdf", ran.append, "ran"))
+        await asyncio.sleep(0.01)
+        assert executors.stats()["pdf"]["queued"] == 1
+
+        waiter.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+        release.set()
+        await busy
+
+    try:
+        asyncio.run(run())
+        stats = executors.stats()["pdf"]
+        assert ran == []
+        assert stats["queued"] == 0
+        assert stats["running"] == 0
+        assert stats["cancelled"] == 1
+        assert stats["completed"] == 1
+    finally:
+        release.set()
+        executors.shutdown()
+
+
+def test_cancelled_waiter_lets_a_started_job_finish():
+    executors = TaskExecutors({"pdf": 1})
+    started = threading.Event()
+    release = threading.Event()
+
+    def block():
+        started.set()
+        release.wait(5)
+
+    async def run():
+        waiter = asyncio.ensure_future(executors.run("pdf", block))
+        await asyncio.get_running_loop().run_in_executor(None, started.wait, 5)
+        waiter.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+        assert executors.stats()["pdf"]["running"] == 1
+        release.set()
+
+    try:
+        asyncio.run(run())
+        executors._pools["pdf"].executor.shutdown(wait=True)
+        stats = executors.stats()["pdf"]
+        assert stats["running"] == 0
+        assert stats["completed"] == 1
+        assert stats["cancelled"] == 0
+    finally:
+        release.set()
+
+
+def test_loop_lag_monitor_sees_a_blocked_loop():
+    async def run():
+        monitor = LoopLagMonitor(interval=0.01)
+        monitor.start()
+        await asyncio.sleep(0.02)
+        threading.Event().wait(0.1)  # blocks the loop
+        await asyncio.sleep(0.02)
+        await monitor.stop()
+        return monitor.stats()
+
+    stats = asyncio.run(run())
+    assert stats["lagMaxMs"] >= 50
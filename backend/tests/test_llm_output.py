@@ -0,0 +1,131 @@
+import json
+import os
+
+import pytest
+
+from llm_output import JsonObjectScanner, item_key, iter_objects, parse_flashcards, parse_mcqs
+
+
+CORPUS_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "benchmarks", "llm_output_corpus.json")
+with open(CORPUS_PATH, encoding="utf-8") as f:
+    CORPUS = json.load(f)
+
+
+def mcq(question, correct=0, count=4):
+    return {
+        "question": question,
+        "options": [{"text": f"option {i}", "isCorrect": i == correct} for i in range(count)],
+        "explanation": "because",
+    }
+
+
+def test_scanner_returns_objects_split_across_pieces():
+    scanner = JsonObjectScanner()
+    text = '```json\n[{"question": "a {b}", "answer": "c \\" }"}, {"question": "d", "answer": "e"}]\n```'
+    found = []
+    for index in range(0, len(text), 3):
+        found.extend(scanner.feed(text[index:index + 3]))
+    assert [json.loads(source)["question"] for source in found] == ["a {b}", "d"]
+
+
+def test_scanner_never_returns_an_unfinished_object():
+    scanner = JsonObjectScanner()
+    assert scanner.feed('[{"question": "a", "answer": "b"}, {"question": "c", "ans') == ['{"question": "a", "answer": "b"}']
+    assert scanner.feed("") == []
+
+
+def test_scanner_handles_escape_at_piece_boundary():
+    scanner = JsonObjectScanner()
+    assert scanner.feed('{"question": "a \\') == []
+    assert scanner.feed('"}", "answer": "b"}') == ['{"question": "a \\"}", "answer": "b"}']
+
+
+def test_iter_objects_skips_unrepairable_and_truncated_objects():
+    text = '{"question": "a", "answer": "b"} {not json} {"question": "c", "answer": "d"} {"question": "e'
+    assert [value["question"] for value in iter_objects(text)] == ["a", "c"]
+
+
+def test_flashcards_from_fenced_output_with_commentary():
+    output = 'Here are your cards:\n```json\n[{"question": "Q1", "answer": "A1"}, {"front": "Q2", "back": "A2"}]\n```\nEnjoy!'
+    assert parse_flashcards(output) == [{"question": "Q1", "answer": "A1"}, {"question": "Q2", "answer": "A2"}]
+
+
+def test_flashcards_repairs_trailing_and_double_commas():
+    output = '[{"question": "Q1", "answer": "A1",}, {"question": "Q2",, "answer": "A2"},]'
+    assert [card["question"] for card in parse_flashcards(output)] == ["Q1", "Q2"]
+
+
+def test_flashcards_fall_back_to_plain_lines():
+    output = "Question: What is ATP?\nAnswer: Energy currency\nQuestion: What is DNA?\nAnswer: Genetic material"
+    assert parse_flashcards(output) == [
+        {"question": "What is ATP?", "answer": "Energy currency"},
+        {"question": "What is DNA?", "answer": "Genetic material"},
+    ]
+
+
+def test_flashcards_inside_a_wrapper_object():
+    output = json.dumps({"flashcards": [{"question": "Q1", "answer": "A1"}, {"question": "Q2", "answer": "A2"}]})
+    assert [card["question"] for card in parse_flashcards(output)] == ["Q1", "Q2"]
+    assert [card["question"] for card in parse_flashcards(json.loads(output))] == ["Q1", "Q2"]
+
+
+def test_mcqs_inside_wrapper_objects():
+    questions = [mcq("Q1"), mcq("Q2", correct=2)]
+    assert [item["question"] for item in parse_mcqs(json.dumps({"questions": questions}))] == ["Q1", "Q2"]
+    assert [item["question"] for item in parse_mcqs({"data": {"mcqs": questions}})] == ["Q1", "Q2"]
+
+
+def test_mcqs_repair_missing_colons_and_python_bools():
+    output = (
+        '[{"question": "Q1", "options": [{"text": "a", "isCorrect false}, {"text": "b", "isCorrect true}]},'
+        ' {"question" "Q2", "options": [{"text": "a", "isCorrect": True}, {"text": "b", "isCorrect": False}]}]'
+    )
+    items = parse_mcqs(output)
+    assert [item["question"] for item in items] == ["Q1", "Q2"]
+    assert [opt["isCorrect"] for opt in items[0]["options"]] == [False, True]
+    assert [opt["isCorrect"] for opt in items[1]["options"]] == [True, False]
+
+
+def test_mcqs_keep_the_good_objects_around_a_bad_one():
+    output = json.dumps([mcq("Q1")])[:-1] + ', {"question": "broken" "options": oops}, ' + json.dumps(mcq("Q3")) + "]"
+    assert [item["question"] for item in parse_mcqs(output)] == ["Q1", "Q3"]
+
+
+def test_items_after_an_unescaped_quote_still_parse():
+    cards = [{"question": f"Q{i}", "answer": f"A{i}"} for i in (1, 3, 4)]
+    bad = '{"question": "Q2", "answer": "He said "hi"", "note": "a 5" screen"}'
+    output = "[" + ", ".join([json.dumps(cards[0]), bad, json.dumps(cards[1]), json.dumps(cards[2])]) + "]"
+    assert parse_flashcards(output) == cards
+
+    bad = '{"question": "Which 12" ruler?", "options": [{"text": "a", "isCorrect": true}]}'
+    output = "[" + ", ".join([json.dumps(mcq("Q1")), bad, json.dumps(mcq("Q3")), json.dumps(mcq("Q4"))]) + "]"
+    assert [item["question"] for item in parse_mcqs(output)] == ["Q1", "Q3", "Q4"]
+
+
+@pytest.mark.parametrize("sample", CORPUS, ids=[sample["name"] for sample in CORPUS])
+def test_corpus_samples_recover_the_expected_items(sample):
+    parse = parse_flashcards if sample["kind"] == "flashcards" else parse_mcqs
+    assert len(parse(sample["output"])) == sample["expected"]
+
+
+def test_mcqs_always_have_exactly_one_correct_option():
+    none_correct = mcq("Q1", correct=-1)
+    all_correct = {"question": "Q2", "options": [{"text": str(i), "isCorrect": True} for i in range(4)]}
+    for item in parse_mcqs([none_correct, all_correct]):
+        assert sum(opt["isCorrect"] for opt in item["options"]) == 1
+
+
+def test_mcqs_without_options_are_dropped():
+    assert parse_mcqs('[{"question": "Q1"}, {"question": "Q2", "options": []}]') == []
+
+
+def test_item_key_tells_items_with_the_same_question_apart():
+    first = {"question": "What is ATP?", "answer": "Energy currency"}
+    second = {"question": "What is ATP?", "answer": "Adenosine triphosphate"}
+    assert item_key(first) != item_key(second)
+    assert item_key(first) == item_key(dict(first))
+
+
+def test_item_key_ignores_which_option_is_correct():
+    assert item_key(mcq("Q1", correct=0)) == item_key(mcq("Q1", correct=3))
+    assert item_key(mcq("Q1")) != item_key({**mcq("Q1"), "explanation": "other"})
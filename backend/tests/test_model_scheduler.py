@@ -0,0 +1,156 @@
+import asyncio
+
+import pytest
+
+from model_scheduler import (
+    PRIORITY_BATCH,
+    PRIORITY_CHAT,
+    PRIORITY_OCR,
+    ModelScheduler,
+    TokenBucket,
+    parse_model_limits,
+)
+
+
+def test_parse_model_limits():
+    assert parse_model_limits("model-a=4, org/model-b=2,") == {"model-a": 4, "org/model-b": 2}
+    assert parse_model_limits("") == {}
+    assert parse_model_limits(None) == {}
+    with pytest.raises(ValueError):
+        parse_model_limits("=3")
+    with pytest.raises(ValueError):
+        parse_model_limits("model-a=lots")
+
+
+def test_token_bucket_waits_for_refill():
+    bucket = TokenBucket(60)  # one per second
+    assert bucket.wait_time(60) == 0.0
+    bucket.take(60)
+    assert bucket.wait_time(1) == pytest.approx(1.0, abs=0.05)
+    assert bucket.wait_time(30) == pytest.approx(30.0, abs=0.05)
+    # More than the bucket holds only waits for a full bucket
+    assert bucket.wait_time(600) == pytest.approx(60.0, abs=0.05)
+
+
+def test_token_bucket_without_a_rate_never_waits():
+    bucket = TokenBucket(0)
+    bucket.take(1000)
+    assert bucket.wait_time(1000) == 0.0
+
+
+async def run_in_order(scheduler, jobs):
+    """Fill the only slot, queue jobs while it is held, and return the order they were admitted in."""
+    order = []
+    release = asyncio.Event()
+
+    async def holder():
+        async with scheduler.slot("m", PRIORITY_BATCH):
+            await release.wait()
+
+    async def job(name, priority):
+        async with scheduler.slot("m", priority):
+            order.append(name)
+
+    held = asyncio.create_task(holder())
+    await asyncio.sleep(0)
+    tasks = []
+    for name, priority in jobs:
+        tasks.append(asyncio.create_task(job(name, priority)))
+        await asyncio.sleep(0)
+    release.set()
+    await asyncio.gather(held, *tasks)
+    return order
+
+
+def test_chat_is_admitted_before_queued_batch_work():
+    scheduler = ModelScheduler(default_concurrency=1)
+    order = asyncio.run(run_in_order(scheduler, [
+        ("batch-1", PRIORITY_BATCH),
+        ("batch-2", PRIORITY_BATCH),
+        ("ocr", PRIORITY_OCR),
+        ("chat", PRIORITY_CHAT),
+    ]))
+    assert order == ["chat", "ocr", "batch-1", "batch-2"]
+    stats = scheduler.stats()
+    assert stats["priorities"]["batch"]["admitted"] == 3
+    assert stats["priorities"]["chat"]["admitted"] == 1
+    assert stats["models"]["m"] == {"active": 0, "limit": 1, "queued": 0, "peakQueued": 4}
+
+
+def test_per_model_limits():
+    scheduler = ModelScheduler(default_concurrency=1, model_concurrency={"wide": 3})
+
+    async def scenario():
+        running = 0
+        peak = 0
+
+        async def job():
+            nonlocal running, peak
+            async with scheduler.slot("wide"):
+                running += 1
+                peak = max(peak, running)
+                await asyncio.sleep(0.01)
+                running -= 1
+
+        await asyncio.gather(*(job() for _ in range(6)))
+        return peak
+
+    assert asyncio.run(scenario()) == 3
+
+
+def test_cancelled_waiter_gives_up_its_place():
+    scheduler = ModelScheduler(default_concurrency=1)
+
+    async def scenario():
+        order = []
+        release = asyncio.Event()
+
+        async def holder():
+            async with scheduler.slot("m"):
+                await release.wait()
+
+        async def job(name, priority):
+            async with scheduler.slot("m", priority):
+                order.append(name)
+
+        held = asyncio.create_task(holder())
+        await asyncio.sleep(0)
+        cancelled = asyncio.create_task(job("cancelled", PRIORITY_CHAT))
+        waiting = asyncio.create_task(job("batch", PRIORITY_BATCH))
+        await asyncio.sleep(0)
+        assert scheduler.stats()["models"]["m"]["queued"] == 2
+
+        cancelled.cancel()
+        await asyncio.sleep(0)
+        assert scheduler.stats()["models"]["m"]["queued"] == 1
+
+        release.set()
+        await asyncio.gather(held, waiting)
+        with pytest.raises(asyncio.CancelledError):
+            await cancelled
+        return order
+
+    assert asyncio.run(scenario()) == ["batch"]
+    assert scheduler.stats()["models"]["m"]["active"] == 0
+
+
+def test_request_rate_limit_delays_admission():
+    scheduler = ModelScheduler(default_concurrency=4, requests_per_minute=600)  # ten per second
+
+    async def scenario():
+        loop = asyncio.get_running_loop()
+        admitted = []
+
+        async def job():
+            async with scheduler.slot("m"):
+                admitted.append(loop.time())
+
+        started = loop.time()
+        # The bucket starts full, so drain it first
+        scheduler._queue("m").requests.take(600)
+        await asyncio.gather(job(), job())
+        return [at - started for at in admitted]
+
+    first, second = asyncio.run(scenario())
+    assert first >= 0.09
+    assert second >= 0.19
@@ -0,0 +1,50 @@
+import pytest
+
+from ocr_tiling import stitch_texts, tile_boxes
+
+
+def test_tile_boxes_cover_the_image_with_overlap():
+    boxes = tile_boxes(800, 2500, tile_height=1000, overlap=100)
+    assert [box for _, box in boxes] == [(0, 0, 800, 1000), (0, 900, 800, 1900), (0, 1800, 800, 2500)]
+
+
+def test_tile_boxes_columns_in_reading_order():
+    boxes = tile_boxes(1000, 1500, tile_height=1000, overlap=100, columns=2)
+    assert [column for column, _ in boxes] == [0, 0, 1, 1]
+    assert boxes[2][1] == (500, 0, 1000, 1000)
+
+
+@pytest.mark.parametrize("tile_height, overlap", [(0, 0), (100, 100), (100, 200), (100, -1)])
+def test_tile_boxes_reject_settings_that_would_never_advance(tile_height, overlap):
+    with pytest.raises(ValueError):
+        tile_boxes(800, 2500, tile_height=tile_height, overlap=overlap)
+
+
+def test_stitch_drops_repeated_overlap_lines():
+    first = "Chapter 1\nThe cell is the basic unit of life in every organism\nMitochondria make ATP"
+    second = "Mitochondria make ATP\nRibosomes make proteins"
+    assert stitch_texts([first, second]) == (
+        "Chapter 1\nThe cell is the basic unit of life in every organism\nMitochondria make ATP\nRibosomes make proteins"
+    )
+
+
+def test_stitch_skips_a_half_cut_first_line():
+    first = "Line one of the page\nLine two of the page"
+    second = "ine tw\nLine two of the page\nLine three of the page"
+    assert stitch_texts([first, second]) == "Line one of the page\nLine two of the page\nLine three of the page"
+
+
+def test_stitch_keeps_blank_lines():
+    first = "First paragraph.\n\nSecond paragraph starts\nand continues here"
+    second = "and continues here\n\nThird paragraph."
+    assert stitch_texts([first, second]) == "First paragraph.\n\nSecond paragraph starts\nand continues here\n\nThird paragraph."
+
+
+def test_stitch_keeps_blank_lines_inside_the_overlap_once():
+    first = "Alpha line\n\nBeta line"
+    second = "Alpha line\n\nBeta line\nGamma line"
+    assert stitch_texts([first, second]) == "Alpha line\n\nBeta line\nGamma line"
+
+
+def test_stitch_does_not_merge_short_similar_lines():
+    assert stitch_texts(["Step 1\nStep 2", "Step 3\nStep 4"]) == "Step 1\nStep 2\nStep 3\nStep 4"
@@ -0,0 +1,239 @@
+import asyncio
+import contextlib
+import time
+
+import aiohttp
+import pytest
+from yarl import URL
+
+from resilience import ResilientCaller, UpstreamError, UpstreamTimeout, error_status, parse_retry_after
+
+
+class Attempts:
+    """Attempt factory that fails with the given errors in order, then returns "ok"."""
+
+    def __init__(self, *failures, delay=0.0):
+        self.failures = list(failures)
+        self.delay = delay
+        self.calls = 0
+
+    async def __call__(self):
+        self.calls += 1
+        await asyncio.sleep(self.delay)
+        if self.failures:
+            raise self.failures.pop(0)
+        return "ok"
+
+
+def response_error(status):
+    url = URL("http://provider/v1/chat/completions")
+    return aiohttp.ClientResponseError(aiohttp.RequestInfo(url, "POST", {}, url), (), status=status)
+
+
+def test_parse_retry_after():
+    assert parse_retry_after("3") == 3.0
+    assert parse_retry_after("-1") == 0.0
+    assert parse_retry_after("Wed, 21 Oct 2015 07:28:00 GMT") == 0.0
+    assert parse_retry_after("soon") is None
+    assert parse_retry_after(None) is None
+
+
+def test_error_status_only_reads_known_errors():
+    class Unrelated(Exception):
+        status = 500
+        status_code = 500
+
+    assert error_status(UpstreamError(429)) == 429
+    assert error_status(response_error(502)) == 502
+    assert error_status(ConnectionResetError()) == 503
+    assert error_status(Unrelated()) is None
+    assert error_status(ValueError("bad json")) is None
+
+
+def test_retries_retryable_statuses():
+    attempt = Attempts(UpstreamError(503), UpstreamError(429))
+    caller = ResilientCaller(base_delay=0.001)
+    assert asyncio.run(caller.call("chat", attempt)) == "ok"
+    assert attempt.calls == 3
+    assert caller.stats()["endpoints"]["chat"]["retries"] == 2
+
+
+def test_waits_at_least_retry_after():
+    attempt = Attempts(UpstreamError(429, retry_after=0.2))
+    caller = ResilientCaller(base_delay=0.001)
+    started = time.perf_counter()
+    assert asyncio.run(caller.call("chat", attempt)) == "ok"
+    assert time.perf_counter() - started >= 0.2
+
+
+def test_gives_up_after_max_attempts():
+    attempt = Attempts(UpstreamError(500), UpstreamError(500), UpstreamError(500))
+    caller = ResilientCaller(max_attempts=2, base_delay=0.001)
+    with pytest.raises(UpstreamError) as raised:
+        asyncio.run(caller.call("chat", attempt))
+    assert raised.value.status == 500
+    assert attempt.calls == 2
+
+
+def test_does_not_retry_client_errors():
+    attempt = Attempts(UpstreamError(400))
+    with pytest.raises(UpstreamError):
+        asyncio.run(ResilientCaller(base_delay=0.001).call("chat", attempt))
+    assert attempt.calls == 1
+
+
+def test_known_client_errors_are_raised_as_upstream_errors():
+    attempt = Attempts(response_error(400))
+    with pytest.raises(UpstreamError) as raised:
+        asyncio.run(ResilientCaller().call("chat", attempt))
+    assert raised.value.status == 400
+    assert isinstance(raised.value.__cause__, aiohttp.ClientResponseError)
+
+
+def test_unknown_errors_pass_through():
+    attempt = Attempts(ValueError("bad json"))
+    with pytest.raises(ValueError):
+        asyncio.run(ResilientCaller().call("chat", attempt))
+    assert attempt.calls == 1
+
+
+def test_deadline_raises_upstream_timeout():
+    caller = ResilientCaller(deadlines={"chat": 0.05})
+    with pytest.raises(UpstreamTimeout) as raised:
+        asyncio.run(caller.call("chat", Attempts(delay=1.0)))
+    assert raised.value.status == 504
+    assert caller.stats()["endpoints"]["chat"]["timeouts"] == 1
+
+
+def test_hedge_wins_when_first_attempt_is_slow():
+    caller = ResilientCaller(hedge_endpoints={"ocr"}, hedge_min_samples=1)
+    caller._latencies["ocr"].append(0.01)
+    delays = [1.0, 0.0]
+    cancelled = []
+
+    async def attempt():
+        delay = delays.pop(0)
+        try:
+            await asyncio.sleep(delay)
+        except asyncio.CancelledError:
+            cancelled.append(delay)
+            raise
+        return delay
+
+    async def run():
+        result = await caller.call("ocr", attempt)
+        # The slow attempt was cancelled and has finished unwinding by the time call() returns
+        assert cancelled == [1.0]
+        assert all(task.done() for task in asyncio.all_tasks() if task is not asyncio.current_task())
+        return result
+
+    assert asyncio.run(run()) == 0.0
+    counts = caller.stats()["endpoints"]["ocr"]
+    assert counts["hedges"] == 1
+    assert counts["hedgeWins"] == 1
+
+
+def test_hedge_fails_only_when_every_attempt_fails():
+    caller = ResilientCaller(hedge_endpoints={"ocr"}, hedge_min_samples=1, max_attempts=1)
+    caller._latencies["ocr"].append(0.01)
+    attempt = Attempts(UpstreamError(400), UpstreamError(400), delay=0.05)
+    with pytest.raises(UpstreamError):
+        asyncio.run(caller.call("ocr", attempt))
+    assert attempt.calls == 2
+
+
+class Stream:
+    """Stand-in for agent.run_stream(): fails or stalls per attempt, otherwise yields chunks."""
+
+    def __init__(self, *attempts, chunks=("a", "b"), chunk_delay=0.0):
+        self.attempts = list(attempts)  # an exception to raise, or seconds to stall, before the first chunk
+        self.chunks = chunks
+        self.chunk_delay = chunk_delay
+        self.opened = 0
+        self.closed = 0
+
+    def __call__(self):
+        self.opened += 1
+        plan = self.attempts.pop(0) if self.attempts else None
+        return self._open(plan)
+
+    @contextlib.asynccontextmanager
+    async def _open(self, plan):
+        async def chunks():
+            if isinstance(plan, BaseException):
+                raise plan
+            if plan:
+                await asyncio.sleep(plan)
+            for chunk in self.chunks:
+                yield chunk
+                await asyncio.sleep(self.chunk_delay)
+
+        try:
+            yield chunks()
+        finally:
+            self.closed += 1
+
+
+async def collect(stream):
+    async with contextlib.aclosing(stream):
+        return [chunk async for chunk in stream]
+
+
+def test_stream_retries_until_the_first_chunk():
+    stream = Stream(UpstreamError(503), response_error(429))
+    caller = ResilientCaller(base_delay=0.001)
+    assert asyncio.run(collect(caller.stream("chat", stream))) == ["a", "b"]
+    assert stream.opened == stream.closed == 3
+    assert caller.stats()["endpoints"]["chat"]["retries"] == 2
+
+
+def test_stream_retries_a_silent_attempt():
+    stream = Stream(1.0)
+    caller = ResilientCaller(base_delay=0.001, first_chunk_timeout=0.05)
+    assert asyncio.run(collect(caller.stream("chat", stream))) == ["a", "b"]
+    assert stream.opened == 2
+
+
+def test_stream_is_not_retried_after_a_chunk():
+    class Broken(Stream):
+        @contextlib.asynccontextmanager
+        async def _open(self, plan):
+            async def chunks():
+                yield "a"
+                raise UpstreamError(503)
+            yield chunks()
+
+    stream = Broken()
+    received = []
+
+    async def run():
+        async for chunk in ResilientCaller(base_delay=0.001).stream("chat", stream):
+            received.append(chunk)
+
+    with pytest.raises(UpstreamError):
+        asyncio.run(run())
+    assert received == ["a"]
+    assert stream.opened == 1
+
+
+def test_stream_deadline_raises_upstream_timeout():
+    stream = Stream(chunks=("a", "b", "c"), chunk_delay=0.05)
+    caller = ResilientCaller(deadlines={"chat": 0.08})
+    with pytest.raises(UpstreamTimeout):
+        asyncio.run(collect(caller.stream("chat", stream)))
+    assert stream.closed == 1
+    assert caller.stats()["endpoints"]["chat"]["timeouts"] == 1
+
+
+def test_deadline_starts_once_admitted():
+    # Queued longer than the deadline, but the call itself is quick
+    @contextlib.asynccontextmanager
+    async def admit():
+        await asyncio.sleep(0.1)
+        yield
+
+    caller = ResilientCaller(deadlines={"chat": 0.05})
+    assert asyncio.run(caller.call("chat", Attempts(delay=0.01), admit=admit)) == "ok"
+    assert asyncio.run(collect(caller.stream("chat", Stream(), admit=admit))) == ["a", "b"]
+    with pytest.raises(UpstreamTimeout):
+        asyncio.run(caller.call("chat", Attempts(delay=1.0), admit=admit))
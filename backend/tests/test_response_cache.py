@@ -0,0 +1,32 @@
+from response_cache import ResponseCache
+
+
+def test_get_returns_a_copy(tmp_path):
+    for cache in (ResponseCache(), ResponseCache(disk_path=str(tmp_path / "responses.db"))):
+        cache.set("key", {"flashcards": [{"question": "Q", "answer": "A"}]})
+        cache.get("key")["flashcards"].clear()
+        assert cache.get("key") == {"flashcards": [{"question": "Q", "answer": "A"}]}
+
+
+def test_disk_hits_survive_a_restart(tmp_path):
+    path = str(tmp_path / "responses.db")
+    ResponseCache(disk_path=path).set("key", {"summary": "text"})
+    cache = ResponseCache(disk_path=path)
+    assert cache.get("key") == {"summary": "text"}
+    assert cache.stats()["diskHits"] == 1
+
+
+def test_disk_tier_is_trimmed_to_its_budget(tmp_path):
+    cache = ResponseCache(max_entries=2, disk_path=str(tmp_path / "responses.db"), disk_max_entries=10)
+    for index in range(30):
+        cache.set(f"key{index}", {"index": index})
+    rows = cache._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+    assert rows <= 10
+    assert cache.get("key29") == {"index": 29}
+    assert cache.get("key0") is None
+
+
+def test_expired_entries_are_misses():
+    cache = ResponseCache(ttl_seconds=-1)
+    cache.set("key", {"summary": "text"})
+    assert cache.get("key") is None
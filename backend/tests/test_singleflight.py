@@ -0,0 +1,90 @@
+import asyncio
+from contextlib import aclosing
+
+from singleflight import SingleFlight
+
+
+def test_do_runs_concurrent_calls_once():
+    flight = SingleFlight()
+    calls = []
+
+    async def work():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return "result"
+
+    async def run():
+        return await asyncio.gather(*(flight.do("key", work) for _ in range(3)))
+
+    assert asyncio.run(run()) == ["result"] * 3
+    assert calls == [1]
+    assert flight.stats() == {"inFlight": 0, "leaders": 1, "coalesced": 2}
+
+
+def test_stream_shares_one_producer_and_replays_for_late_joiners():
+    flight = SingleFlight()
+    runs = []
+
+    async def produce():
+        runs.append(1)
+        for index in range(4):
+            await asyncio.sleep(0.01)
+            yield index
+
+    async def collect(delay):
+        await asyncio.sleep(delay)
+        return [event async for event in flight.stream("key", produce)]
+
+    async def run():
+        return await asyncio.gather(collect(0), collect(0.025))
+
+    assert asyncio.run(run()) == [[0, 1, 2, 3], [0, 1, 2, 3]]
+    assert runs == [1]
+    assert flight.stats()["coalesced"] == 1
+    assert flight.stats()["inFlight"] == 0
+
+
+def test_stream_keeps_producing_while_anyone_listens():
+    flight = SingleFlight()
+
+    async def produce():
+        for index in range(3):
+            await asyncio.sleep(0.01)
+            yield index
+
+    async def leave_early():
+        async with aclosing(flight.stream("key", produce)) as events:
+            async for event in events:
+                return event
+
+    async def collect():
+        return [event async for event in flight.stream("key", produce)]
+
+    async def run():
+        return await asyncio.gather(leave_early(), collect())
+
+    assert asyncio.run(run()) == [0, [0, 1, 2]]
+
+
+def test_stream_stops_the_producer_once_everyone_left():
+    flight = SingleFlight()
+    stopped = []
+
+    async def produce():
+        try:
+            for index in range(100):
+                await asyncio.sleep(0.01)
+                yield index
+        finally:
+            stopped.append(True)
+
+    async def run():
+        async with aclosing(flight.stream("key", produce)) as events:
+            async for event in events:
+                if event == 1:
+                    break
+        await asyncio.sleep(0.01)
+        return flight.stats()["inFlight"]
+
+    assert asyncio.run(run()) == 0
+    assert stopped == [True]
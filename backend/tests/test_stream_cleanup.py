@@ -0,0 +1,57 @@
+import json
+
+import pytest
+
+from stream_cleanup import StreamCleaner, unwrap_json_response
+
+ANSWER = 'Line one with a "quote".\nLine two: tabs\there, a slash / and café — done.'
+SAMPLES = {
+    "plain": ANSWER,
+    "plain-fenced": f"```\n{ANSWER}\n```",
+    "json": json.dumps({"response": ANSWER}),
+    "json-fenced": f"```json\n{json.dumps({'response': ANSWER})}\n```",
+    "json-ascii-escapes": json.dumps({"response": ANSWER + " \U0001F600"}, ensure_ascii=True),
+    "json-other-key": json.dumps({"answer": ANSWER}),
+    "json-pretty-fenced": f"```json\n{json.dumps({'text': ANSWER, 'sources': [1, 2]}, indent=2)}\n```  ",
+    "json-other-object": json.dumps({"topic": "cells", "points": ["a", "b"]}),
+    "json-non-string-answer": json.dumps({"content": {"points": ["a", "b"]}}),
+    "json-broken": '{"result": "unterminated',
+    "backticks-in-text": "Use `code` here, not ``` fences.",
+    "json-response-not-first": json.dumps({"text": "draft", "response": ANSWER}),
+    "json-then-commentary": json.dumps({"response": ANSWER}) + "\nHope this helps!",
+}
+# Streamed as they arrive, then replaced once the whole output shows it was wrong
+REPLACED = {"json-response-not-first", "json-then-commentary"}
+
+
+def stream(pieces):
+    cleaner = StreamCleaner()
+    output = "".join(cleaner.feed(piece) for piece in pieces)
+    final = cleaner.finish()
+    output = final if cleaner.replaced else output + final
+    assert output == cleaner.text
+    return output, cleaner.replaced
+
+
+@pytest.mark.parametrize("name", SAMPLES)
+def test_split_anywhere_matches_unwrap_json_response(name):
+    text = SAMPLES[name]
+    expected = (unwrap_json_response(text), name in REPLACED)
+    assert stream([text]) == expected
+    for offset in range(1, len(text)):
+        assert stream([text[:offset], text[offset:]]) == expected, f"split at {offset}"
+
+
+@pytest.mark.parametrize("name", SAMPLES)
+def test_char_by_char_matches_unwrap_json_response(name):
+    text = SAMPLES[name]
+    assert stream(list(text)) == (unwrap_json_response(text), name in REPLACED)
+
+
+def test_json_answer_is_streamed_before_the_object_is_complete():
+    cleaner = StreamCleaner()
+    assert cleaner.feed('```json\n{"response": "Hello') == "Hello"
+    assert cleaner.feed(' \\ud83d') == ""
+    assert cleaner.feed('\\ude00 there"}') == " \U0001F600 there"
+    assert cleaner.finish() == ""
+    assert not cleaner.replaced
@@ -0,0 +1,106 @@
+import re
+
+# "--- Page N ---" markers written by the PDF extraction endpoints
+_PAGE_MARKER = re.compile(r"(?m)^(?=--- Page \d+ ---$)")
+_PARAGRAPH_BREAK = re.compile(r"\n\s*\n")
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s+")
+
+# Rough average for English text; close enough for budgeting without a tokenizer
+CHARS_PER_TOKEN = 4
+
+
+def estimate_tokens(text):
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+def split_into_chunks(text, max_tokens=3000):
+    """Split text into chunks of at most max_tokens (estimated).
+
+    Chunks break on page markers first, then paragraphs, then sentences, and
+    only cut mid-sentence when a single sentence is over budget. Small pieces
+    are packed together, preferring to start a new chunk at a page boundary, so
+    editing one page usually changes only the chunk that contains it.
+    """
+    max_chars = max_tokens * CHARS_PER_TOKEN
+    pieces = []
+    for page in _PAGE_MARKER.split(text):
+        pieces.extend(_split_piece(page.strip(), max_chars))
+
+    chunks = []
+    current = []
+    current_chars = 0
+    for piece in pieces:
+        starts_page = piece.startswith("--- Page ")
+        # Joining adds two characters per piece
+        if current and (current_chars + len(piece) + 2 > max_chars or (starts_page and current_chars > max_chars // 2)):
+            chunks.append("\n\n".join(current))
+            current = []
+            current_chars = 0
+        current.append(piece)
+        current_chars += len(piece) + 2
+    if current:
+        chunks.append("\n\n".join(current))
+    return chunks
+
+
+def _split_piece(text, max_chars):
+    if not text:
+        return []
+    if len(text) <= max_chars:
+        return [text]
+
+    for separator in (_PARAGRAPH_BREAK, _SENTENCE_END):
+        parts = [part.strip() for part in separator.split(text) if part.strip()]
+        if len(parts) > 1:
+            pieces = []
+            for part in parts:
+                pieces.extend(_split_piece(part, max_chars))
+            return pieces
+
+    # One enormous sentence, cut it on whitespace as a last resort
+    pieces = []
+    while len(text) > max_chars:
+        cut = text.rfind(" ", 0, max_chars)
+        if cut <= 0:
+            cut = max_chars
+        pieces.append(text[:cut].strip())
+        text = text[cut:].strip()
+    if text:
+        pieces.append(text)
+    return pieces
+
+
+_PARAGRAPH_SPLIT = re.compile(r"(\n\s*\n)")
+_PAGE_MARKER_LINE = re.compile(r"^(--- Page \d+ ---\n?)")
+
+
+def split_paragraphs(text):
+    """Split text into (segment, is_paragraph) pairs that join back into the original.
+
+    Blank-line separators, surrounding whitespace and "--- Page N ---" markers
+    come back as non-paragraph segments, so a translated document keeps its
+    layout exactly.
+    """
+    segments = []
+    for part in _PARAGRAPH_SPLIT.split(text):
+        if not part:
+            continue
+        if not part.strip() or _PARAGRAPH_SPLIT.fullmatch(part):
+            segments.append((part, False))
+            continue
+        marker = _PAGE_MARKER_LINE.match(part)
+        if marker:
+            segments.append((marker.group(1), False))
+            part = part[marker.end():]
+        body = part.strip()
+        if not body:
+            if part:
+                segments.append((part, False))
+            continue
+        start = part.index(body)
+        if start:
+            segments.append((part[:start], False))
+        segments.append((body, True))
+        if start + len(body) < len(part):
+            segments.append((part[start + len(body):], False))
+    return segments
@@ -86,6 +86,7 @@ export default function Home() {
   const [translation, setTranslation] = useState('');
   const [selectedLanguage, setSelectedLanguage] = useState('spanish');
   const [chatMessages, setChatMessages] = useState<ChatMessage[]>([]);
+  const [chatSessionId, setChatSessionId] = useState<string | null>(null);
   const [chatInput, setChatInput] = useState('');
   const [flippedCards, setFlippedCards] = useState<boolean[]>([]);
   const [selectedOptions, setSelectedOptions] = useState<number[]>(Array(5).fill(-1));
@@ -104,6 +105,7 @@ export default function Home() {
   const [pdfPages, setPdfPages] = useState<number>(0);
   const [currentPdfPage, setCurrentPdfPage] = useState<number>(1);
   const [pdfPageImages, setPdfPageImages] = useState<string[]>([]);
+  const [pdfDocumentId, setPdfDocumentId] = useState<string | null>(null);
   const [showPdfPageSelector, setShowPdfPageSelector] = useState<boolean>(false);
   
   // Processing state tracking
@@ -138,6 +140,11 @@ export default function Home() {
     }
   }, [chatMessages]);
 
+  // Chat sessions are grounded in the current PDF, start a new one when it changes
+  useEffect(() => {
+    setChatSessionId(null);
+  }, [pdfDocumentId]);
+
   // Helper functions
   const getWelcomeMessage = () => {
     if (user) {
@@ -147,14 +154,23 @@ export default function Home() {
   };
 
   // PDF handling functions
-  const handlePdfTextExtraction = async (pdfFile: File, specificPage?: number) => {
+  // Once a PDF has been stored on the backend, send its document ID instead of the whole file
+  const appendPdfSource = (formData: FormData, pdfFile: File, documentId: string | null = pdfDocumentId) => {
+    if (documentId) {
+      formData.append('documentId', documentId);
+    } else {
+      formData.append('file', pdfFile);
+    }
+  };
+
+  const handlePdfTextExtraction = async (pdfFile: File, specificPage?: number, documentId: string | null = pdfDocumentId) => {
     setIsExtracting(true);
     setError(null);
     
     try {
-      // Create FormData object for file upload
+      // Create FormData object for the request
       const formData = new FormData();
-      formData.append('file', pdfFile);
+      appendPdfSource(formData, pdfFile, documentId);
       
       if (specificPage) {
         formData.append('page', specificPage.toString());
@@ -209,6 +225,7 @@ export default function Home() {
       
       // Reset PDF-related states when uploading a regular image
       setPdfPages(0);
+      setPdfDocumentId(null);
       setCurrentPdfPage(1);
       setPdfPageImages([]);
       setShowPdfPageSelector(false);
@@ -229,8 +246,8 @@ export default function Home() {
       const formData = new FormData();
       formData.append('file', pdfFile);
       
-      // Send the PDF to the backend to get page count
-      const response = await fetch(`${backendUrl}/api/pdf-page-count`, {
+      // Upload the PDF once; the backend returns a document ID and the page count
+      const response = await fetch(`${backendUrl}/api/documents`, {
         method: 'POST',
         body: formData,
       });
@@ -243,9 +260,11 @@ export default function Home() {
       
       const data = await response.json();
       const pageCount = data.pageCount;
+      const documentId = data.documentId;
       
-      // Store the PDF file and page count
+      // Store the PDF file, document ID and page count
       setFile(pdfFile);
+      setPdfDocumentId(documentId);
       setPdfPages(pageCount);
       setCurrentPdfPage(1);
       setPdfPageImages([]);
@@ -255,7 +274,7 @@ export default function Home() {
       
       // If it's a single page PDF, extract text immediately
       if (pageCount === 1) {
-        await handlePdfTextExtraction(pdfFile, 1);
+        await handlePdfTextExtraction(pdfFile, 1, documentId);
       }
       
     } catch (error) {
@@ -273,9 +292,9 @@ export default function Home() {
     setError(null);
     
     try {
-      // Create FormData object for file upload
+      // Create FormData object for the request
       const formData = new FormData();
-      formData.append('file', file);
+      appendPdfSource(formData, file);
       formData.append('page', page.toString());
       
       console.log(`Converting PDF page ${page} to image and extracting text`);
@@ -283,11 +302,13 @@ export default function Home() {
       // Extract text from the specific page
       await handlePdfTextExtraction(file, page);
       
-      // Send the PDF to the backend for conversion to image (for preview)
-      const response = await fetch(`${backendUrl}/api/pdf-to-image`, {
-        method: 'POST',
-        body: formData,
-      });
+      // Stored documents are rendered through a GET URL so the browser can cache the image
+      const response = pdfDocumentId
+        ? await fetch(`${backendUrl}/api/documents/${pdfDocumentId}/pages/${page}/image?format=webp`)
+        : await fetch(`${backendUrl}/api/pdf-to-image`, {
+            method: 'POST',
+            body: formData,
+          });
       
       if (!response.ok) {
         const errorText = await response.text();
@@ -321,29 +342,53 @@ export default function Home() {
     setError(null);
     
     try {
-      // Create FormData object for file upload
+      // Create FormData object for the request
       const formData = new FormData();
-      formData.append('file', file);
+      appendPdfSource(formData, file);
       
       console.log(`Extracting text from all pages of PDF: ${file.name}`);
       
-      // Use the dedicated extract-pdf-all-pages endpoint instead
-      const response = await fetch(`${backendUrl}/api/extract-pdf-all-pages`, {
+      // Use the streaming endpoint so pages show up as soon as they are extracted
+      const response = await fetch(`${backendUrl}/api/extract-pdf-all-pages/stream`, {
         method: 'POST',
         body: formData,
       });
       
-      if (!response.ok) {
+      if (!response.ok || !response.body) {
         const errorText = await response.text();
         console.error("Error response:", errorText);
         throw new Error(`Failed to extract text: ${response.status}`);
       }
       
-      const data = await response.json();
+      // Read newline-delimited JSON events
+      const reader = response.body.getReader();
+      const decoder = new TextDecoder();
+      const pageTexts: string[] = [];
+      let buffer = '';
+      
+      while (true) {
+        const { done, value } = await reader.read();
+        if (done) break;
+        
+        buffer += decoder.decode(value, { stream: true });
+        const lines = buffer.split('\n');
+        buffer = lines.pop() || '';
+        
+        for (const line of lines) {
+          if (!line.trim()) continue;
+          const event = JSON.parse(line);
+          
+          if (event.type === 'page') {
+            pageTexts.push(event.text);
+            setInput(pageTexts.join('\n\n'));
+          } else if (event.type === 'error') {
+            throw new Error(event.detail);
+          }
+        }
+      }
       
       // Check if we got text back
-      if (data.text && data.text.trim()) {
-        setInput(data.text);
+      if (pageTexts.join('').trim()) {
         setHasExtracted(true);
       } else {
         setError('No text was found in the PDF.');
@@ -518,20 +563,12 @@ export default function Home() {
       // Use the input directly since it contains the extracted text
       const textContent = input;
       
-      // First generate summary immediately (synchronously) and show it
-      await generateSummary(textContent);
-      
-      // Set active tab to summary to show immediate results
+      // Summary, flashcards and MCQs are generated concurrently by one request
+      setIsProcessing(prev => ({ ...prev, summary: true, flashcards: true, mcqs: true }));
       setActiveTab('summary');
-      setIsLoading(false);
-      
-      // Now start sequential background processing
-      // First set processing state for flashcards
-      setIsProcessing(prev => ({ ...prev, flashcards: true }));
       
-      // Generate flashcards
       try {
-        const flashcardsResponse = await fetch(`${backendUrl}/api/flashcards`, {
+        const studyPackResponse = await fetch(`${backendUrl}/api/study-pack`, {
           method: 'POST',
           headers: {
             'Content-Type': 'application/json',
@@ -539,88 +576,53 @@ export default function Home() {
           body: JSON.stringify({ text: textContent }),
         });
         
-        if (!flashcardsResponse.ok) {
-          throw new Error(`Failed to generate flashcards: ${flashcardsResponse.status}`);
+        if (!studyPackResponse.ok) {
+          throw new Error(`Failed to generate study materials: ${studyPackResponse.status}`);
         }
         
-        const flashcardsData = await flashcardsResponse.json();
-        console.log("Flashcards data received:", flashcardsData);
+        const studyPack = await studyPackResponse.json();
+        console.log("Study pack received:", studyPack);
         
-        // Process flashcards data (same as in your existing function)
-        if (flashcardsData['create-flashcards']) {
-          try {
-            const parsedFlashcards = JSON.parse(flashcardsData['create-flashcards']);
-            if (Array.isArray(parsedFlashcards) && parsedFlashcards.length > 0) {
-              setFlashcards(parsedFlashcards);
-              setFlippedCards(new Array(parsedFlashcards.length).fill(false));
-            }
-          } catch (parseError) {
-            console.error('Error parsing flashcards JSON:', parseError);
-            if (Array.isArray(flashcardsData.flashcards) && flashcardsData.flashcards.length > 0) {
-              setFlashcards(flashcardsData.flashcards);
-              setFlippedCards(new Array(flashcardsData.flashcards.length).fill(false));
-            }
-          }
-        } else if (Array.isArray(flashcardsData.flashcards) && flashcardsData.flashcards.length > 0) {
-          setFlashcards(flashcardsData.flashcards);
-          setFlippedCards(new Array(flashcardsData.flashcards.length).fill(false));
+        // Parts that failed or timed out are listed in studyPack.errors, the rest are still usable
+        if (studyPack.summary) {
+          applySummaryData(studyPack);
+        } else {
+          setError('Failed to generate summary. Please try again.');
         }
-      } catch (error) {
-        console.error('Error generating flashcards:', error);
-        setFlashcards([{
-          question: "Could not generate flashcards",
-          answer: "Please try again with different text"
-        }]);
-        setFlippedCards([false]);
-      } finally {
-        // Clear flashcards processing state
-        setIsProcessing(prev => ({ ...prev, flashcards: false }));
-      }
-      
-      // Now start MCQs generation after flashcards are done
-      setIsProcessing(prev => ({ ...prev, mcqs: true }));
-      
-      try {
-        const mcqsResponse = await fetch(`${backendUrl}/api/mcqs`, {
-          method: 'POST',
-          headers: {
-            'Content-Type': 'application/json',
-          },
-          body: JSON.stringify({ text: textContent }),
-        });
         
-        if (!mcqsResponse.ok) {
-          throw new Error(`Failed to generate MCQs: ${mcqsResponse.status}`);
+        if (Array.isArray(studyPack.flashcards) && studyPack.flashcards.length > 0) {
+          setFlashcards(studyPack.flashcards);
+          setFlippedCards(new Array(studyPack.flashcards.length).fill(false));
+        } else {
+          setFlashcards([{
+            question: "Could not generate flashcards",
+            answer: "Please try again with different text"
+          }]);
+          setFlippedCards([false]);
         }
         
-        const mcqsData = await mcqsResponse.json();
-        console.log("MCQs data received:", mcqsData);
-        
-        if (Array.isArray(mcqsData.mcqs) && mcqsData.mcqs.length > 0) {
-          setMcqs(mcqsData.mcqs);
-          setSelectedOptions(new Array(mcqsData.mcqs.length).fill(-1));
-          setShowExplanations(new Array(mcqsData.mcqs.length).fill(false));
+        if (Array.isArray(studyPack.mcqs) && studyPack.mcqs.length > 0) {
+          setMcqs(studyPack.mcqs);
+          setSelectedOptions(new Array(studyPack.mcqs.length).fill(-1));
+          setShowExplanations(new Array(studyPack.mcqs.length).fill(false));
         } else {
-          throw new Error('No valid MCQs found in the response');
+          const defaultMCQ = {
+            question: "Error occurred while generating MCQs.",
+            options: [
+              { text: "Try again", isCorrect: true },
+              { text: "Check your input", isCorrect: false },
+              { text: "Verify API connection", isCorrect: false },
+              { text: "Contact support", isCorrect: false }
+            ],
+            explanation: "There was an error generating MCQs. Please try again with different text."
+          };
+          setMcqs([defaultMCQ]);
+          setSelectedOptions([0]);
+          setShowExplanations([false]);
         }
-      } catch (error) {
-        console.error('Error generating MCQs:', error);
-        const defaultMCQ = {
-          question: "Error occurred while generating MCQs.",
-          options: [
-            { text: "Try again", isCorrect: true },
-            { text: "Check your input", isCorrect: false },
-            { text: "Verify API connection", isCorrect: false },
-            { text: "Contact support", isCorrect: false }
-          ],
-          explanation: "There was an error generating MCQs. Please try again with different text."
-        };
-        setMcqs([defaultMCQ]);
-        setSelectedOptions([0]);
-        setShowExplanations([false]);
       } finally {
-        // Clear MCQs processing state
-        setIsProcessing(prev => ({ ...prev, mcqs: false }));
+        setIsProcessing(prev => ({ ...prev, summary: false, flashcards: false, mcqs: false }));
+        setIsLoading(false);
       }
       
     } catch (error) {
@@ -630,6 +632,53 @@ export default function Home() {
     }
   };
 
+  const applySummaryData = (summaryData: any) => {
+    // Handle both string and object formats
+    if (typeof summaryData.summary === 'object') {
+      if (summaryData.summary.summarize_text) {
+        setSummary(summaryData.summary.summarize_text);
+      } else {
+        setSummary(JSON.stringify(summaryData.summary));
+      }
+    } else {
+      // Clean up the summary
+      let cleanedSummary = summaryData.summary || 'No summary generated.';
+      
+      // Remove preambles like "Here is a summary of the given text in 250 words:"
+      const preambles = [
+        "Here is a summary of the given text in 250 words:",
+        "Here is a summary of the text:",
+        "Summary:",
+        "Here's a summary:",
+        "Here is a summary:"
+      ];
+      
+      // Check for and remove any preambles
+      for (const preamble of preambles) {
+        if (cleanedSummary.startsWith(preamble)) {
+          cleanedSummary = cleanedSummary.substring(preamble.length).trim();
+          break;
+        }
+      }
+      
+      // More aggressive cleaning of JSON artifacts at the end
+      // This will remove everything from the first occurrence of "final_result" or a standalone "[" character
+      const jsonArtifactIndices = [
+        cleanedSummary.indexOf('final_result'),
+        cleanedSummary.indexOf('\n['),
+        cleanedSummary.lastIndexOf('\n\n['),
+      ].filter(index => index !== -1);
+      
+      if (jsonArtifactIndices.length > 0) {
+        // Find the earliest occurrence of any JSON artifact
+        const earliestArtifactIndex = Math.min(...jsonArtifactIndices);
+        cleanedSummary = cleanedSummary.substring(0, earliestArtifactIndex).trim();
+      }
+      
+      setSummary(cleanedSummary);
+    }
+  };
+
   const generateSummary = async (textContent: string) => {
     setIsProcessing(prev => ({ ...prev, summary: true }));
     try {
@@ -646,51 +695,7 @@ export default function Home() {
       }
       
       const summaryData = await summaryResponse.json();
-      
-      // Handle both string and object formats
-      if (typeof summaryData.summary === 'object') {
-        if (summaryData.summary.summarize_text) {
-          setSummary(summaryData.summary.summarize_text);
-        } else {
-          setSummary(JSON.stringify(summaryData.summary));
-        }
-      } else {
-        // Clean up the summary
-        let cleanedSummary = summaryData.summary || 'No summary generated.';
-        
-        // Remove preambles like "Here is a summary of the given text in 250 words:"
-        const preambles = [
-          "Here is a summary of the given text in 250 words:",
-          "Here is a summary of the text:",
-          "Summary:",
-          "Here's a summary:",
-          "Here is a summary:"
-        ];
-        
-        // Check for and remove any preambles
-        for (const preamble of preambles) {
-          if (cleanedSummary.startsWith(preamble)) {
-            cleanedSummary = cleanedSummary.substring(preamble.length).trim();
-            break;
-          }
-        }
-        
-        // More aggressive cleaning of JSON artifacts at the end
-        // This will remove everything from the first occurrence of "final_result" or a standalone "[" character
-        const jsonArtifactIndices = [
-          cleanedSummary.indexOf('final_result'),
-          cleanedSummary.indexOf('\n['),
-          cleanedSummary.lastIndexOf('\n\n['),
-        ].filter(index => index !== -1);
-        
-        if (jsonArtifactIndices.length > 0) {
-          // Find the earliest occurrence of any JSON artifact
-          const earliestArtifactIndex = Math.min(...jsonArtifactIndices);
-          cleanedSummary = cleanedSummary.substring(0, earliestArtifactIndex).trim();
-        }
-        
-        setSummary(cleanedSummary);
-      }
+      applySummaryData(summaryData);
     } catch (error) {
       console.error('Error generating summary:', error);
       setError('Failed to generate summary. Please try again.');
@@ -700,48 +705,66 @@ export default function Home() {
     }
   };
 
+  // Read an NDJSON stream of flashcards or MCQs, calling onItems with the list so far
+  const streamStudyItems = async <T,>(path: string, key: string, textContent: string, onItems: (items: T[]) => void) => {
+    const response = await fetch(`${backendUrl}${path}`, {
+      method: 'POST',
+      headers: {
+        'Content-Type': 'application/json',
+      },
+      body: JSON.stringify({ text: textContent }),
+    });
+    
+    if (!response.ok || !response.body) {
+      throw new Error(`Failed to generate ${key}: ${response.status}`);
+    }
+    
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+    let items: T[] = [];
+    
+    while (true) {
+      const { done, value } = await reader.read();
+      if (done) break;
+      
+      buffer += decoder.decode(value, { stream: true });
+      const lines = buffer.split('\n');
+      buffer = lines.pop() || '';
+      
+      for (const line of lines) {
+        if (!line.trim()) continue;
+        const event = JSON.parse(line);
+        
+        if (event.type === 'done') {
+          // The final list matches the items sent so far, in index order
+          items = event[key];
+          onItems(items);
+        } else if (event.type === 'error') {
+          throw new Error(event.detail);
+        } else if (event.item) {
+          items = [...items, event.item];
+          onItems(items);
+        }
+      }
+    }
+    return items;
+  };
+
   const generateFlashcards = async (textContent: string) => {
     setIsProcessing(prev => ({ ...prev, flashcards: true }));
     try {
       setIsLoading(true);
       
-      const flashcardsResponse = await fetch(`${backendUrl}/api/flashcards`, {
-        method: 'POST',
-        headers: {
-          'Content-Type': 'application/json',
-        },
-        body: JSON.stringify({ text: textContent }),
+      // Show each flashcard as soon as the model has finished writing it
+      setFlashcards([]);
+      setFlippedCards([]);
+      const cards = await streamStudyItems<FlashCard>('/api/flashcards/stream', 'flashcards', textContent, items => {
+        setFlashcards(items);
+        setFlippedCards(prev => items.map((_, index) => prev[index] ?? false));
       });
       
-      if (!flashcardsResponse.ok) {
-        throw new Error(`Failed to generate flashcards: ${flashcardsResponse.status}`);
-      }
-      
-      const flashcardsData = await flashcardsResponse.json();
-      console.log("Flashcards data received:", flashcardsData);
-      
-      // Handle the 'create-flashcards' format from the backend
-      if (flashcardsData['create-flashcards']) {
-        try {
-          // Parse the JSON string from the response
-          const parsedFlashcards = JSON.parse(flashcardsData['create-flashcards']);
-          console.log("Parsed flashcards:", parsedFlashcards);
-          
-          if (Array.isArray(parsedFlashcards) && parsedFlashcards.length > 0) {
-            setFlashcards(parsedFlashcards);
-            setFlippedCards(new Array(parsedFlashcards.length).fill(false));
-            return; // Exit the function after setting the flashcards
-          }
-        } catch (parseError) {
-          console.error('Error parsing flashcards JSON:', parseError);
-        }
-      }
-      
-      // Fallback to the original logic if 'create-flashcards' key doesn't exist or parsing fails
-      if (Array.isArray(flashcardsData.flashcards) && flashcardsData.flashcards.length > 0) {
-        setFlashcards(flashcardsData.flashcards);
-        setFlippedCards(new Array(flashcardsData.flashcards.length).fill(false));
-      } else {
+      if (cards.length === 0) {
         throw new Error('No valid flashcards found in the response');
       }
     } catch (error) {
@@ -764,41 +787,18 @@ export default function Home() {
     try {
       setIsLoading(true);
       
-      const mcqsResponse = await fetch(`${backendUrl}/api/mcqs`, {
-        method: 'POST',
-        headers: {
-          'Content-Type': 'application/json',
-        },
-        body: JSON.stringify({ text: textContent }),
+      // Show each question as soon as the model has finished writing it
+      setMcqs([]);
+      setSelectedOptions([]);
+      setShowExplanations([]);
+      const questions = await streamStudyItems<MCQ>('/api/mcqs/stream', 'mcqs', textContent, items => {
+        setMcqs(items);
+        setSelectedOptions(prev => items.map((_, index) => prev[index] ?? -1));
+        setShowExplanations(prev => items.map((_, index) => prev[index] ?? false));
       });
       
-      if (!mcqsResponse.ok) {
-        throw new Error(`Failed to generate MCQs: ${mcqsResponse.status}`);
-      }
-      
-      const mcqsData = await mcqsResponse.json();
-      console.log("MCQs data received:", mcqsData);
-      
-      if (Array.isArray(mcqsData.mcqs) && mcqsData.mcqs.length > 0) {
-        setMcqs(mcqsData.mcqs);
-        setSelectedOptions(new Array(mcqsData.mcqs.length).fill(-1));
-        setShowExplanations(new Array(mcqsData.mcqs.length).fill(false));
-      } else {
-        console.error('Unexpected MCQs format:', mcqsData);
-        // Create a default MCQ format if the API fails
-        const defaultMCQ = {
-          question: "Could not generate proper MCQs. Please try again.",
-          options: [
-            { text: "Option A", isCorrect: false },
-            { text: "Option B", isCorrect: false },
-            { text: "Option C", isCorrect: true },
-            { text: "Option D", isCorrect: false }
-          ],
-          explanation: "This is a placeholder. Please try generating MCQs again."
-        };
-        setMcqs([defaultMCQ]);
-        setSelectedOptions([0]);
-        setShowExplanations([false]);
+      if (questions.length === 0) {
+        throw new Error('No valid MCQs found in the response');
       }
     } catch (error) {
       console.error('Error generating MCQs:', error);
@@ -885,6 +885,7 @@ export default function Home() {
     
     setIsLoading(true);
     setError(null);
+    let botMessageAdded = false;
     
     try {
       // Create a chat history to send to the backend
@@ -893,48 +894,93 @@ export default function Home() {
         content: msg.text
       }));
       
-      const chatResponse = await fetch(`${backendUrl}/api/chat`, {
+      // The server keeps the history, so each turn only sends the new message.
+      // A new (or expired) session is seeded with the history we have locally
+      const createChatSession = async () => {
+        const sessionResponse = await fetch(`${backendUrl}/api/chat/sessions`, {
+          method: 'POST',
+          headers: {
+            'Content-Type': 'application/json',
+          },
+          body: JSON.stringify({ chatHistory, documentId: pdfDocumentId }),
+        });
+        if (!sessionResponse.ok) {
+          throw new Error(`Failed to start chat session: ${sessionResponse.status}`);
+        }
+        const { sessionId } = await sessionResponse.json();
+        setChatSessionId(sessionId);
+        return sessionId as string;
+      };
+      
+      // Stream the answer so it shows up token by token
+      const sendMessage = (sessionId: string) => fetch(`${backendUrl}/api/chat/stream`, {
         method: 'POST',
         headers: {
           'Content-Type': 'application/json',
         },
         body: JSON.stringify({ 
           message: messageText,
-          context: null, // No need for summary context now
-          chatHistory: chatHistory // Send the chat history
+          sessionId
         }),
       });
       
-      if (!chatResponse.ok) {
+      let chatResponse = await sendMessage(chatSessionId ?? await createChatSession());
+      if (chatResponse.status === 404) {
+        chatResponse = await sendMessage(await createChatSession());
+      }
+      
+      if (!chatResponse.ok || !chatResponse.body) {
         throw new Error(`Failed to get chat response: ${chatResponse.status}`);
       }
       
-      const chatData = await chatResponse.json();
+      // Add an empty assistant message and fill it in as tokens arrive
+      const setBotText = (text: string) => {
+        setChatMessages(prev => [...prev.slice(0, -1), { text, isUser: false }]);
+      };
+      setChatMessages(prev => [...prev, { text: '', isUser: false }]);
+      botMessageAdded = true;
       
-      // Extract the actual text from the response
+      // Read server-sent events, separated by blank lines
+      const reader = chatResponse.body.getReader();
+      const decoder = new TextDecoder();
+      let buffer = '';
       let responseText = '';
       
-      if (typeof chatData.response === 'string') {
-        responseText = chatData.response;
-      } else if (typeof chatData.response === 'object') {
-        // If response is already an object
-        if (chatData.response["chat-response"]) {
-          responseText = chatData.response["chat-response"];
-        } else {
-          responseText = JSON.stringify(chatData.response);
+      while (true) {
+        const { done, value } = await reader.read();
+        if (done) break;
+        
+        buffer += decoder.decode(value, { stream: true });
+        const frames = buffer.split('\n\n');
+        buffer = frames.pop() || '';
+        
+        for (const frame of frames) {
+          const data = frame.split('\n').find(line => line.startsWith('data: '));
+          if (!data) continue;
+          const event = JSON.parse(data.slice('data: '.length));
+          
+          if (event.type === 'token') {
+            responseText += event.text;
+            setBotText(responseText);
+          } else if (event.type === 'reset') {
+            responseText = '';
+            setBotText(responseText);
+          } else if (event.type === 'done') {
+            // The final response is authoritative, the token events may miss its start
+            responseText = event.response || responseText || 'No response received.';
+            setBotText(responseText);
+          } else if (event.type === 'error') {
+            throw new Error(event.detail);
+          }
         }
-      } else {
-        responseText = 'No response received.';
       }
-      
-      const botMessage = { text: responseText, isUser: false };
-      setChatMessages(prev => [...prev, botMessage]);
     } catch (error) {
       console.error('Error in chat:', error);
-      setChatMessages(prev => [...prev, { 
+      const errorMessage = { 
         text: 'Sorry, I encountered an error. Please try again.',
         isUser: false 
-      }]);
+      };
+      setChatMessages(prev => botMessageAdded ? [...prev.slice(0, -1), errorMessage] : [...prev, errorMessage]);
       setError('Failed to get chat response. Please try again.');
     } finally {
       setIsLoading(false);
@@ -1057,6 +1103,7 @@ export default function Home() {
                       setFile(null);
                       setHasExtracted(false);
                       setPdfPages(0);
+                      setPdfDocumentId(null);
                       setPdfPageImages([]);
                       setShowPdfPageSelector(false);
                       if (fileInputRef.current) {